@@ -0,0 +1,384 @@
+"""
+Parallel chunked batch processing of video files.
+
+The input is split at keyframes into K chunks that are processed in a process
+pool, each with its own decoder, model and encoder (a ThreadedPipeline limited
+to one segment). Chunks start decoding ``overlap`` seconds early so the tracker
+is warmed up at the boundary; those preroll frames are not encoded, but their
+metadata is written marked ``overlap``. Finally the MP4 parts are concatenated
+without re-encoding and the per-chunk metadata is merged with global frame
+numbers, matching each chunk's track ids to the previous chunk's by box IoU on
+the overlap frames so tracks keep their id across chunk boundaries.
+
+Workers only write their batch outputs: ``--metadata-file`` is written from
+the merged metadata afterwards and UDP metadata is not sent. With
+``--skip-frames`` the sampling restarts at every chunk boundary.
+"""
+
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Dict, Any
+
+from ..modules.metabus import encode_json_text
+from ..outputs.columnar import ColumnarDetectionWriter
+from ..outputs.metadata_stream import StreamingMetadataWriter, iter_metadata_frames, read_video_info, metadata_filename
+
+logger = logging.getLogger("SRTYOLOUnified.Chunked")
+
+# Track ids of chunk i that continue no track of chunk i-1 are offset by i * TRACK_ID_STRIDE
+TRACK_ID_STRIDE = 1_000_000
+
+# Minimum box IoU for a detection on an overlap frame to count as the same object
+MATCH_IOU = 0.5
+
+# Live metadata sinks a worker must not write: K workers would interleave chunk-local
+# frames in one --metadata-file and send UDP consumers frames out of order
+LIVE_SINKS = ('metadata_file', 'metadata_host', 'metadata_targets')
+
+
+def worker_kwargs(pipeline_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Pipeline settings for a chunk or part worker: batch outputs only."""
+    kwargs = dict(pipeline_kwargs)
+    for key in LIVE_SINKS:
+        kwargs[key] = None
+    return kwargs
+
+
+def write_metadata_log(metadata_path: str, log_path: str, mode: str = 'w'):
+    """Write the frames of a merged metadata file as --metadata-file lines (one JSON object each)."""
+    with open(log_path, mode) as f:
+        for frame in iter_metadata_frames(metadata_path):
+            f.write(encode_json_text(frame) + "\n")
+
+
+def probe_keyframes(path: str) -> Tuple[List[float], float]:
+    """Return (keyframe times in seconds, duration in seconds) by demuxing without decoding."""
+    import av
+
+    keyframes = []
+    last_time = 0.0
+    with av.open(path) as container:
+        video_stream = next((s for s in container.streams if s.type == 'video'), None)
+        if video_stream is None:
+            raise RuntimeError("No video stream found")
+        for packet in container.demux(video_stream):
+            if packet.pts is None:
+                continue
+            t = float(packet.pts * packet.time_base)
+            last_time = max(last_time, t)
+            if packet.is_keyframe:
+                keyframes.append(t)
+        duration = container.duration / av.time_base if container.duration else last_time
+    return sorted(keyframes), duration
+
+
+def plan_chunks(keyframes: List[float], duration: float, count: int) -> List[Tuple[Optional[float], Optional[float]]]:
+    """
+    Split [0, duration) into up to ``count`` chunks whose boundaries fall on keyframes.
+
+    The first chunk has no start (decode from the beginning) and the last no end.
+    """
+    if count <= 1 or len(keyframes) < 2:
+        return [(None, None)]
+
+    boundaries = []
+    for i in range(1, count):
+        target = duration * i / count
+        candidate = next((k for k in keyframes if k >= target), None)
+        if candidate is not None and candidate > keyframes[0] and candidate not in boundaries:
+            boundaries.append(candidate)
+
+    starts = [None] + boundaries
+    ends = boundaries + [None]
+    return list(zip(starts, ends))
+
+
+def _run_chunk(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Process one chunk in a worker process (top-level so it can be pickled)."""
+    logging.basicConfig(level=job.get('log_level', logging.INFO),
+                        format=f"%(asctime)s - %(levelname)s - [chunk {job['index']}] %(message)s")
+    from .pipeline import ThreadedPipeline
+
+    t0 = time.time()
+    kwargs = worker_kwargs(job['pipeline_kwargs'])
+    kwargs['batch_output'] = job['chunk_dir']
+    kwargs['segment'] = (job['start'], job['end'], job['overlap'])
+    # Columnar tables are built once from the merged metadata
+    kwargs['batch_columnar'] = False
+    pipeline = ThreadedPipeline(**kwargs)
+    pipeline.run()
+    verify_part(pipeline, kwargs['input_srt'], job['chunk_dir'], kwargs)
+    return {
+        'index': job['index'],
+        'chunk_dir': job['chunk_dir'],
+        'elapsed': time.time() - t0,
+    }
+
+
+def part_outputs(input_path: str, part_dir: str, pipeline_kwargs: Dict[str, Any]) -> List[str]:
+    """Files BatchVideoWriter writes into ``part_dir`` for one segment of ``input_path``."""
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    outputs = [os.path.join(part_dir, metadata_filename(base_name,
+                                                        pipeline_kwargs.get('batch_metadata_format', 'json'),
+                                                        pipeline_kwargs.get('batch_metadata_compression', 'none')))]
+    if not pipeline_kwargs.get('analytics_only'):
+        outputs.insert(0, os.path.join(part_dir, f"{base_name}.mp4"))
+    return outputs
+
+
+def verify_part(pipeline, input_path: str, part_dir: str, pipeline_kwargs: Dict[str, Any]):
+    """
+    Raise RuntimeError unless the pipeline that produced ``part_dir`` finished.
+
+    ThreadedPipeline.run() does not raise when capture, the writer or the
+    output thread fails, so completion is checked explicitly: the end of
+    stream went through every stage, no stage reported an error, and every
+    output file exists and is non-empty.
+    """
+    if pipeline.error:
+        raise RuntimeError(f"{part_dir} failed: {pipeline.error}")
+    if not pipeline.drained.is_set():
+        raise RuntimeError(f"{part_dir} did not reach end of stream")
+    for path in part_outputs(input_path, part_dir, pipeline_kwargs):
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            raise RuntimeError(f"{part_dir} is missing output {os.path.basename(path)}")
+
+
+def concat_videos(parts: List[str], output_path: str):
+    """Concatenate MP4 parts without re-encoding (ffmpeg concat demuxer, stream copy)."""
+    list_path = f"{output_path}.parts.txt"
+    with open(list_path, 'w') as f:
+        for part in parts:
+            f.write(f"file '{os.path.abspath(part)}'\n")
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-c', 'copy', '-movflags', '+faststart',
+        output_path
+    ]
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        os.remove(list_path)
+
+
+def _pts_key(frame: Dict[str, Any]) -> Optional[int]:
+    pts = frame.get('pts')
+    return None if pts is None else int(round(pts * 1000))
+
+
+def _box_iou(a, b) -> float:
+    ix = min(a[2], b[2]) - max(a[0], b[0])
+    iy = min(a[3], b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _leading_overlap_frames(part: str) -> List[Dict[str, Any]]:
+    """The warm-up frames a chunk wrote before its own first frame."""
+    frames = []
+    for frame in iter_metadata_frames(part):
+        if not frame.get('overlap'):
+            break
+        frames.append(frame)
+    return frames
+
+
+def match_tracks(previous: Dict[int, List[Tuple[int, int, List[float]]]],
+                 overlap_frames: List[Dict[str, Any]]) -> Dict[int, int]:
+    """
+    Map a chunk's track ids to the previous chunk's (merged) ids.
+
+    ``previous`` holds the previous chunk's detections on the shared frames as
+    {pts key: [(merged track id, class id, bbox)]}. Every same-class pair with
+    IoU >= MATCH_IOU on a shared frame votes; pairs are then taken greedily by
+    total IoU, one to one, and kept when they matched on at least half of the
+    frames where the new track appears.
+    """
+    scores: Dict[Tuple[int, int], float] = {}
+    votes: Dict[Tuple[int, int], int] = {}
+    seen: Dict[int, int] = {}
+    for frame in overlap_frames:
+        candidates = previous.get(_pts_key(frame))
+        if candidates is None:
+            continue
+        for det in frame.get('detections', []):
+            track_id = det.get('track_id')
+            if track_id is None:
+                continue
+            seen[track_id] = seen.get(track_id, 0) + 1
+            best, best_iou = None, MATCH_IOU
+            for prev_id, class_id, bbox in candidates:
+                if class_id != det.get('class_id'):
+                    continue
+                iou = _box_iou(det['bbox'], bbox)
+                if iou >= best_iou:
+                    best, best_iou = prev_id, iou
+            if best is not None:
+                pair = (track_id, best)
+                scores[pair] = scores.get(pair, 0.0) + best_iou
+                votes[pair] = votes.get(pair, 0) + 1
+
+    mapping: Dict[int, int] = {}
+    taken = set()
+    for (track_id, prev_id), _ in sorted(scores.items(), key=lambda item: -item[1]):
+        if track_id in mapping or prev_id in taken:
+            continue
+        if votes[(track_id, prev_id)] * 2 >= seen[track_id]:
+            mapping[track_id] = prev_id
+            taken.add(prev_id)
+    return mapping
+
+
+def merge_metadata(parts: List[str], output_path: str, video_info: Dict[str, Any],
+                   fmt: str = 'json', compression: str = 'none', columnar=None) -> int:
+    """
+    Merge per-chunk metadata files into one with global frame numbers.
+
+    Frames are streamed through a StreamingMetadataWriter one chunk at a time
+    (and into ``columnar``, a ColumnarDetectionWriter, when given). A chunk
+    numbers its frames from 1 and records how many frames it decoded in its
+    footer, so frame numbers are offset by the frames decoded in earlier
+    chunks and match a single run (skipped frames leave the same gaps).
+    Overlap (warm-up) frames are not written: they are only used to match
+    each chunk's track ids to the previous chunk's. Track ids with no match
+    are offset per chunk to stay unique.
+    """
+    writer = StreamingMetadataWriter(output_path, video_info, fmt=fmt, compression=compression)
+    frame_offset = 0
+    stitched = 0
+    mapping: Dict[int, int] = {}
+    next_overlap = _leading_overlap_frames(parts[0]) if parts else []
+    for index, part in enumerate(parts):
+        track_offset = index * TRACK_ID_STRIDE
+        if index:
+            mapping = match_tracks(shared, next_overlap)
+            stitched += len(mapping)
+        # Frames of this chunk that the next chunk also decoded (as its warm-up)
+        next_overlap = _leading_overlap_frames(parts[index + 1]) if index + 1 < len(parts) else []
+        shared_keys = {_pts_key(f) for f in next_overlap} - {None}
+        shared: Dict[int, List[Tuple[int, int, List[float]]]] = {}
+
+        footer: Dict[str, Any] = {}
+        last_frame = 0
+        for frame in iter_metadata_frames(part, footer):
+            if frame.get('overlap'):
+                continue
+            last_frame = frame['frame']
+            frame['frame'] = frame_offset + last_frame
+            for det in frame.get('detections', []):
+                track_id = det.get('track_id')
+                if track_id is not None:
+                    det['track_id'] = mapping.get(track_id, track_id + track_offset)
+            key = _pts_key(frame)
+            if key in shared_keys:
+                shared[key] = [(det['track_id'], det.get('class_id'), det['bbox'])
+                               for det in frame.get('detections', []) if det.get('track_id') is not None]
+            writer.write_frame(frame)
+            if columnar:
+                columnar.add_frame(frame)
+        frame_offset += footer.get('decoded_frames', last_frame)
+    if columnar:
+        columnar.close()
+    if len(parts) > 1:
+        logger.info(f"Merged {len(parts)} chunks: {stitched} tracks continued across chunk boundaries")
+    return writer.close({'chunks': len(parts), 'tracks_stitched': stitched})
+
+
+def assemble_parts(input_path: str, output_dir: str, part_dirs: List[str], pipeline_kwargs: Dict[str, Any]) -> int:
+    """
+    Join batch outputs of consecutive parts of one input into the final outputs.
+
+    Each part directory holds what BatchVideoWriter wrote for one segment.
+    Returns the total number of frames.
+    """
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    fmt = pipeline_kwargs.get('batch_metadata_format', 'json')
+    compression = pipeline_kwargs.get('batch_metadata_compression', 'none')
+    metadata_name = metadata_filename(base_name, fmt, compression)
+    video_parts = [os.path.join(d, f"{base_name}.mp4") for d in part_dirs]
+    metadata_parts = [os.path.join(d, metadata_name) for d in part_dirs]
+
+    video_path = os.path.join(output_dir, f"{base_name}.mp4")
+    json_path = os.path.join(output_dir, metadata_name)
+    analytics_only = pipeline_kwargs.get('analytics_only', False)
+    if not analytics_only:
+        concat_videos(video_parts, video_path)
+
+    video_info = read_video_info(metadata_parts[0])
+    video_info['input_file'] = input_path
+    video_info['output_file'] = None if analytics_only else f"{base_name}.mp4"
+    video_info['chunks'] = len(part_dirs)
+    columnar = None
+    if pipeline_kwargs.get('batch_columnar'):
+        columnar = ColumnarDetectionWriter(output_dir, base_name)
+    total_frames = merge_metadata(metadata_parts, json_path, video_info, fmt=fmt, compression=compression,
+                                  columnar=columnar)
+    if not analytics_only:
+        logger.info(f"Video saved: {video_path} ({total_frames} frames)")
+    logger.info(f"Metadata saved: {json_path}")
+    return total_frames
+
+
+class ChunkedBatchRunner:
+    """Run --batch-output over K keyframe-aligned chunks in a process pool."""
+
+    def __init__(self, input_path: str, output_dir: str, workers: int, overlap_seconds: float,
+                 pipeline_kwargs: Dict[str, Any]):
+        self.input_path = input_path
+        self.output_dir = output_dir
+        self.workers = workers
+        self.overlap_seconds = overlap_seconds
+        self.pipeline_kwargs = pipeline_kwargs
+
+    def run(self):
+        t0 = time.time()
+        base_name = os.path.splitext(os.path.basename(self.input_path))[0]
+        work_dir = os.path.join(self.output_dir, f".chunks_{base_name}")
+        os.makedirs(work_dir, exist_ok=True)
+
+        keyframes, duration = probe_keyframes(self.input_path)
+        chunks = plan_chunks(keyframes, duration, self.workers)
+        logger.info(f"Splitting {self.input_path} ({duration:.1f}s, {len(keyframes)} keyframes) "
+                    f"into {len(chunks)} chunks with {self.overlap_seconds}s overlap")
+
+        jobs = []
+        for index, (start, end) in enumerate(chunks):
+            jobs.append({
+                'index': index,
+                'start': start,
+                'end': end,
+                'overlap': self.overlap_seconds,
+                'chunk_dir': os.path.join(work_dir, f"chunk{index:03d}"),
+                'pipeline_kwargs': self.pipeline_kwargs,
+                'log_level': logging.getLogger().level,
+            })
+
+        # spawn: each worker initializes its own CUDA context and decoder
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=len(jobs), mp_context=context) as pool:
+            results = sorted(pool.map(_run_chunk, jobs), key=lambda r: r['index'])
+        for result in results:
+            logger.info(f"Chunk {result['index']} done in {result['elapsed']:.1f}s")
+
+        total_frames = assemble_parts(self.input_path, self.output_dir,
+                                      [r['chunk_dir'] for r in results], self.pipeline_kwargs)
+        metadata_file = self.pipeline_kwargs.get('metadata_file')
+        if metadata_file:
+            write_metadata_log(os.path.join(self.output_dir, metadata_filename(
+                base_name, self.pipeline_kwargs.get('batch_metadata_format', 'json'),
+                self.pipeline_kwargs.get('batch_metadata_compression', 'none'))), metadata_file)
+            logger.info(f"Metadata log written: {metadata_file}")
+
+        shutil.rmtree(work_dir, ignore_errors=True)
+        elapsed = time.time() - t0
+        logger.info(f"Chunked batch processing complete! Total time: {elapsed:.2f}s "
+                    f"({total_frames / elapsed:.1f} fps with {len(chunks)} workers)")
@@ -0,0 +1,295 @@
+"""
+Batch job queue over many input videos.
+
+Inputs come from a directory, a glob pattern or a manifest (text file with one
+path per line, or a JSON list). Files are scheduled over a bounded pool of
+worker processes; each worker loads its YOLO model once and reuses it for every
+file it processes. Processes, not threads: the tracker's id counter is global
+to a process and reset whenever a part starts, so parts running concurrently
+in one process would hand out colliding track ids.
+
+Each file is processed as consecutive keyframe-aligned parts of roughly
+``checkpoint_frames`` frames. After every part that finished cleanly a
+checkpoint is written, so a crashed job resumes at the first unfinished part
+instead of from scratch. The tracker restarts in every part (warmed up on the
+preceding overlap seconds); track ids are carried across parts by IoU
+matching when the parts are merged, as for parallel chunks. Files
+whose outputs already exist with a matching config hash are skipped. A
+throughput summary is written to ``batch_summary.json`` at the end, and
+``--metadata-file`` is written from the merged metadata of every file (parts
+do not write it or send UDP metadata themselves).
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Tuple
+
+from .chunked import probe_keyframes, assemble_parts, verify_part, worker_kwargs, write_metadata_log
+from ..outputs.metadata_stream import metadata_filename
+
+logger = logging.getLogger("SRTYOLOUnified.Jobs")
+
+VIDEO_EXTENSIONS = ('.ts', '.mp4', '.mkv', '.mov', '.avi', '.m2ts', '.mts')
+
+# Pipeline settings that change the produced outputs (and therefore the config hash)
+_HASHED_SETTINGS = (
+    'model_path', 'conf_threshold', 'classes', 'show_overlay', 'skip_frames',
+    'encoder_profile', 'batch_encoder', 'batch_metadata_format', 'batch_metadata_compression', 'batch_columnar',
+    'analytics_only', 'decode_skip', 'infer_size',
+)
+
+
+def discover_inputs(spec: str) -> List[str]:
+    """Expand a directory, glob pattern or manifest file into a sorted list of video paths."""
+    if os.path.isdir(spec):
+        paths = [os.path.join(spec, name) for name in os.listdir(spec)
+                 if name.lower().endswith(VIDEO_EXTENSIONS)]
+    elif os.path.isfile(spec) and spec.lower().endswith(('.txt', '.json', '.lst')):
+        base_dir = os.path.dirname(os.path.abspath(spec))
+        with open(spec, 'r') as f:
+            if spec.lower().endswith('.json'):
+                entries = json.load(f)
+            else:
+                entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        paths = [p if os.path.isabs(p) else os.path.join(base_dir, p) for p in entries]
+    else:
+        paths = glob.glob(spec, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def config_hash(input_path: str, pipeline_kwargs: Dict[str, Any], checkpoint_frames: int) -> str:
+    """Hash of the input file identity and every setting that affects the outputs."""
+    stat = os.stat(input_path)
+    payload = {
+        'input': os.path.abspath(input_path),
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime),
+        'checkpoint_frames': checkpoint_frames,
+        'settings': {k: pipeline_kwargs.get(k) for k in _HASHED_SETTINGS},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def plan_parts(keyframes: List[float], duration: float, fps: float,
+               frames_per_part: int) -> List[Tuple[Optional[float], Optional[float]]]:
+    """Consecutive keyframe-aligned parts of about ``frames_per_part`` frames each."""
+    if frames_per_part <= 0 or len(keyframes) < 2:
+        return [(None, None)]
+    step = frames_per_part / fps
+    boundaries = []
+    target = step
+    for k in keyframes:
+        if k >= target and k > keyframes[0] and k < duration:
+            boundaries.append(k)
+            target = k + step
+    return list(zip([None] + boundaries, boundaries + [None]))
+
+
+def _probe_fps(path: str) -> float:
+    import av
+    with av.open(path) as container:
+        stream = next(s for s in container.streams if s.type == 'video')
+        return float(stream.average_rate) if stream.average_rate else 30.0
+
+
+# Model of this worker process, loaded by its first job and reused for every later one
+_worker_model = None
+
+
+def _init_worker(log_level: int):
+    logging.basicConfig(level=log_level, format="%(asctime)s - %(levelname)s - [%(processName)s] %(message)s")
+
+
+def _run_job(runner: "BatchJobRunner", input_path: str) -> Dict[str, Any]:
+    """Process one file in a worker process (top-level so it can be pickled)."""
+    global _worker_model
+    try:
+        if _worker_model is None:
+            _worker_model = runner._load_model()
+        return runner._process_file(input_path, _worker_model)
+    except Exception as e:
+        logger.error(f"Batch job failed for {input_path}: {e}")
+        return {'input': input_path, 'status': 'failed', 'error': str(e)}
+
+
+class BatchJobRunner:
+    """Process many videos over a bounded worker pool with skip/resume support."""
+
+    def __init__(self, inputs: List[str], output_dir: str, pipeline_kwargs: Dict[str, Any],
+                 workers: int = 1, checkpoint_frames: int = 3000, overlap_seconds: float = 2.0):
+        self.inputs = inputs
+        self.output_dir = output_dir
+        self.pipeline_kwargs = pipeline_kwargs
+        self.workers = max(1, workers)
+        self.checkpoint_frames = checkpoint_frames
+        self.overlap_seconds = overlap_seconds
+        self.results: List[Dict[str, Any]] = []
+
+    # -------------------------------------------------------------- bookkeeping
+
+    def _base_name(self, input_path: str) -> str:
+        return os.path.splitext(os.path.basename(input_path))[0]
+
+    def _done_path(self, input_path: str) -> str:
+        return os.path.join(self.output_dir, f"{self._base_name(input_path)}.done.json")
+
+    def _work_dir(self, input_path: str) -> str:
+        return os.path.join(self.output_dir, f".job_{self._base_name(input_path)}")
+
+    def _is_complete(self, input_path: str, digest: str) -> bool:
+        try:
+            with open(self._done_path(input_path), 'r') as f:
+                done = json.load(f)
+        except (OSError, ValueError):
+            return False
+        outputs = [os.path.join(self.output_dir, name) for name in done.get('outputs', [])]
+        return done.get('config_hash') == digest and all(os.path.exists(p) for p in outputs)
+
+    def _write_json(self, path: str, data: Dict[str, Any]):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+    def _load_checkpoint(self, work_dir: str, digest: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(work_dir, 'checkpoint.json'), 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get('config_hash') != digest:
+            logger.info(f"Discarding stale checkpoint in {work_dir} (config changed)")
+            return None
+        return checkpoint
+
+    # -------------------------------------------------------------- processing
+
+    def _load_model(self):
+        from ultralytics import YOLO
+        return YOLO(self.pipeline_kwargs['model_path'])
+
+    def _process_file(self, input_path: str, model) -> Dict[str, Any]:
+        from .pipeline import ThreadedPipeline
+
+        base_name = self._base_name(input_path)
+        digest = config_hash(input_path, self.pipeline_kwargs, self.checkpoint_frames)
+        if self._is_complete(input_path, digest):
+            logger.info(f"Skipping {input_path}: outputs exist with matching config {digest}")
+            return {'input': input_path, 'status': 'skipped', 'config_hash': digest}
+
+        t0 = time.time()
+        work_dir = self._work_dir(input_path)
+        os.makedirs(work_dir, exist_ok=True)
+        checkpoint = self._load_checkpoint(work_dir, digest)
+        if checkpoint is None:
+            keyframes, duration = probe_keyframes(input_path)
+            parts = plan_parts(keyframes, duration, _probe_fps(input_path), self.checkpoint_frames)
+            checkpoint = {'config_hash': digest, 'parts': parts, 'completed': []}
+            self._write_json(os.path.join(work_dir, 'checkpoint.json'), checkpoint)
+        else:
+            logger.info(f"Resuming {input_path}: {len(checkpoint['completed'])}/{len(checkpoint['parts'])} parts done")
+
+        part_dirs = []
+        for index, (start, end) in enumerate(checkpoint['parts']):
+            part_dir = os.path.join(work_dir, f"part{index:04d}")
+            part_dirs.append(part_dir)
+            if index in checkpoint['completed']:
+                continue
+            shutil.rmtree(part_dir, ignore_errors=True)
+            kwargs = worker_kwargs(self.pipeline_kwargs)
+            kwargs.update(input_srt=input_path, batch_output=part_dir, batch_columnar=False,
+                          segment=(start, end, self.overlap_seconds), model=model)
+            pipeline = ThreadedPipeline(**kwargs)
+            pipeline.run()
+            # Raises (leaving the part out of the checkpoint) unless the part really finished
+            verify_part(pipeline, input_path, part_dir, self.pipeline_kwargs)
+            checkpoint['completed'].append(index)
+            self._write_json(os.path.join(work_dir, 'checkpoint.json'), checkpoint)
+            logger.info(f"{base_name}: checkpoint {index + 1}/{len(checkpoint['parts'])}")
+
+        frames = assemble_parts(input_path, self.output_dir, part_dirs, self.pipeline_kwargs)
+        outputs = [metadata_filename(
+            base_name,
+            self.pipeline_kwargs.get('batch_metadata_format', 'json'),
+            self.pipeline_kwargs.get('batch_metadata_compression', 'none'))]
+        if not self.pipeline_kwargs.get('analytics_only'):
+            outputs.insert(0, f"{base_name}.mp4")
+        elapsed = time.time() - t0
+        result = {
+            'input': input_path,
+            'status': 'done',
+            'config_hash': digest,
+            'frames': frames,
+            'elapsed_s': round(elapsed, 2),
+            'fps': round(frames / elapsed, 2) if elapsed > 0 else None,
+            'parts': len(checkpoint['parts']),
+            'outputs': outputs,
+        }
+        self._write_json(self._done_path(input_path), result)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return result
+
+    def _write_metadata_log(self, results: List[Dict[str, Any]]):
+        """--metadata-file: the merged frames of every finished file, in input order."""
+        log_path = self.pipeline_kwargs.get('metadata_file')
+        if not log_path:
+            return
+        mode = 'w'
+        for result in results:
+            if result['status'] not in ('done', 'skipped'):
+                continue
+            metadata_path = os.path.join(self.output_dir, metadata_filename(
+                self._base_name(result['input']),
+                self.pipeline_kwargs.get('batch_metadata_format', 'json'),
+                self.pipeline_kwargs.get('batch_metadata_compression', 'none')))
+            write_metadata_log(metadata_path, log_path, mode)
+            mode = 'a'
+        logger.info(f"Metadata log written: {log_path}")
+
+    def run(self) -> Dict[str, Any]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        t0 = time.time()
+        workers = min(self.workers, len(self.inputs)) or 1
+        logger.info(f"Batch job queue: {len(self.inputs)} files over {workers} workers "
+                    f"(checkpoint every {self.checkpoint_frames} frames)")
+
+        # spawn: each worker initializes its own CUDA context, model and tracker id counter
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(logging.getLogger().level,)) as pool:
+            futures = {pool.submit(_run_job, self, path): path for path in self.inputs}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died (the job's own errors are caught in _run_job)
+                    logger.error(f"Batch job failed for {futures[future]}: {e}")
+                    result = {'input': futures[future], 'status': 'failed', 'error': str(e) or type(e).__name__}
+                self.results.append(result)
+
+        elapsed = time.time() - t0
+        done = [r for r in self.results if r['status'] == 'done']
+        total_frames = sum(r.get('frames', 0) for r in done)
+        summary = {
+            'files': len(self.inputs),
+            'done': len(done),
+            'skipped': sum(1 for r in self.results if r['status'] == 'skipped'),
+            'failed': sum(1 for r in self.results if r['status'] == 'failed'),
+            'frames': total_frames,
+            'elapsed_s': round(elapsed, 2),
+            'fps': round(total_frames / elapsed, 2) if elapsed > 0 else None,
+            'per_file': sorted(self.results, key=lambda r: r['input']),
+        }
+        self._write_metadata_log(summary['per_file'])
+        summary_path = os.path.join(self.output_dir, 'batch_summary.json')
+        self._write_json(summary_path, summary)
+        logger.info(f"Batch queue complete: {summary['done']} done, {summary['skipped']} skipped, "
+                    f"{summary['failed']} failed, {total_frames} frames in {elapsed:.1f}s → {summary_path}")
+        return summary
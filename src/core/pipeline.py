@@ -8,28 +8,47 @@ import numpy as np
 from datetime import datetime
 from collections import deque
 from ultralytics import YOLO
-from typing import Optional
+from typing import Optional, List
 
 from ..modules.klv import KLVDecoder
 from ..modules.geo import calculate_object_coordinates
 from ..modules.drawing import draw_detections_vectorized, overlay_metadata
+from ..modules.encoder import resolve_encoder_profile
+from ..modules.detcache import cache_key, open_detection_cache
+from ..modules.delta import DeltaEncoder
+from ..modules.metabus import MetadataBus
+from ..modules.binmeta import encode_binary
+from ..modules.udp import UDPMetadataPublisher, parse_target, DEFAULT_MTU, FORMAT_JSON, FORMAT_BINARY
 from ..outputs.rtsp import BasicRTSPWriter, ID3RTSPWriter, _try_import_gi
 from src.outputs.hls import HLSWriter
+from src.outputs.llhls import LLHLSWriter, LLHLS_AVAILABLE
 from src.outputs.webrtc import WebRTCWriter, WEBRTC_AVAILABLE
 from src.outputs.mjpeg import MJPEGWriter, MJPEG_AVAILABLE
 from src.outputs.batch import BatchVideoWriter
+from src.outputs.file import FileLogger
+from src.outputs.shm import SharedMemoryWriter
 
 logger = logging.getLogger("SRTYOLOUnified.Pipeline")
 
+TRACKER_CONFIG = "bytetrack.yaml"
+
+# --decode-skip → AVCodecContext.skip_frame: let the decoder drop frames that won't be inferred
+DECODE_SKIP = {'none': 'DEFAULT', 'nonref': 'NONREF', 'nonkey': 'NONKEY'}
+
+# End-of-stream sentinel passed capture → inference → output so every queued frame is drained
+_EOS = object()
+
 class FrameData:
     def __init__(self, frame, timestamp, klv_data, frame_count):
         self.frame = frame
         self.timestamp = timestamp
         self.klv_data = klv_data
         self.frame_count = frame_count
+        self.pts_ms = None  # Stream pts in milliseconds (detection cache key)
         self.detections = []
         self.metadata = {}
         self.annotated_frame = None
+        self.emit = True  # False for tracker warm-up frames that must not reach outputs
         self.timings = {
             'capture_start': time.time(),
             'inference_ms': 0,
@@ -48,7 +67,30 @@ class ThreadedPipeline:
                  tak_sender=None, mode='auto', output_format='rtsp',
                  output_webrtc: Optional[int] = None,
                  output_mjpeg: Optional[int] = None,
-                 batch_output: Optional[str] = None):
+                 batch_output: Optional[str] = None,
+                 encoder_profile: Optional[str] = None,
+                 hls_port: int = 8090, hls_persist: bool = False,
+                 segment: Optional[tuple] = None,
+                 batch_metadata_format: str = 'json',
+                 batch_metadata_compression: str = 'none',
+                 batch_columnar: bool = False,
+                 model=None,
+                 batch_encoder: str = 'ffmpeg',
+                 detection_cache: Optional[str] = None,
+                 analytics_only: bool = False,
+                 decode_skip: str = 'none',
+                 infer_size: int = 640,
+                 metadata_delta: bool = False,
+                 webrtc_encode_once: bool = False,
+                 metadata_udp_format: str = 'json',
+                 metadata_targets: Optional[List[str]] = None,
+                 metadata_mtu: int = DEFAULT_MTU,
+                 metadata_ttl: int = 1,
+                 metadata_udp_raw: bool = False,
+                 metadata_host_framed: bool = False,
+                 output_shm: Optional[str] = None,
+                 shm_slots: int = 4,
+                 shm_metadata_format: str = 'binary'):
         
         self.input_srt = input_srt
         self.output_rtsp = output_rtsp
@@ -72,17 +114,56 @@ class ThreadedPipeline:
         self.mode = mode
         self.output_webrtc = output_webrtc
         self.output_mjpeg = output_mjpeg
+        self.output_shm = output_shm
+        self.shm_slots = shm_slots
+        self.shm_metadata_format = shm_metadata_format
+        self.webrtc_encode_once = webrtc_encode_once
         self.batch_output = batch_output
+        self.encoder_profile = encoder_profile
+        self.hls_port = hls_port
+        self.hls_persist = hls_persist
+        # (start_s, end_s, preroll_s) when processing one chunk of a file; None = whole input
+        self.segment = segment
+        self.batch_metadata_format = batch_metadata_format
+        self.batch_metadata_compression = batch_metadata_compression
+        self.batch_columnar = batch_columnar
+        self.batch_encoder = batch_encoder
+        # Directory of the persistent detection cache (batch mode only); None disables it
+        self.detection_cache = detection_cache
+        self.cache_reader = None
+        self.cache_writer = None
+        # Analytics-only: detections/geo only, frames are decoded straight to an
+        # inference-sized BGR view and never drawn or encoded
+        self.analytics_only = analytics_only
+        self.decode_skip = decode_skip
+        self.infer_size = infer_size
+        self.infer_width = None
+        self.infer_height = None
+        # Keyframe/delta metadata for the UDP and SSE consumers and the MJPEG metadata stream
+        self.metadata_delta = metadata_delta
+        self.delta_encoder = DeltaEncoder() if metadata_delta else None
+        # Each frame's metadata is serialized once and the bytes shared by every sink
+        self.metadata_bus = MetadataBus()
+        # 'binary' sends full frames in the binmeta schema (delta encoding only applies to JSON)
+        self.metadata_udp_format = metadata_udp_format
         self.running = False
         self.stop_event = threading.Event()
         
-        # Queues
-        self.inference_queue = queue.Queue(maxsize=2)
-        self.output_queue = queue.Queue(maxsize=2)
+        self.writer_ready = threading.Event()
+        self.drained = threading.Event()
+        # First capture/output failure; a run with an error is incomplete even if it drained
+        self.error: Optional[str] = None
+        
+        # Queues: real-time mode keeps them shallow and leaky (latency), batch mode
+        # deep and blocking (throughput, never drop a frame)
+        queue_depth = 32 if self.batch_output else 2
+        self.inference_queue = queue.Queue(maxsize=queue_depth)
+        self.output_queue = queue.Queue(maxsize=queue_depth)
         
         # State
         self.latest_klv = {}
         self.frame_count = 0
+        self.preroll_count = 0
         self.processed_count = 0
         self.klv_count = 0
         self.detection_count = 0
@@ -90,22 +171,97 @@ class ThreadedPipeline:
         
         # Components
         self.container = None
-        self.model = None
+        self.model = model  # Pre-loaded YOLO model shared across runs (batch job workers)
+        self._model_ready = False
         self.writer = None
         self.klv_decoder = KLVDecoder()
         
-        # UDP Socket
-        self.metadata_socket = None
-        if self.metadata_host:
-            import socket
-            self.metadata_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.file_logger = FileLogger(metadata_file) if metadata_file else None
+        
+        # UDP metadata: --metadata-host plus any unicast/multicast --metadata-udp targets.
+        # --metadata-host keeps the historical bare payload (one JSON object per
+        # datagram) unless framing is asked for explicitly.
+        self.metadata_publisher = None
+        host_target = [(self.metadata_host, self.metadata_port)] if self.metadata_host else []
+        udp_targets = [parse_target(t, metadata_port) for t in (metadata_targets or [])]
+        if metadata_host_framed:
+            udp_targets = host_target + udp_targets
+            host_target = []
+        if udp_targets or host_target:
+            self.metadata_publisher = UDPMetadataPublisher(udp_targets, mtu=metadata_mtu, ttl=metadata_ttl,
+                                                           raw=metadata_udp_raw, raw_targets=host_target)
 
     def _load_model(self):
+        self._model_ready = True
+        if self.model is not None:
+            # Shared model: drop tracker state left over from the previous input
+            predictor = getattr(self.model, 'predictor', None)
+            for tracker in getattr(predictor, 'trackers', None) or []:
+                tracker.reset()
+            return
         logger.info(f"Loading YOLO model: {self.model_path}")
         self.model = YOLO(self.model_path)
         # Warmup
         # self.model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
 
+    def _open_detection_cache(self):
+        if not (self.detection_cache and self.batch_output):
+            return
+        try:
+            key = cache_key(self.input_srt, self.model_path, self.conf_threshold, self.classes,
+                            TRACKER_CONFIG, self.skip_frames, self.segment, decode_skip=self.decode_skip,
+                            infer_size=self.infer_size if self.analytics_only else None)
+            self.cache_reader, self.cache_writer = open_detection_cache(self.detection_cache, key)
+        except OSError as e:
+            logger.warning(f"Detection cache disabled: {e}")
+
+    def _detect(self, frame_data: FrameData) -> list:
+        """Tracked detections for one frame, from the detection cache when possible."""
+        if self.cache_reader is not None:
+            detections = self.cache_reader.get(frame_data.pts_ms)
+            if detections is not None:
+                return detections
+        if not self._model_ready:
+            # Loaded lazily: a full cache hit never touches the model
+            self._load_model()
+        
+        # Use track mode for persistence
+        results = self.model.track(frame_data.frame, conf=self.conf_threshold, 
+                                 persist=True, verbose=False, tracker=TRACKER_CONFIG)
+        
+        detections = []
+        if results and len(results) > 0:
+            r = results[0]
+            if r.boxes:
+                for box in r.boxes:
+                    cls_id = int(box.cls[0].item())
+                    conf = float(box.conf[0].item())
+                    x1, y1, x2, y2 = box.xyxy[0].tolist()
+                    class_name = r.names.get(cls_id, f"class_{cls_id}")
+                    
+                    det = {
+                        'bbox': [x1, y1, x2, y2],
+                        'class_name': class_name,
+                        'confidence': conf,
+                        'class_id': cls_id
+                    }
+                    if box.id is not None:
+                        det['track_id'] = int(box.id.item())
+                    
+                    detections.append(det)
+        
+        if self.infer_width and self.infer_width != self.frame_width:
+            # Inference ran on the downscaled view: report boxes in source pixels
+            sx = self.frame_width / self.infer_width
+            sy = self.frame_height / self.infer_height
+            for det in detections:
+                x1, y1, x2, y2 = det['bbox']
+                det['bbox'] = [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+        
+        if self.cache_writer is not None:
+            self.cache_writer.add(frame_data.pts_ms, detections)
+        return detections
+
     def _open_srt(self):
         """Open the SRT/RTSP stream or file."""
         import av
@@ -149,11 +305,31 @@ class ThreadedPipeline:
             
             logger.info(f"Detected stream: {self.frame_width}x{self.frame_height} @ {detected_fps:.2f} fps (using {self.frame_fps} fps for output)")
             
+            if self.analytics_only:
+                scale = min(1.0, self.infer_size / max(self.frame_width, self.frame_height))
+                self.infer_width = max(2, int(round(self.frame_width * scale / 2)) * 2)
+                self.infer_height = max(2, int(round(self.frame_height * scale / 2)) * 2)
+                logger.info(f"Analytics-only: inferring on {self.infer_width}x{self.infer_height}, no drawing or encoding")
+            if self.decode_skip != 'none':
+                video_stream.codec_context.skip_frame = DECODE_SKIP[self.decode_skip]
+                logger.info(f"Decoder skipping {self.decode_skip} frames")
+            
             # Signal that we are ready to initialize writer
             self._init_writer()
+            self.writer_ready.set()
+
+            segment_start, segment_end = None, None
+            if self.segment:
+                segment_start, segment_end, preroll = self.segment
+                if segment_start is not None:
+                    # Seek to the keyframe before start - preroll; preroll frames only warm up the tracker
+                    seek_to = max(0.0, segment_start - preroll)
+                    self.container.seek(int(seek_to / video_stream.time_base), stream=video_stream, backward=True)
+                logger.info(f"Processing segment [{segment_start}, {segment_end}) with {preroll}s tracker preroll")
 
+            segment_done = False
             for packet in self.container.demux():
-                if self.stop_event.is_set():
+                if self.stop_event.is_set() or segment_done:
                     break
                 
                 if packet.stream.type == 'data':
@@ -167,27 +343,47 @@ class ThreadedPipeline:
                     try:
                         frames = packet.decode()
                         for frame in frames:
-                            self.frame_count += 1
+                            frame_time = float(frame.pts * frame.time_base) if frame.pts is not None else None
+                            if segment_end is not None and frame_time is not None and frame_time >= segment_end:
+                                segment_done = True
+                                break
+                            # Preroll frames are counted apart, so frame numbers of a segment start at 1
+                            # and chunk merging can offset them by the frames decoded in earlier chunks
+                            preroll = segment_start is not None and frame_time is not None and frame_time < segment_start
+                            if preroll:
+                                self.preroll_count += 1
+                                index = self.preroll_count
+                            else:
+                                self.frame_count += 1
+                                index = self.frame_count
                             
                             # Skip frames logic if needed at capture level
-                            if self.skip_frames > 0 and self.frame_count % (self.skip_frames + 1) != 1:
+                            if self.skip_frames > 0 and index % (self.skip_frames + 1) != 1:
                                 continue
 
                             # Convert to format needed for inference
-                            img = frame.to_ndarray(format='bgr24')
+                            if self.infer_width:
+                                # Scale and convert in one swscale pass; full-res BGR is never materialized
+                                img = frame.to_ndarray(width=self.infer_width, height=self.infer_height, format='bgr24')
+                            else:
+                                img = frame.to_ndarray(format='bgr24')
                             
                             # Create packet
                             frame_data = FrameData(
                                 frame=img,
-                                frame_count=self.frame_count,
+                                frame_count=index,
                                 timestamp=float(frame.pts * frame.time_base) if frame.pts else time.time(),
                                 klv_data=self.latest_klv.copy()
                             )
                             frame_data.timings['capture_start'] = time.time()
+                            if frame_time is not None:
+                                frame_data.pts_ms = int(round(frame_time * 1000))
+                            if preroll:
+                                frame_data.emit = False
 
                             # If batch mode, BLOCK until space is available - NEVER drop frames
                             if self.batch_output:
-                                self.inference_queue.put(frame_data)
+                                self._put_blocking(self.inference_queue, frame_data)
                             else:
                                 # Real-time mode: drop old frames if queue is full
                                 if self.inference_queue.full():
@@ -208,8 +404,21 @@ class ThreadedPipeline:
         except Exception as e:
             if not self.stop_event.is_set():
                 logger.error(f"Capture thread error: {e}")
+                self.error = self.error or f"capture: {e}"
         finally:
-            self.stop_event.set()
+            # Let the downstream stages drain everything already queued before shutting down
+            self.writer_ready.set()
+            self._put_blocking(self.inference_queue, _EOS)
+
+    def _put_blocking(self, q, item) -> bool:
+        """Blocking put that still gives up when the pipeline is being stopped."""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
 
     def _inference_thread(self):
         logger.info("Starting inference thread")
@@ -219,38 +428,26 @@ class ThreadedPipeline:
             except queue.Empty:
                 continue
             
+            if frame_data is _EOS:
+                self._put_blocking(self.output_queue, _EOS)
+                break
+            
             try:
                 t0 = time.time()
                 # Run Inference
-                # Use track mode for persistence
-                results = self.model.track(frame_data.frame, conf=self.conf_threshold, 
-                                         persist=True, verbose=False, tracker="bytetrack.yaml")
+                detections = self._detect(frame_data)
                 frame_data.timings['inference_ms'] = (time.time() - t0) * 1000
                 
-                detections = []
-                if results and len(results) > 0:
-                    r = results[0]
-                    if r.boxes:
-                        for box in r.boxes:
-                            cls_id = int(box.cls[0].item())
-                            conf = float(box.conf[0].item())
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            class_name = r.names.get(cls_id, f"class_{cls_id}")
-                            
-                            det = {
-                                'bbox': [x1, y1, x2, y2],
-                                'class_name': class_name,
-                                'confidence': conf,
-                                'class_id': cls_id
-                            }
-                            if box.id is not None:
-                                det['track_id'] = int(box.id.item())
-                            
-                            detections.append(det)
-                
                 frame_data.detections = detections
                 self.detection_count += len(detections)
                 
+                if not frame_data.emit and not self.batch_output:
+                    continue
+                
+                if self.batch_output:
+                    self._put_blocking(self.output_queue, frame_data)
+                    continue
+                
                 # Leaky put to output
                 try:
                     self.output_queue.put_nowait(frame_data)
@@ -263,19 +460,42 @@ class ThreadedPipeline:
                         
             except Exception as e:
                 logger.error(f"Inference error: {e}")
+                if self.batch_output:
+                    # The frame is lost: the batch output would silently miss it
+                    self.error = self.error or f"inference: {e}"
 
     def _output_thread(self):
         logger.info("Starting output thread")
+        self.writer_ready.wait()
         while not self.stop_event.is_set():
             try:
                 frame_data = self.output_queue.get(timeout=1.0)
             except queue.Empty:
                 continue
             
+            if frame_data is _EOS:
+                logger.info(f"End of stream: {self.processed_count} frames written")
+                self.drained.set()
+                break
+            
+            if not frame_data.emit:
+                # Tracker warm-up frame of a chunk: metadata only, marked so chunk merging can
+                # match this chunk's track ids to the previous chunk's on the shared frames
+                if self.writer:
+                    self.writer.inject_metadata({
+                        'frame': frame_data.frame_count,
+                        'timestamp': datetime.fromtimestamp(frame_data.timestamp).isoformat(),
+                        'pts': frame_data.timestamp,
+                        'overlap': True,
+                        'detections': frame_data.detections,
+                        'detection_count': len(frame_data.detections)
+                    })
+                continue
+            
             try:
                 t_draw_start = time.time()
-                # 1. Calculate Coordinates
-                h, w = frame_data.frame.shape[:2]
+                # 1. Calculate Coordinates (bboxes are in source pixels)
+                w, h = self.frame_width, self.frame_height
                 enriched_detections = []
                 for det in frame_data.detections:
                     enriched = det.copy()
@@ -283,23 +503,26 @@ class ThreadedPipeline:
                         coords = calculate_object_coordinates(det['bbox'], frame_data.klv_data, w, h)
                         if coords:
                             enriched['geo_coordinates'] = coords
-                            
-                            # Send to TAK
-                            if self.tak_sender:
-                                self.tak_sender.send_detection(enriched, frame_data.frame_count)
                     enriched_detections.append(enriched)
                 
+                # Send to TAK (whole frame in one call; non-geolocated detections are skipped)
+                if self.tak_sender and frame_data.klv_data:
+                    self.tak_sender.send_detections(enriched_detections, frame_data.frame_count)
+                
                 # 2. Prepare Metadata
-                metadata = {
+                metadata = self.metadata_bus.frame({
                     'frame': frame_data.frame_count,
                     'timestamp': datetime.fromtimestamp(frame_data.timestamp).isoformat(),
+                    'pts': frame_data.timestamp,
                     'telemetry': frame_data.klv_data,
                     'detections': enriched_detections,
                     'detection_count': len(enriched_detections)
-                }
+                })
                 
                 # 3. Draw Overlay
-                if self.show_overlay:
+                if self.analytics_only:
+                    frame_data.annotated_frame = None
+                elif self.show_overlay:
                     frame_data.annotated_frame = draw_detections_vectorized(frame_data.frame, enriched_detections)
                     frame_data.annotated_frame = overlay_metadata(frame_data.annotated_frame, frame_data.frame_count, 
                                                                 frame_data.klv_data, enriched_detections, 0.0) # FPS TODO
@@ -312,22 +535,26 @@ class ThreadedPipeline:
                 t_write_start = time.time()
                 if self.writer:
                     self.writer.inject_metadata(metadata)
-                    self.writer.write_frame(frame_data.annotated_frame)
+                    if frame_data.annotated_frame is not None:
+                        self.writer.write_frame(frame_data.annotated_frame)
+                if self.file_logger:
+                    self.file_logger.log(metadata)
                 frame_data.timings['write_ms'] = (time.time() - t_write_start) * 1000
                 
                 # 5. Broadcast Metadata
-                if self.metadata_socket:
-                    import json
+                wire_metadata = self.metadata_bus.wrap(self.delta_encoder.encode(metadata)) if self.delta_encoder else metadata
+                if self.metadata_publisher:
                     try:
-                        self.metadata_socket.sendto(json.dumps(metadata, default=str).encode('utf-8'), 
-                                                  (self.metadata_host, self.metadata_port))
-                    except:
-                        pass
+                        if self.metadata_udp_format == 'binary':
+                            self.metadata_publisher.publish(encode_binary(metadata), FORMAT_BINARY)
+                        else:
+                            self.metadata_publisher.publish(wire_metadata.json(), FORMAT_JSON)
+                    except Exception as e:
+                        logger.debug(f"UDP metadata error: {e}")
                 
                 if self.sse_broadcaster:
-                    import json
                     try:
-                        self.sse_broadcaster.publish(json.dumps(metadata, default=str, separators=(',', ':')))
+                        self.sse_broadcaster.publish(wire_metadata.json())
                     except:
                         pass
                 
@@ -339,13 +566,42 @@ class ThreadedPipeline:
                         
             except Exception as e:
                 logger.error(f"Output error: {e}")
+                self.error = self.error or f"output: {e}"
 
     def _init_writer(self):
         """Initialize the appropriate output writer based on configuration."""
         if self.writer:
             return
         
-        # Priority: Batch > MJPEG > WebRTC > HLS > RTSP
+        if self.analytics_only:
+            if self.batch_output:
+                logger.info(f"Initializing analytics-only batch mode (metadata only): {self.batch_output}")
+                self.writer = BatchVideoWriter(
+                    output_dir=self.batch_output,
+                    width=self.frame_width,
+                    height=self.frame_height,
+                    fps=self.frame_fps,
+                    input_filename=self.input_srt,
+                    metadata_format=self.batch_metadata_format,
+                    metadata_compression=self.batch_metadata_compression,
+                    columnar=self.batch_columnar,
+                    video=False
+                )
+            elif self.output_shm:
+                logger.info(f"Initializing analytics-only shared memory output (metadata only): {self.output_shm}")
+                self.writer = SharedMemoryWriter(self.output_shm, self.frame_width, self.frame_height, self.frame_fps,
+                                                 slots=self.shm_slots, metadata_format=self.shm_metadata_format,
+                                                 frames=False)
+            else:
+                logger.info("Analytics-only mode: no video output (metadata via --metadata-file/SSE/TAK/UDP)")
+            return
+        
+        # Encoder settings only apply to the x264 based writers (Batch, HLS, RTSP)
+        profile = None
+        if not (self.output_mjpeg or self.output_webrtc or self.output_shm) or self.batch_output:
+            profile = resolve_encoder_profile(self.encoder_profile, self.frame_width, self.frame_height, self.frame_fps)
+        
+        # Priority: Batch > Shared memory > MJPEG > WebRTC > HLS > RTSP
         if self.batch_output:
             logger.info(f"Initializing batch processing mode: {self.batch_output}")
             self.writer = BatchVideoWriter(
@@ -353,10 +609,21 @@ class ThreadedPipeline:
                 width=self.frame_width,
                 height=self.frame_height,
                 fps=self.frame_fps,
-                input_filename=self.input_srt  # Pass input filename for output naming
+                input_filename=self.input_srt,  # Pass input filename for output naming
+                encoder_profile=profile,
+                metadata_format=self.batch_metadata_format,
+                metadata_compression=self.batch_metadata_compression,
+                columnar=self.batch_columnar,
+                encoder=self.batch_encoder
             )
             return
         
+        if self.output_shm:
+            # Annotated frames, or raw ones with --no-overlay
+            self.writer = SharedMemoryWriter(self.output_shm, self.frame_width, self.frame_height, self.frame_fps,
+                                             slots=self.shm_slots, metadata_format=self.shm_metadata_format)
+            return
+        
         if self.output_mjpeg:
             if not MJPEG_AVAILABLE:
                 logger.error("MJPEG output requested but aiohttp not available")
@@ -368,7 +635,8 @@ class ThreadedPipeline:
                 width=self.frame_width,
                 height=self.frame_height,
                 fps=self.frame_fps,
-                quality=85
+                quality=85,
+                metadata_delta=self.metadata_delta
             )
             return
         
@@ -382,31 +650,52 @@ class ThreadedPipeline:
                 port=self.output_webrtc,
                 width=self.frame_width,
                 height=self.frame_height,
-                fps=self.frame_fps
+                fps=self.frame_fps,
+                encode_once=self.webrtc_encode_once
             )
             return
         
         logger.info(f"Initializing writer: {self.frame_width}x{self.frame_height} @ {self.frame_fps}fps (Format: {self.output_format})")
         
+        if self.output_format == 'llhls':
+            if not LLHLS_AVAILABLE:
+                raise RuntimeError("Install av and aiohttp for LL-HLS output")
+            self.writer = LLHLSWriter(
+                port=self.hls_port,
+                width=self.frame_width,
+                height=self.frame_height,
+                fps=self.frame_fps,
+                output_dir=self.output_rtsp if self.hls_persist else None,
+                encoder_profile=profile
+            )
+            return
+
         if self.output_format == 'hls':
-            self.writer = HLSWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps, self.id3_interval)
+            self.writer = HLSWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps, self.id3_interval,
+                                    encoder_profile=profile)
             return
 
         if self.mode == 'id3':
-            self.writer = ID3RTSPWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps, self.id3_interval)
+            self.writer = ID3RTSPWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps, self.id3_interval,
+                                        encoder_profile=profile)
         elif self.mode == 'basic':
-            self.writer = BasicRTSPWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps)
+            self.writer = BasicRTSPWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps,
+                                          encoder_profile=profile)
         elif self.mode == 'auto':
             available, _, _, _ = _try_import_gi()
             if available:
                 logger.info("Auto mode: GI available, using ID3 pipeline")
-                self.writer = ID3RTSPWriter(self.output_rtsp, width, height, fps, self.id3_interval)
+                self.writer = ID3RTSPWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps,
+                                            self.id3_interval, encoder_profile=profile)
             else:
                 logger.info("Auto mode: GI not available, using Basic pipeline")
-                self.writer = BasicRTSPWriter(self.output_rtsp, width, height, fps)
+                self.writer = BasicRTSPWriter(self.output_rtsp, self.frame_width, self.frame_height, self.frame_fps,
+                                              encoder_profile=profile)
 
     def run(self):
-        self._load_model()
+        self._open_detection_cache()
+        if self.cache_reader is None:
+            self._load_model()
         self._open_srt()
         
         self.running = True
@@ -416,24 +705,49 @@ class ThreadedPipeline:
         t_out = threading.Thread(target=self._output_thread, daemon=True)
         
         t_cap.start()
-        # Wait for writer init (simple synchronization)
-        time.sleep(2) 
         t_inf.start()
         t_out.start()
         
         try:
             while self.running and not self.stop_event.is_set():
-                time.sleep(1)
-                if not t_cap.is_alive():
-                    logger.error("Capture thread died")
+                # Output thread sets drained once the end-of-stream sentinel went through every stage
+                if self.drained.wait(timeout=1.0):
+                    break
+                if not t_out.is_alive():
+                    logger.error("Output thread died")
+                    self.error = self.error or "output thread died"
                     break
         except KeyboardInterrupt:
             logger.info("Stopping...")
         finally:
             self.stop_event.set()
+            t_inf.join(timeout=5)
+            t_out.join(timeout=5)
+            if self.cache_writer is not None:
+                # Only complete runs are cached
+                try:
+                    if self.drained.is_set() and not self.error:
+                        self.cache_writer.commit()
+                    else:
+                        self.cache_writer.discard()
+                except OSError as e:
+                    logger.warning(f"Could not save detection cache: {e}")
+                    self.cache_writer.discard()
+            if self.cache_reader is not None:
+                logger.info(f"Detection cache: {self.cache_reader.hits} hits, {self.cache_reader.misses} misses")
+            for fmt, st in self.metadata_bus.stats()['formats'].items():
+                logger.info(f"Metadata {fmt}: {st['encodes']} encodes ({st['encode_ms_avg']:.3f}ms avg), "
+                            f"{st['reuses']} reuses")
             if self.writer:
-                self.writer.close()
+                if self.batch_output:
+                    # Decoded (not only written) frames: chunk merging numbers frames like a single run
+                    self.writer.close({'decoded_frames': self.frame_count})
+                else:
+                    self.writer.close()
+                if getattr(self.writer, 'error', None):
+                    self.error = self.error or self.writer.error
             if self.container:
                 self.container.close()
-            if self.metadata_socket:
-                self.metadata_socket.close()
+            if self.metadata_publisher:
+                logger.info(f"UDP metadata: {self.metadata_publisher.stats()}")
+                self.metadata_publisher.close()
@@ -1,9 +1,13 @@
 import argparse
 import logging
+import os
 import sys
 from pathlib import Path
 
 from .core.pipeline import ThreadedPipeline
+from .core.chunked import ChunkedBatchRunner
+from .core.jobs import BatchJobRunner, discover_inputs
+from .modules.detcache import DEFAULT_DETECTION_CACHE_DIR
 from .modules.tak import TAKCoTSender
 from .modules.sse import SSEBroadcaster, start_sse_server
 
@@ -19,9 +23,11 @@ av.logging.set_level(av.logging.ERROR)
 
 def main():
     parser = argparse.ArgumentParser(description='SRT → YOLO → RTSP/HLS with optional ID3 and SSE metadata', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument('--input-srt', type=str, required=True, help='Input SRT URL (e.g., srt://host:port)')
+    parser.add_argument('--input-srt', type=str, default=None, help='Input SRT URL (e.g., srt://host:port) or video file (required unless --batch-input)')
     parser.add_argument('--output-rtsp', type=str, default='rtsp://localhost:8554/detected_stream', help='Output RTSP URL (MediaMTX will convert to HLS)')
-    parser.add_argument('--output-format', type=str, default='rtsp', choices=['rtsp', 'hls'], help='Output format: rtsp (stream) or hls (files)')
+    parser.add_argument('--output-format', type=str, default='rtsp', choices=['rtsp', 'hls', 'llhls'], help='Output format: rtsp (stream), hls (files) or llhls (in-process low-latency HLS server)')
+    parser.add_argument('--hls-port', type=int, default=8090, help='LL-HLS: HTTP port serving /index.m3u8 from memory')
+    parser.add_argument('--hls-persist', action='store_true', help='LL-HLS: also write segments + playlist atomically to --output-rtsp directory')
     parser.add_argument('--model', type=str, default='models/yolov8n.pt', help='Path to YOLO model')
     parser.add_argument('--conf', type=float, default=0.25, help='Confidence threshold')
     parser.add_argument('--device', type=str, default='auto', help='Device to run inference on (auto, cpu, 0, 1, …)')
@@ -32,6 +38,13 @@ def main():
     parser.add_argument('--srt-latency', type=int, default=1500, help='SRT latency in milliseconds')
     parser.add_argument('--metadata-host', type=str, default=None, help='Host to send metadata via UDP')
     parser.add_argument('--metadata-port', type=int, default=5555, help='UDP port for metadata')
+    parser.add_argument('--metadata-udp', type=str, nargs='+', default=None, metavar='HOST[:PORT]',
+                        help='Additional UDP metadata targets, unicast or multicast groups (e.g. 239.255.0.1:5555); port defaults to --metadata-port')
+    parser.add_argument('--metadata-mtu', type=int, default=1472, help='UDP metadata: max datagram size; larger messages are sent in sequenced chunks')
+    parser.add_argument('--metadata-ttl', type=int, default=1, help='UDP metadata: multicast TTL (1 = local subnet)')
+    parser.add_argument('--metadata-udp-raw', action='store_true', help='UDP metadata: send bare payloads without the seq/chunk header to --metadata-udp targets too (legacy consumers; no chunking)')
+    parser.add_argument('--metadata-host-framed', action='store_true', help='UDP metadata: also use the seq/chunk header for --metadata-host (default: bare payload, one message per datagram)')
+    parser.add_argument('--metadata-udp-format', type=str, default='json', choices=['json', 'binary'], help='UDP metadata encoding: compact JSON or the fixed-layout binary schema (src/modules/binmeta.py)')
     parser.add_argument('--sse-port', type=int, default=None, help='Start SSE server on this port (path: /events)')
     parser.add_argument('--id3-interval', type=int, default=30, help='Insert ID3 tag every N frames (ID3 mode)')
     parser.add_argument('--mode', type=str, default='auto', choices=['auto', 'id3', 'basic'], help='Pipeline selection mode')
@@ -41,7 +54,28 @@ def main():
     parser.add_argument('--save-detection-images', action='store_true', help='Save cropped images of detected objects')
     parser.add_argument('--output-webrtc', type=int, default=None, help='Start WebRTC signaling server on this port (e.g., 8080)')
     parser.add_argument('--output-mjpeg', type=int, default=None, help='Start MJPEG+SSE server on this port (e.g., 8080)')
+    parser.add_argument('--output-shm', type=str, default=None, metavar='NAME', help='Publish frames + binary metadata into a /dev/shm/NAME ring for same-host consumers (src/outputs/shm.py SharedMemoryReader)')
+    parser.add_argument('--shm-slots', type=int, default=4, help='Shared memory output: ring size in frames')
+    parser.add_argument('--shm-metadata-format', type=str, default='binary', choices=['binary', 'json'], help='Shared memory output: metadata encoding per slot')
     parser.add_argument('--batch-output', type=str, default=None, help='Batch mode: output directory for annotated video + JSON metadata')
+    parser.add_argument('--batch-workers', type=int, default=1, help='Batch mode: split file input at keyframes into N chunks processed in parallel processes')
+    parser.add_argument('--chunk-overlap', type=float, default=2.0, help='Batch mode: seconds decoded before each chunk start to warm up the tracker and match track ids across chunks (not written)')
+    parser.add_argument('--batch-input', type=str, default=None, help='Batch job queue: directory, glob or manifest (.txt/.json) of videos to process into --batch-output')
+    parser.add_argument('--batch-jobs', type=int, default=1, help='Batch job queue: number of concurrent worker processes (each loads the model once)')
+    parser.add_argument('--checkpoint-frames', type=int, default=3000, help='Batch job queue: checkpoint every ~N frames so crashed jobs resume mid-file (tracker restarts per part, ids are stitched; 0 = one part per file)')
+    parser.add_argument('--batch-metadata-format', type=str, default='json', choices=['json', 'jsonl', 'binary'], help='Batch mode: per-frame metadata layout (streamed to disk as frames arrive; binary = length-prefixed binmeta records)')
+    parser.add_argument('--batch-metadata-compression', type=str, default='none', choices=['none', 'gzip', 'zstd'], help='Batch mode: compress the metadata stream (zstd needs the zstandard package)')
+    parser.add_argument('--batch-columnar', action='store_true', help='Batch mode: also write detections/telemetry as columnar tables (Parquet with pyarrow, else memory-mappable .npy)')
+    parser.add_argument('--batch-encoder', type=str, default='ffmpeg', choices=['ffmpeg', 'pyav'], help='Batch mode: ffmpeg subprocess fed via pipe, or in-process PyAV libx264 (yuv420p)')
+    parser.add_argument('--detection-cache', type=str, nargs='?', const=DEFAULT_DETECTION_CACHE_DIR, default=None,
+                        help='Batch mode: reuse tracked detections of earlier runs with the same input, model and detection settings (dir; bare flag uses ~/.cache/srt-yolo/detections)')
+    parser.add_argument('--analytics-only', action='store_true', help='Detections/geolocation only: infer on a downscaled view, no drawing or video encoding (batch writes metadata only)')
+    parser.add_argument('--decode-skip', type=str, default='none', choices=['none', 'nonref', 'nonkey'], help='Let the decoder drop non-reference or non-key frames (fewer frames decoded and inferred)')
+    parser.add_argument('--infer-size', type=int, default=640, help='Analytics-only: longest side of the frames handed to the model')
+    parser.add_argument('--webrtc-encode-once', action='store_true', help='WebRTC: encode H.264 once and share the packets with every peer (peers limited to H.264)')
+    parser.add_argument('--metadata-delta', action='store_true', help='Send keyframe/delta metadata (changed telemetry, per-track updates) to UDP, SSE and MJPEG /metadata consumers')
+    parser.add_argument('--encoder-profile', type=str, default='default', choices=['default', 'edge', 'balanced', 'quality', 'auto'],
+                        help='x264 settings for RTSP/HLS/batch outputs (auto = benchmark at startup, cached per host and resolution)')
     
     # TAK Server arguments
     parser.add_argument('--tak-enable', action='store_true', help='Enable TAK Server CoT message sending')
@@ -51,8 +85,14 @@ def main():
     parser.add_argument('--tak-key', type=str, default='certs/user1.key', help='TAK client key file')
     parser.add_argument('--tak-password', type=str, default='atakatak', help='TAK certificate password')
     parser.add_argument('--tak-stale', type=int, default=600, help='TAK object stale time in seconds')
+    parser.add_argument('--tak-servers', type=str, nargs='+', default=None, metavar='HOST[:PORT]',
+                        help='Send CoT to several TAK servers at once (instead of --tak-host); port defaults to --tak-port')
 
     args = parser.parse_args()
+    if not args.input_srt and not args.batch_input:
+        parser.error("--input-srt is required (or --batch-input with --batch-output)")
+    if args.batch_input and not args.batch_output:
+        parser.error("--batch-input requires --batch-output")
     logging.getLogger().setLevel(getattr(logging, args.log_level))
 
     model_path = Path(args.model)
@@ -70,7 +110,8 @@ def main():
             key_file=args.tak_key,
             cert_password=args.tak_password,
             enabled=True,
-            stale_time_seconds=args.tak_stale
+            stale_time_seconds=args.tak_stale,
+            servers=args.tak_servers
         )
 
     # Initialize SSE Broadcaster if enabled
@@ -82,31 +123,92 @@ def main():
         # Note: We need to handle stop_event properly, maybe pass it to pipeline
         start_sse_server(args.sse_port, sse_broadcaster, stop_event)
 
+    # Picklable pipeline settings (shared with chunk worker processes)
+    pipeline_kwargs = dict(
+        input_srt=args.input_srt,
+        output_rtsp=args.output_rtsp, # Used as output_dir for HLS
+        model_path=args.model,
+        conf_threshold=args.conf,
+        device=args.device,
+        classes=args.classes,
+        show_overlay=not args.no_overlay,
+        metadata_file=args.metadata_file,
+        skip_frames=args.skip_frames,
+        srt_latency=args.srt_latency,
+        metadata_host=args.metadata_host,
+        metadata_port=args.metadata_port,
+        id3_interval=args.id3_interval,
+        detections_dir=args.detections_dir,
+        detection_log_interval=args.detection_log_interval,
+        save_detection_images=args.save_detection_images,
+        mode=args.mode,
+        output_format=args.output_format,
+        output_webrtc=args.output_webrtc,
+        output_mjpeg=args.output_mjpeg,
+        batch_output=args.batch_output,
+        encoder_profile=args.encoder_profile,
+        hls_port=args.hls_port,
+        hls_persist=args.hls_persist,
+        batch_metadata_format=args.batch_metadata_format,
+        batch_metadata_compression=args.batch_metadata_compression,
+        batch_columnar=args.batch_columnar,
+        batch_encoder=args.batch_encoder,
+        detection_cache=args.detection_cache,
+        analytics_only=args.analytics_only,
+        decode_skip=args.decode_skip,
+        infer_size=args.infer_size,
+        metadata_delta=args.metadata_delta,
+        webrtc_encode_once=args.webrtc_encode_once,
+        metadata_udp_format=args.metadata_udp_format,
+        metadata_targets=args.metadata_udp,
+        metadata_mtu=args.metadata_mtu,
+        metadata_ttl=args.metadata_ttl,
+        metadata_udp_raw=args.metadata_udp_raw,
+        metadata_host_framed=args.metadata_host_framed,
+        output_shm=args.output_shm,
+        shm_slots=args.shm_slots,
+        shm_metadata_format=args.shm_metadata_format
+    )
+
+    chunked = bool(args.batch_output and args.batch_workers > 1 and args.input_srt and os.path.isfile(args.input_srt))
+    if (args.batch_input or chunked) and (args.metadata_host or args.metadata_udp):
+        logger.warning("UDP metadata is not sent from batch worker processes "
+                       "(--metadata-file is written from the merged metadata)")
+
     try:
+        if args.batch_input:
+            inputs = discover_inputs(args.batch_input)
+            if not inputs:
+                logger.error(f"No input videos found for {args.batch_input}")
+                sys.exit(1)
+            summary = BatchJobRunner(
+                inputs=inputs,
+                output_dir=args.batch_output,
+                pipeline_kwargs=pipeline_kwargs,
+                workers=args.batch_jobs,
+                checkpoint_frames=args.checkpoint_frames,
+                overlap_seconds=args.chunk_overlap
+            ).run()
+            if summary['failed']:
+                sys.exit(1)
+            return
+
+        if chunked:
+            if tak_sender or sse_broadcaster:
+                logger.warning("TAK/SSE outputs are not forwarded from chunk worker processes")
+            ChunkedBatchRunner(
+                input_path=args.input_srt,
+                output_dir=args.batch_output,
+                workers=args.batch_workers,
+                overlap_seconds=args.chunk_overlap,
+                pipeline_kwargs=pipeline_kwargs
+            ).run()
+            return
+
         pipeline = ThreadedPipeline(
-            input_srt=args.input_srt,
-            output_rtsp=args.output_rtsp, # Used as output_dir for HLS
-            model_path=args.model,
-            conf_threshold=args.conf,
-            device=args.device,
-            classes=args.classes,
-            show_overlay=not args.no_overlay,
-            metadata_file=args.metadata_file,
-            skip_frames=args.skip_frames,
-            srt_latency=args.srt_latency,
-            metadata_host=args.metadata_host,
-            metadata_port=args.metadata_port,
             sse_broadcaster=sse_broadcaster,
-            id3_interval=args.id3_interval,
-            detections_dir=args.detections_dir,
-            detection_log_interval=args.detection_log_interval,
-            save_detection_images=args.save_detection_images,
             tak_sender=tak_sender,
-            mode=args.mode,
-            output_format=args.output_format,
-            output_webrtc=args.output_webrtc,
-            output_mjpeg=args.output_mjpeg,
-            batch_output=args.batch_output
+            **pipeline_kwargs
         )
         pipeline.run()
     except Exception as e:
@@ -114,6 +216,9 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if tak_sender:
+            tak_sender.disconnect()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,221 @@
+"""
+Compact binary encoding of per-frame metadata (the ``binary`` metadata format).
+
+JSON repeats every key and prints floats at full repr on every frame. This
+schema has a fixed layout packed with precompiled ``struct`` formats (and
+matching NumPy dtypes for bulk readers). All values are little-endian.
+
+    header     28 B   magic "SYMB", version (u8), flags (u8: telemetry, geo, overlap), detection count (u16),
+                      frame (u32), pts (f64 seconds, NaN if unknown),
+                      telemetry mask (u32), class table size (u16), 2 B padding
+    telemetry  144 B  one f64 per klv.TELEMETRY_FIELDS entry (NaN when absent;
+                      bit i of the mask is set when field i is present).
+                      Only present with FLAG_TELEMETRY.
+    detections N x 28 B (48 B with FLAG_GEO):
+                      class_id (u16), flags (u8), pad, confidence (f32),
+                      track_id (i32, -1 untracked), x1, y1, x2, y2 (f32 source pixels)
+                      [+ latitude, longitude (f64), ground distance (f32 m)]
+    class table       per class seen in this frame: class_id (u16), name length (u8), UTF-8 name
+
+Every message is self-describing (a lost UDP datagram costs nothing), and the
+detection array sits at a fixed offset so it can be read with ``np.frombuffer``.
+The encoding covers what consumers draw and geolocate: other top-level keys,
+non-KLV telemetry and the secondary geolocation fields are not carried.
+``tests/metadata_binary.js`` is the browser decoder.
+"""
+
+import math
+import struct
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Any, List
+
+import numpy as np
+
+from .klv import TELEMETRY_FIELDS
+from .metabus import FrameMetadata, register_format
+
+FORMAT_NAME = 'binary'
+MAGIC = b'SYMB'
+VERSION = 1
+
+FLAG_TELEMETRY = 0x01
+FLAG_GEO = 0x02
+FLAG_OVERLAP = 0x04  # Chunk warm-up frame (see core.chunked), not part of the output timeline
+
+DET_TRACKED = 0x01
+DET_GEO = 0x02
+
+HEADER = struct.Struct('<4sBBHIdIH2x')
+TELEMETRY = struct.Struct('<' + 'd' * len(TELEMETRY_FIELDS))
+_RECORD_FORMAT = 'HBxfi4f'
+_GEO_RECORD_FORMAT = _RECORD_FORMAT + 'ddf'
+RECORD = struct.Struct('<' + _RECORD_FORMAT)
+GEO_RECORD = struct.Struct('<' + _GEO_RECORD_FORMAT)
+_CLASS_ENTRY = struct.Struct('<HB')
+
+DETECTION_DTYPE = np.dtype([
+    ('class_id', '<u2'),
+    ('flags', 'u1'),
+    ('_pad', 'u1'),
+    ('confidence', '<f4'),
+    ('track_id', '<i4'),
+    ('x1', '<f4'),
+    ('y1', '<f4'),
+    ('x2', '<f4'),
+    ('y2', '<f4'),
+])
+GEO_DETECTION_DTYPE = np.dtype(DETECTION_DTYPE.descr + [
+    ('latitude', '<f8'),
+    ('longitude', '<f8'),
+    ('ground_distance_m', '<f4'),
+])
+assert DETECTION_DTYPE.itemsize == RECORD.size and GEO_DETECTION_DTYPE.itemsize == GEO_RECORD.size
+
+_NAN = math.nan
+
+
+@lru_cache(maxsize=256)
+def _records_struct(count: int, geo: bool) -> struct.Struct:
+    """One precompiled Struct for the whole detection array, so it packs in a single call."""
+    return struct.Struct('<' + (_GEO_RECORD_FORMAT if geo else _RECORD_FORMAT) * count)
+
+
+def encode(metadata: Dict[str, Any]) -> bytes:
+    """Pack one frame's metadata (the pipeline's dict layout) into the binary schema."""
+    detections = metadata.get('detections') or ()
+    telemetry = metadata.get('telemetry') or {}
+    flags = 0
+
+    telemetry_block = b''
+    mask = 0
+    if telemetry:
+        values = []
+        for i, name in enumerate(TELEMETRY_FIELDS):
+            value = telemetry.get(name)
+            if value is None:
+                values.append(_NAN)
+            else:
+                values.append(float(value))
+                mask |= 1 << i
+        if mask:
+            flags |= FLAG_TELEMETRY
+            telemetry_block = TELEMETRY.pack(*values)
+
+    geo = any(det.get('geo_coordinates') for det in detections)
+    if geo:
+        flags |= FLAG_GEO
+    if metadata.get('overlap'):
+        flags |= FLAG_OVERLAP
+    fields: List[Any] = []
+    class_names: Dict[int, str] = {}
+    for det in detections:
+        class_id = int(det['class_id'])
+        class_names.setdefault(class_id, det.get('class_name', ''))
+        track_id = det.get('track_id')
+        det_flags = DET_TRACKED if track_id is not None else 0
+        x1, y1, x2, y2 = det['bbox']
+        if geo:
+            coords = det.get('geo_coordinates')
+            if coords:
+                det_flags |= DET_GEO
+                fields += (class_id, det_flags, det['confidence'], track_id if track_id is not None else -1,
+                           x1, y1, x2, y2, coords['latitude'], coords['longitude'],
+                           coords.get('estimated_ground_distance_m', _NAN))
+            else:
+                fields += (class_id, det_flags, det['confidence'], track_id if track_id is not None else -1,
+                           x1, y1, x2, y2, _NAN, _NAN, _NAN)
+        else:
+            fields += (class_id, det_flags, det['confidence'], track_id if track_id is not None else -1,
+                       x1, y1, x2, y2)
+    records = _records_struct(len(detections), geo).pack(*fields) if detections else b''
+
+    class_table = bytearray()
+    for class_id, name in class_names.items():
+        name_bytes = str(name).encode('utf-8')[:255]
+        class_table += _CLASS_ENTRY.pack(class_id, len(name_bytes))
+        class_table += name_bytes
+
+    pts = metadata.get('pts')
+    header = HEADER.pack(MAGIC, VERSION, flags, len(detections), int(metadata.get('frame') or 0) & 0xFFFFFFFF,
+                         float(pts) if pts is not None else _NAN, mask, len(class_table))
+    return b''.join((header, telemetry_block, records, class_table))
+
+
+def encode_binary(metadata: Dict[str, Any]) -> bytes:
+    """Binary encoding of ``metadata``, reusing the cached bytes of a FrameMetadata."""
+    if isinstance(metadata, FrameMetadata):
+        return metadata.encoded(FORMAT_NAME)
+    return encode(metadata)
+
+
+register_format(FORMAT_NAME, encode)
+
+
+def _parse(data) -> tuple:
+    magic, version, flags, count, frame, pts, mask, class_table_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary metadata message")
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary metadata version {version}")
+    offset = HEADER.size + (TELEMETRY.size if flags & FLAG_TELEMETRY else 0)
+    return flags, count, frame, pts, mask, offset, class_table_size
+
+
+def decode_detections(data) -> np.ndarray:
+    """Detection records as a structured array view (DETECTION_DTYPE or GEO_DETECTION_DTYPE), no copy."""
+    flags, count, _, _, _, offset, _ = _parse(data)
+    dtype = GEO_DETECTION_DTYPE if flags & FLAG_GEO else DETECTION_DTYPE
+    return np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+
+
+def decode(data) -> Dict[str, Any]:
+    """Reference decoder: rebuild the pipeline's metadata dict from a binary message."""
+    flags, count, frame, pts, mask, offset, class_table_size = _parse(data)
+
+    telemetry = {}
+    if flags & FLAG_TELEMETRY:
+        values = TELEMETRY.unpack_from(data, HEADER.size)
+        for i, name in enumerate(TELEMETRY_FIELDS):
+            if mask & (1 << i):
+                telemetry[name] = int(values[i]) if name == 'timestamp_us' else values[i]
+
+    geo = bool(flags & FLAG_GEO)
+    record = GEO_RECORD if geo else RECORD
+    table_offset = offset + count * record.size
+    class_names = {}
+    position = table_offset
+    while position < table_offset + class_table_size:
+        class_id, length = _CLASS_ENTRY.unpack_from(data, position)
+        position += _CLASS_ENTRY.size
+        class_names[class_id] = bytes(data[position:position + length]).decode('utf-8')
+        position += length
+
+    detections = []
+    for row in record.iter_unpack(bytes(data[offset:table_offset])):
+        class_id, det_flags, confidence, track_id = row[:4]
+        det = {
+            'bbox': list(row[4:8]),
+            'class_name': class_names.get(class_id, f"class_{class_id}"),
+            'confidence': confidence,
+            'class_id': class_id,
+        }
+        if det_flags & DET_TRACKED:
+            det['track_id'] = track_id
+        if det_flags & DET_GEO:
+            det['geo_coordinates'] = {'latitude': row[8], 'longitude': row[9],
+                                      'estimated_ground_distance_m': row[10]}
+        detections.append(det)
+
+    has_pts = not math.isnan(pts)
+    metadata = {
+        'frame': frame,
+        'timestamp': datetime.fromtimestamp(pts).isoformat() if has_pts else None,
+        'pts': pts if has_pts else None,
+        'telemetry': telemetry or None,
+        'detections': detections,
+        'detection_count': count,
+    }
+    if flags & FLAG_OVERLAP:
+        metadata['overlap'] = True
+    return metadata
@@ -0,0 +1,162 @@
+"""
+Delta-encoded per-frame metadata for SSE/WebSocket/UDP consumers.
+
+A full metadata record repeats the whole telemetry dict and every detection
+on every frame. The delta protocol sends that full state only in periodic
+keyframes; in between, a message carries just what changed:
+
+    {"type": "key",   "seq": n, <top-level fields>, "telemetry": {...},
+     "tracks": {"<track_id>": det, ...}, "untracked": [det, ...]}
+
+    {"type": "delta", "seq": n, <top-level fields>, "telemetry": {changed fields},
+     "telemetry_removed": [...], "upsert": {"<track_id>": det, ...},
+     "removed": [track_id, ...], "untracked": [det, ...]}
+
+Top-level scalar fields (frame, timestamp, pts, ...) are copied into every
+message. A tracked detection is re-sent when it appears, when its box moved
+more than ``bbox_threshold`` pixels, when its geolocation moved more than
+``geo_threshold_m`` metres (the camera moves while the box stays put), or when
+its class or confidence changed noticeably; detections without a track id are
+always sent in full. A decoder
+that sees a gap in ``seq`` (e.g. a slow SSE client dropped messages) ignores
+deltas until the next keyframe. ``tests/metadata_delta.js`` is the browser
+counterpart of DeltaDecoder.
+"""
+
+import math
+from typing import Dict, Any, List, Optional
+
+PROTOCOL_FIELDS = ('type', 'seq', 'tracks', 'untracked', 'upsert', 'removed', 'telemetry_removed')
+_STATE_FIELDS = ('telemetry', 'detections', 'detection_count')
+
+
+# Metres per degree of latitude (and of longitude at the equator)
+_METRES_PER_DEGREE = 111_320.0
+
+
+def _geo_moved(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]], threshold_m: float) -> bool:
+    if not old or not new:
+        return bool(old) != bool(new)
+    try:
+        dlat = (new['latitude'] - old['latitude']) * _METRES_PER_DEGREE
+        dlon = (new['longitude'] - old['longitude']) * _METRES_PER_DEGREE * math.cos(math.radians(new['latitude']))
+    except (KeyError, TypeError):
+        return old != new
+    return dlat * dlat + dlon * dlon > threshold_m * threshold_m
+
+
+def _changed(old: Dict[str, Any], new: Dict[str, Any], bbox_threshold: float, conf_threshold: float,
+             geo_threshold_m: float) -> bool:
+    if old.get('class_id') != new.get('class_id'):
+        return True
+    if abs(old.get('confidence', 0.0) - new.get('confidence', 0.0)) > conf_threshold:
+        return True
+    if any(abs(a - b) > bbox_threshold for a, b in zip(old['bbox'], new['bbox'])):
+        return True
+    return _geo_moved(old.get('geo_coordinates'), new.get('geo_coordinates'), geo_threshold_m)
+
+
+class DeltaEncoder:
+    """Turns full per-frame metadata dicts into keyframe/delta messages."""
+
+    def __init__(self, keyframe_interval: int = 30, bbox_threshold: float = 2.0, conf_threshold: float = 0.05,
+                 geo_threshold_m: float = 1.0):
+        self.keyframe_interval = keyframe_interval
+        self.bbox_threshold = bbox_threshold
+        self.conf_threshold = conf_threshold
+        self.geo_threshold_m = geo_threshold_m
+        self._seq = 0
+        self._since_key = None
+        self._telemetry: Dict[str, Any] = {}
+        self._tracks: Dict[int, Dict[str, Any]] = {}
+
+    def force_keyframe(self):
+        """Make the next message a keyframe (e.g. when a new consumer attaches)."""
+        self._since_key = None
+
+    def encode(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        telemetry = metadata.get('telemetry') or {}
+        tracks: Dict[int, Dict[str, Any]] = {}
+        untracked: List[Dict[str, Any]] = []
+        for det in metadata.get('detections', []):
+            if det.get('track_id') is None:
+                untracked.append(det)
+            else:
+                tracks[det['track_id']] = det
+
+        self._seq += 1
+        msg = {k: v for k, v in metadata.items() if k not in _STATE_FIELDS}
+        msg['seq'] = self._seq
+
+        if self._since_key is None or self._since_key + 1 >= self.keyframe_interval:
+            self._since_key = 0
+            msg['type'] = 'key'
+            msg['telemetry'] = telemetry
+            msg['tracks'] = {str(tid): det for tid, det in tracks.items()}
+            msg['untracked'] = untracked
+            self._telemetry = dict(telemetry)
+            self._tracks = tracks
+            return msg
+
+        self._since_key += 1
+        msg['type'] = 'delta'
+        changed_telemetry = {k: v for k, v in telemetry.items() if k not in self._telemetry or self._telemetry[k] != v}
+        removed_telemetry = [k for k in self._telemetry if k not in telemetry]
+        if changed_telemetry:
+            msg['telemetry'] = changed_telemetry
+        if removed_telemetry:
+            msg['telemetry_removed'] = removed_telemetry
+        self._telemetry = dict(telemetry)
+
+        upsert = {}
+        for tid, det in tracks.items():
+            sent = self._tracks.get(tid)
+            if sent is None or _changed(sent, det, self.bbox_threshold, self.conf_threshold,
+                                             self.geo_threshold_m):
+                upsert[str(tid)] = det
+                self._tracks[tid] = det
+        removed = [tid for tid in self._tracks if tid not in tracks]
+        for tid in removed:
+            del self._tracks[tid]
+        if upsert:
+            msg['upsert'] = upsert
+        if removed:
+            msg['removed'] = removed
+        if untracked:
+            msg['untracked'] = untracked
+        return msg
+
+
+class DeltaDecoder:
+    """Reference decoder: rebuilds full metadata dicts from DeltaEncoder messages."""
+
+    def __init__(self):
+        self._seq: Optional[int] = None
+        self._telemetry: Dict[str, Any] = {}
+        self._tracks: Dict[str, Dict[str, Any]] = {}
+
+    def apply(self, msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Full metadata for ``msg``, or None while waiting for a keyframe."""
+        if msg.get('type') == 'key':
+            self._telemetry = dict(msg.get('telemetry', {}))
+            self._tracks = dict(msg.get('tracks', {}))
+        elif msg.get('type') == 'delta':
+            if self._seq is None or msg.get('seq') != self._seq + 1:
+                self._seq = None  # Lost messages: resynchronize on the next keyframe
+                return None
+            self._telemetry.update(msg.get('telemetry', {}))
+            for key in msg.get('telemetry_removed', []):
+                self._telemetry.pop(key, None)
+            self._tracks.update(msg.get('upsert', {}))
+            for tid in msg.get('removed', []):
+                self._tracks.pop(str(tid), None)
+        else:
+            return msg  # Not delta encoded
+        self._seq = msg.get('seq')
+
+        metadata = {k: v for k, v in msg.items() if k not in PROTOCOL_FIELDS and k != 'telemetry'}
+        detections = list(self._tracks.values()) + list(msg.get('untracked', []))
+        metadata['telemetry'] = dict(self._telemetry)
+        metadata['detections'] = detections
+        metadata['detection_count'] = len(detections)
+        return metadata
@@ -0,0 +1,245 @@
+"""
+Persistent detection cache for re-running batch jobs.
+
+Re-rendering a video with a different overlay, encoder or geo setting does not
+change what YOLO sees, so the tracked detections of a previous run can be
+reused. Entries are keyed by the input content, the model weights and every
+setting that affects detections (conf, classes, tracker, frame skipping,
+analytics-only inference size); the processed segment is part of the key too,
+because track ids restart per segment.
+
+Each entry is a directory of memory-mapped ``.npy`` tables:
+
+- frames.npy:     pts_ms, start, count  (sorted by pts_ms, one row per processed frame)
+- detections.npy: class_id, conf, track_id, x1, y1, x2, y2 (rows of frame i are start:start+count)
+- classes.json:   class_id → class_name
+
+Rows are appended to raw files in a temporary directory while the run goes, so
+recording costs constant memory however long the input. An entry is only
+published (atomic rename) after a run drained every frame, so an interrupted
+run never leaves a partial cache behind.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("SRTYOLOUnified.DetCache")
+
+DEFAULT_DETECTION_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "srt-yolo", "detections")
+
+FRAME_DTYPE = np.dtype([('pts_ms', np.int64), ('start', np.int64), ('count', np.int32)])
+DETECTION_DTYPE = np.dtype([
+    ('class_id', np.int32),
+    ('conf', np.float32),
+    ('track_id', np.int64),   # -1 when untracked
+    ('x1', np.float32),
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+])
+
+# Rows buffered in memory before they are appended to the entry's raw files
+_FLUSH_ROWS = 8192
+
+# Bytes hashed from the head, the tail and evenly spaced points of the input
+_SAMPLE_SIZE = 1 << 20
+_SAMPLE_COUNT = 16
+
+
+@lru_cache(maxsize=64)
+def _hash_file(path: str, size: int, mtime: int, sampled: bool) -> str:
+    digest = hashlib.sha256(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        if sampled and size > _SAMPLE_SIZE * (_SAMPLE_COUNT + 2):
+            offsets = [0, size - _SAMPLE_SIZE]
+            offsets += [size * (i + 1) // (_SAMPLE_COUNT + 1) for i in range(_SAMPLE_COUNT)]
+            for offset in sorted(offsets):
+                f.seek(offset)
+                digest.update(f.read(_SAMPLE_SIZE))
+        else:
+            for block in iter(lambda: f.read(_SAMPLE_SIZE), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(path: str, sampled: bool = True) -> str:
+    """
+    Hash of a file's content.
+
+    Large inputs are sampled (size, head, tail and evenly spaced 1 MiB blocks)
+    so keying a multi-GB recording does not cost a full read on every run.
+    """
+    stat = os.stat(path)
+    return _hash_file(os.path.abspath(path), stat.st_size, int(stat.st_mtime), sampled)
+
+
+def model_hash(model_path: str) -> str:
+    """Hash of the model weights, or of the name when the weights are not a local file."""
+    if os.path.isfile(model_path):
+        return content_hash(model_path, sampled=False)
+    return hashlib.sha256(model_path.encode('utf-8')).hexdigest()
+
+
+def cache_key(input_path: str, model_path: str, conf: float, classes, tracker: str,
+              skip_frames: int, segment: Optional[tuple] = None,
+              decode_skip: str = 'none', infer_size: Optional[int] = None) -> str:
+    payload = {
+        'decode_skip': decode_skip,
+        'infer_size': infer_size,
+        'input': content_hash(input_path),
+        'model': model_hash(model_path),
+        'conf': conf,
+        'classes': sorted(classes) if classes else None,
+        'tracker': tracker,
+        'skip_frames': skip_frames,
+        'segment': list(segment) if segment else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:24]
+
+
+class DetectionCacheReader:
+    """Memory-mapped lookup of cached detections by frame pts (milliseconds)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._frames = np.load(os.path.join(path, 'frames.npy'), mmap_mode='r')
+        self._detections = np.load(os.path.join(path, 'detections.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'classes.json'), 'r') as f:
+            self._class_names = {int(k): v for k, v in json.load(f).items()}
+        self._pts = np.asarray(self._frames['pts_ms'])
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def get(self, pts_ms: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        """Detections of the frame at ``pts_ms`` in the pipeline's dict format, or None on a miss."""
+        if pts_ms is None:
+            self.misses += 1
+            return None
+        i = int(np.searchsorted(self._pts, pts_ms))
+        if i >= len(self._pts) or self._pts[i] != pts_ms:
+            self.misses += 1
+            return None
+        self.hits += 1
+        start, count = int(self._frames['start'][i]), int(self._frames['count'][i])
+        detections = []
+        for row in self._detections[start:start + count]:
+            cls_id = int(row['class_id'])
+            det = {
+                'bbox': [float(row['x1']), float(row['y1']), float(row['x2']), float(row['y2'])],
+                'class_name': self._class_names.get(cls_id, f"class_{cls_id}"),
+                'confidence': float(row['conf']),
+                'class_id': cls_id,
+            }
+            if row['track_id'] >= 0:
+                det['track_id'] = int(row['track_id'])
+            detections.append(det)
+        return detections
+
+
+def _raw_to_npy(raw_path: str, npy_path: str, dtype: np.dtype, count: int):
+    """Prefix a raw file of ``count`` records with an .npy header (streamed, never loaded)."""
+    with open(raw_path, 'rb') as raw, open(npy_path, 'wb') as out:
+        np.lib.format.write_array_header_1_0(out, {
+            'descr': np.lib.format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (count,),
+        })
+        shutil.copyfileobj(raw, out, 1 << 20)
+    os.remove(raw_path)
+
+
+class DetectionCacheWriter:
+    """
+    Records detections during a run and publishes them as a cache entry on ``commit``.
+
+    Frame and detection rows are appended to raw files every ``_FLUSH_ROWS``
+    rows; ``commit`` sorts the frame index by pts and wraps both tables as
+    ``.npy``. ``discard`` drops an entry that will not be committed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+        os.makedirs(self._tmp_path)
+        self._frames_file = open(os.path.join(self._tmp_path, 'frames.raw'), 'wb')
+        self._rows_file = open(os.path.join(self._tmp_path, 'detections.raw'), 'wb')
+        self._frames: List[tuple] = []
+        self._rows: List[tuple] = []
+        self.frame_count = 0
+        self.row_count = 0
+        self._class_names: Dict[int, str] = {}
+
+    def add(self, pts_ms: Optional[int], detections: List[Dict[str, Any]]):
+        if pts_ms is None:
+            return
+        self._frames.append((pts_ms, self.row_count, len(detections)))
+        self.frame_count += 1
+        for det in detections:
+            x1, y1, x2, y2 = det['bbox']
+            cls_id = int(det['class_id'])
+            self._class_names.setdefault(cls_id, det.get('class_name', str(cls_id)))
+            track_id = det.get('track_id')
+            self._rows.append((cls_id, det['confidence'], track_id if track_id is not None else -1,
+                               x1, y1, x2, y2))
+        self.row_count += len(detections)
+        if len(self._rows) >= _FLUSH_ROWS or len(self._frames) >= _FLUSH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self._frames:
+            self._frames_file.write(np.array(self._frames, dtype=FRAME_DTYPE).tobytes())
+            self._frames.clear()
+        if self._rows:
+            self._rows_file.write(np.array(self._rows, dtype=DETECTION_DTYPE).tobytes())
+            self._rows.clear()
+
+    def commit(self):
+        self._flush()
+        self._frames_file.close()
+        self._rows_file.close()
+        tmp_path = self._tmp_path
+        # The frame index is small (20 bytes per frame): sorted in memory
+        frames_raw = os.path.join(tmp_path, 'frames.raw')
+        frames = np.fromfile(frames_raw, dtype=FRAME_DTYPE)
+        frames.sort(order='pts_ms', kind='stable')
+        np.save(os.path.join(tmp_path, 'frames.npy'), frames)
+        os.remove(frames_raw)
+        _raw_to_npy(os.path.join(tmp_path, 'detections.raw'), os.path.join(tmp_path, 'detections.npy'),
+                    DETECTION_DTYPE, self.row_count)
+        with open(os.path.join(tmp_path, 'classes.json'), 'w') as f:
+            json.dump({str(k): v for k, v in sorted(self._class_names.items())}, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Detection cache saved: {self.path} ({self.frame_count} frames, {self.row_count} detections)")
+
+    def discard(self):
+        """Drop the recorded rows (incomplete run)."""
+        self._frames_file.close()
+        self._rows_file.close()
+        shutil.rmtree(self._tmp_path, ignore_errors=True)
+
+
+def open_detection_cache(cache_dir: str, key: str):
+    """Return (reader, None) when a complete entry for ``key`` exists, else (None, writer)."""
+    path = os.path.join(cache_dir, key)
+    if os.path.isfile(os.path.join(path, 'classes.json')):
+        try:
+            reader = DetectionCacheReader(path)
+            logger.info(f"Detection cache hit: {path} ({len(reader)} frames)")
+            return reader, None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable detection cache {path}: {e}")
+    os.makedirs(cache_dir, exist_ok=True)
+    logger.info(f"Detection cache miss, recording to {path}")
+    return None, DetectionCacheWriter(path)
@@ -0,0 +1,264 @@
+"""
+x264 encoder profiles and startup auto-tuning.
+
+Every writer used to hardcode its own x264 settings (speed preset, threads,
+bitrate, GOP). Profiles make those settings selectable, and ``auto`` mode
+benchmarks candidate preset/thread combinations on synthetic frames at the
+input resolution, then caches the winner per host and resolution.
+"""
+
+import json
+import logging
+import os
+import socket
+import time
+from typing import Optional, List, Dict, Any
+
+logger = logging.getLogger("SRTYOLOUnified.Encoder")
+
+# x264 speed presets ordered from highest quality (slowest) to lowest quality (fastest)
+X264_PRESETS = ['medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast']
+
+# GstX264EncPreset enum values (x264enc "speed-preset" property)
+GST_SPEED_PRESETS = {
+    'ultrafast': 1,
+    'superfast': 2,
+    'veryfast': 3,
+    'faster': 4,
+    'fast': 5,
+    'medium': 6,
+    'slow': 7,
+    'slower': 8,
+    'veryslow': 9,
+}
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "srt-yolo", "encoder_tuning.json")
+
+
+class EncoderProfile:
+    """
+    A set of x264 settings shared by the GStreamer and FFmpeg based writers.
+
+    ``bitrate_kbps`` and ``crf`` may be None, in which case each writer keeps
+    its own default (streaming writers are bitrate driven, batch is CRF driven).
+    """
+
+    def __init__(self, name: str, preset: str = 'fast', threads: int = 4,
+                 bitrate_kbps: Optional[int] = None, gop_seconds: float = 2.0,
+                 crf: Optional[int] = None):
+        if preset not in GST_SPEED_PRESETS:
+            raise ValueError(f"Unknown x264 preset: {preset}")
+        self.name = name
+        self.preset = preset
+        self.threads = threads
+        self.bitrate_kbps = bitrate_kbps
+        self.gop_seconds = gop_seconds
+        self.crf = crf
+
+    @property
+    def gst_speed_preset(self) -> int:
+        return GST_SPEED_PRESETS[self.preset]
+
+    def key_int_max(self, fps: float) -> int:
+        """GOP length in frames for the given frame rate."""
+        return max(1, int(round(fps * self.gop_seconds)))
+
+    def apply_to_x264enc(self, x264enc, default_bitrate: int, fps: float):
+        """Configure a GStreamer x264enc element (zerolatency tune is left to the caller)."""
+        x264enc.set_property("speed-preset", self.gst_speed_preset)
+        x264enc.set_property("bitrate", self.bitrate_kbps or default_bitrate)
+        x264enc.set_property("key-int-max", self.key_int_max(fps))
+        x264enc.set_property("threads", self.threads)
+
+    def ffmpeg_args(self, default_crf: int, fps: float) -> List[str]:
+        """libx264 arguments for an ffmpeg command line."""
+        args = ['-c:v', 'libx264', '-preset', self.preset,
+                '-threads', str(self.threads), '-g', str(self.key_int_max(fps))]
+        if self.bitrate_kbps:
+            args += ['-b:v', f'{self.bitrate_kbps}k']
+        else:
+            args += ['-crf', str(self.crf if self.crf is not None else default_crf)]
+        return args
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'preset': self.preset,
+            'threads': self.threads,
+            'bitrate_kbps': self.bitrate_kbps,
+            'gop_seconds': self.gop_seconds,
+            'crf': self.crf,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'EncoderProfile':
+        return cls(
+            name=data.get('name', 'custom'),
+            preset=data.get('preset', 'fast'),
+            threads=int(data.get('threads', 4)),
+            bitrate_kbps=data.get('bitrate_kbps'),
+            gop_seconds=float(data.get('gop_seconds', 2.0)),
+            crf=data.get('crf'),
+        )
+
+    def __repr__(self):
+        return (f"EncoderProfile({self.name}: preset={self.preset}, threads={self.threads}, "
+                f"bitrate={self.bitrate_kbps or 'default'}, gop={self.gop_seconds}s)")
+
+
+def _cpu_count() -> int:
+    return os.cpu_count() or 4
+
+
+def builtin_profiles() -> Dict[str, EncoderProfile]:
+    """Named profiles selectable with --encoder-profile (thread counts scale with host cores)."""
+    cores = _cpu_count()
+    return {
+        # Small edge boxes: leave most of the CPU to inference
+        'edge': EncoderProfile('edge', preset='ultrafast', threads=max(1, min(2, cores // 4))),
+        'balanced': EncoderProfile('balanced', preset='veryfast', threads=max(2, cores // 4)),
+        # Large servers: spend spare cores on compression efficiency
+        'quality': EncoderProfile('quality', preset='medium', threads=max(2, cores // 2)),
+    }
+
+
+def _benchmark_candidate(width: int, height: int, fps: float, preset: str, threads: int,
+                         frames: List, warmup: int = 5) -> float:
+    """Encode synthetic frames with libx264 in-process and return achieved frames per second."""
+    import av
+
+    codec = av.CodecContext.create('libx264', 'w')
+    codec.width = width
+    codec.height = height
+    codec.pix_fmt = 'yuv420p'
+    codec.framerate = int(round(fps))
+    codec.options = {
+        'preset': preset,
+        'tune': 'zerolatency',
+        'threads': str(threads),
+    }
+
+    count = 0
+    t0 = None
+    for i, frame in enumerate(frames):
+        if i == warmup:
+            t0 = time.perf_counter()
+        codec.encode(frame)
+        if t0 is not None:
+            count += 1
+    elapsed = time.perf_counter() - t0 if t0 is not None else 0.0
+    try:
+        codec.encode(None)
+    except Exception:
+        pass
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def _synthetic_frames(width: int, height: int, count: int) -> List:
+    """Noisy, moving frames so the encoder has realistic work to do (flat frames are free to encode)."""
+    import av
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        img = np.roll(base, shift=i * 8, axis=1)
+        frame = av.VideoFrame.from_ndarray(img, format='bgr24').reformat(format='yuv420p')
+        frame.pts = i
+        frames.append(frame)
+    return frames
+
+
+def _thread_candidates() -> List[int]:
+    cores = _cpu_count()
+    candidates = sorted({1, 2, 4, max(1, cores // 4), max(1, cores // 2)})
+    return [t for t in candidates if t <= cores]
+
+
+def auto_tune(width: int, height: int, fps: float, headroom: float = 0.3,
+              frames_per_candidate: int = 30) -> EncoderProfile:
+    """
+    Pick the highest quality preset that sustains ``fps * (1 + headroom)``,
+    using the fewest threads that achieve it so the rest stay free for inference.
+    """
+    target = fps * (1.0 + headroom)
+    frames = _synthetic_frames(width, height, frames_per_candidate)
+    threads_list = _thread_candidates()
+    logger.info(f"Auto-tuning x264 for {width}x{height} @ {fps} fps (target {target:.1f} fps, threads {threads_list})")
+
+    best = None
+    for preset in X264_PRESETS:
+        for threads in threads_list:
+            try:
+                achieved = _benchmark_candidate(width, height, fps, preset, threads, frames)
+            except Exception as e:
+                logger.warning(f"Benchmark failed for preset={preset} threads={threads}: {e}")
+                continue
+            logger.debug(f"  preset={preset:<10} threads={threads:<3} → {achieved:.1f} fps")
+            if achieved >= target:
+                return EncoderProfile('auto', preset=preset, threads=threads)
+            best = (preset, threads, achieved) if best is None or achieved > best[2] else best
+
+    # Nothing sustains the target: fall back to the fastest measured setting
+    if best:
+        logger.warning(f"No x264 setting sustains {target:.1f} fps; best was {best[2]:.1f} fps "
+                       f"(preset={best[0]}, threads={best[1]})")
+        return EncoderProfile('auto', preset=best[0], threads=best[1])
+    return EncoderProfile('auto', preset='ultrafast', threads=max(1, _cpu_count() // 2))
+
+
+def _cache_key(width: int, height: int, fps: float) -> str:
+    return f"{socket.gethostname()}/{_cpu_count()}c/{width}x{height}@{int(round(fps))}"
+
+
+def _load_cache(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path: str, cache: Dict[str, Any]):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save encoder tuning cache: {e}")
+
+
+def resolve_encoder_profile(name: Optional[str], width: int, height: int, fps: float,
+                            cache_path: str = DEFAULT_CACHE_PATH) -> Optional[EncoderProfile]:
+    """
+    Resolve --encoder-profile into an EncoderProfile.
+
+    Returns None for the default profile so each writer keeps its historical settings.
+    """
+    if not name or name == 'default':
+        return None
+
+    if name != 'auto':
+        profiles = builtin_profiles()
+        if name not in profiles:
+            raise ValueError(f"Unknown encoder profile: {name} (choose from default, auto, {', '.join(profiles)})")
+        profile = profiles[name]
+        logger.info(f"Using encoder profile {profile}")
+        return profile
+
+    key = _cache_key(width, height, fps)
+    cache = _load_cache(cache_path)
+    if key in cache:
+        profile = EncoderProfile.from_dict(cache[key])
+        logger.info(f"Using cached auto-tuned encoder profile {profile}")
+        return profile
+
+    t0 = time.time()
+    profile = auto_tune(width, height, fps)
+    logger.info(f"Auto-tuned encoder profile {profile} in {time.time() - t0:.1f}s")
+    cache[key] = profile.to_dict()
+    _save_cache(cache_path, cache)
+    return profile
@@ -3,6 +3,15 @@ import logging
 
 logger = logging.getLogger("SRTYOLOUnified.KLV")
 
+# Numeric telemetry fields produced by KLVDecoder. Binary metadata (binmeta.py)
+# relies on this order: only append, and bump its schema version when you do.
+TELEMETRY_FIELDS = [
+    'timestamp_us', 'latitude', 'longitude', 'altitude', 'heading', 'pitch', 'roll',
+    'sensor_h_fov', 'sensor_v_fov', 'gimbal_yaw_rel', 'gimbal_pitch_rel', 'gimbal_roll_rel',
+    'gimbal_yaw_abs', 'gimbal_pitch_abs', 'gimbal_roll_abs',
+    'sensor_width_mm', 'sensor_height_mm', 'focal_length_mm',
+]
+
 class KLVDecoder:
     """Decoder for MISB 0601 KLV metadata."""
 
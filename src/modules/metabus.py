@@ -0,0 +1,190 @@
+"""
+Serialize-once per-frame metadata.
+
+The output thread builds one metadata dict per frame and hands it to up to
+half a dozen sinks (writer, metadata file, UDP, SSE, TAK). Instead of each
+sink calling ``json.dumps`` on the same object, the pipeline wraps the dict in
+a ``FrameMetadata``: every encoding (compact JSON, or any format registered
+with ``register_format``) is produced on first use and the same immutable
+bytes are returned to every later caller. Mutating the dict drops the cached
+encodings.
+
+JSON goes through ``orjson`` when it is installed (several times faster than
+the stdlib, same compact output). ``MetadataBus`` counts encodes, cache hits
+and encode time per format for the performance log.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger("SRTYOLOUnified.MetaBus")
+
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps_json(obj: Any) -> bytes:
+        """Compact JSON bytes; values JSON cannot represent are stringified."""
+        return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS)
+else:
+    def dumps_json(obj: Any) -> bytes:
+        """Compact JSON bytes; values JSON cannot represent are stringified."""
+        return json.dumps(obj, default=str, separators=(',', ':')).encode('utf-8')
+
+
+# name -> fn(dict) -> bytes
+_FORMATS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {'json': dumps_json}
+
+
+def register_format(name: str, encoder: Callable[[Dict[str, Any]], bytes]):
+    """Make ``FrameMetadata.encoded(name)`` available (e.g. a binary schema)."""
+    _FORMATS[name] = encoder
+
+
+class FrameMetadata(dict):
+    """A frame's metadata dict that caches its serialized forms until it is modified."""
+
+    __slots__ = ('_encoded', '_bus')
+
+    def __init__(self, *args, bus: Optional['MetadataBus'] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoded: Dict[str, Any] = {}
+        self._bus = bus
+
+    def encoded(self, fmt: str = 'json') -> bytes:
+        """The ``fmt`` encoding of this frame, computed once."""
+        data = self._encoded.get(fmt)
+        if data is not None:
+            if self._bus:
+                self._bus._record_hit(fmt)
+            return data
+        t0 = time.perf_counter()
+        data = _FORMATS[fmt](self)
+        if self._bus:
+            self._bus._record_encode(fmt, time.perf_counter() - t0)
+        self._encoded[fmt] = data
+        return data
+
+    def json(self) -> bytes:
+        return self.encoded('json')
+
+    def json_text(self) -> str:
+        """Compact JSON as ``str`` for sinks that only take text (decoded once)."""
+        text = self._encoded.get('json_text')
+        if text is None:
+            text = self._encoded['json_text'] = self.json().decode('utf-8')
+        return text
+
+    # Any mutation invalidates the cached encodings
+    def _invalidate(self):
+        self._encoded.clear()
+
+    def __setitem__(self, key, value):
+        self._invalidate()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._invalidate()
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._invalidate()
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._invalidate()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._invalidate()
+        return super().popitem()
+
+    def clear(self):
+        self._invalidate()
+        super().clear()
+
+    def __reduce__(self):
+        # Pickles (e.g. to chunk worker processes) as a plain dict
+        return (dict, (dict(self),))
+
+
+def encode_json(metadata: Dict[str, Any]) -> bytes:
+    """Compact JSON of ``metadata``, reusing the cached bytes of a FrameMetadata."""
+    if isinstance(metadata, FrameMetadata):
+        return metadata.json()
+    return dumps_json(metadata)
+
+
+def encode_json_text(metadata: Dict[str, Any]) -> str:
+    if isinstance(metadata, FrameMetadata):
+        return metadata.json_text()
+    return dumps_json(metadata).decode('utf-8')
+
+
+def with_fields(encoded: bytes, fields: Dict[str, Any]) -> bytes:
+    """
+    Add top-level ``fields`` to an encoded JSON object without re-encoding it.
+
+    Used by sinks that stamp their own fields (e.g. a frame number) onto the
+    shared bytes. Keys already present in ``encoded`` win on parse.
+    """
+    head = dumps_json(fields)
+    if len(encoded) <= 2:  # "{}"
+        return head
+    return head[:-1] + b',' + encoded[1:]
+
+
+class MetadataBus:
+    """Creates FrameMetadata for the output thread and keeps serialization metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._encodes: Dict[str, int] = {}
+        self._hits: Dict[str, int] = {}
+        self._encode_s: Dict[str, float] = {}
+        self.frames = 0
+
+    def frame(self, metadata: Dict[str, Any]) -> FrameMetadata:
+        """Wrap one frame's metadata for the sinks."""
+        self.frames += 1
+        return FrameMetadata(metadata, bus=self)
+
+    def wrap(self, message: Dict[str, Any]) -> FrameMetadata:
+        """Like ``frame`` for a derived message (e.g. a delta) that should not count as a frame."""
+        return FrameMetadata(message, bus=self)
+
+    def _record_encode(self, fmt: str, seconds: float):
+        with self._lock:
+            self._encodes[fmt] = self._encodes.get(fmt, 0) + 1
+            self._encode_s[fmt] = self._encode_s.get(fmt, 0.0) + seconds
+
+    def _record_hit(self, fmt: str):
+        with self._lock:
+            self._hits[fmt] = self._hits.get(fmt, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            formats = {
+                fmt: {
+                    'encodes': count,
+                    'reuses': self._hits.get(fmt, 0),
+                    'encode_ms_total': round(self._encode_s[fmt] * 1000, 2),
+                    'encode_ms_avg': round(self._encode_s[fmt] * 1000 / count, 3),
+                }
+                for fmt, count in self._encodes.items()
+            }
+        return {'frames': self.frames, 'orjson': ORJSON_AVAILABLE, 'formats': formats}
@@ -0,0 +1,106 @@
+"""
+Thread-safe publisher → asyncio subscriber fan-out.
+
+The pipeline publishes from its output thread; HTTP handlers consume on an
+aiohttp event loop. ``publish`` never blocks: it schedules delivery onto the
+loop with ``call_soon_threadsafe``. Every subscriber owns a bounded buffer, so
+subscribers never take messages from each other and a slow one only loses its
+own oldest messages (or, with ``coalesce``, skips straight to the newest one).
+
+Payloads are expected to be pre-serialized bytes, so a message is encoded once
+no matter how many subscribers receive it.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Set
+
+logger = logging.getLogger("SRTYOLOUnified.PubSub")
+
+
+class Subscription:
+    """One subscriber's bounded buffer. Only used on the event loop thread."""
+
+    def __init__(self, max_pending: int = 64, coalesce: bool = False):
+        self.max_pending = max(1, max_pending)
+        self.coalesce = coalesce
+        self._buffer: deque = deque()
+        self._ready = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, payload):
+        if len(self._buffer) >= self.max_pending:
+            if self.coalesce:
+                # Subscriber fell a whole buffer behind: keep only the latest value
+                self.dropped += len(self._buffer)
+                self._buffer.clear()
+            else:
+                self.dropped += 1
+                self._buffer.popleft()
+        self._buffer.append(payload)
+        self.received += 1
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None):
+        """Next payload, or None on timeout or once the subscription is closed."""
+        while not self._buffer:
+            if self.closed:
+                return None
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._buffer.popleft()
+
+
+class AsyncBroadcaster:
+    """Fan out byte payloads published from any thread to asyncio subscribers on ``loop``."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int = 64, coalesce: bool = False):
+        self._loop = loop
+        self.max_pending = max_pending
+        self.coalesce = coalesce
+        self._subscribers: Set[Subscription] = set()
+        self.published = 0
+
+    def subscribe(self) -> Subscription:
+        """Register a subscriber (event loop thread)."""
+        sub = Subscription(self.max_pending, self.coalesce)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+        sub.close()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, payload: bytes):
+        """Queue ``payload`` for every current subscriber. Safe to call from any thread."""
+        if not self._subscribers or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._deliver, payload)
+
+    def _deliver(self, payload: bytes):
+        self.published += 1
+        for sub in self._subscribers:
+            sub.push(payload)
+
+    def _close_all(self):
+        for sub in list(self._subscribers):
+            self.unsubscribe(sub)
+
+    def close(self):
+        """End every subscription (their ``get`` returns None). Safe to call from any thread."""
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._close_all)
@@ -1,90 +1,227 @@
+"""
+Server-Sent Events output (``--sse-port``, path ``/events``).
+
+The server is a single asyncio event loop on a background thread, so a
+thousand subscribers cost a thousand sockets rather than a thousand threads.
+``SSEBroadcaster.publish`` is called from the pipeline's output thread: it
+formats the event (``id:`` + ``data:`` lines) to bytes once, stores it in a
+bounded replay ring and hands it to the loop with one ``call_soon_threadsafe``.
+
+Each subscriber has its own small buffer; a subscriber that falls a whole
+buffer behind skips to the latest event instead of building a backlog.
+Reconnecting clients send ``Last-Event-ID`` (EventSource does this itself) and
+receive the events they missed that are still in the replay ring.
+"""
+
+import asyncio
 import threading
 import logging
-import json
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from typing import Optional, Tuple, List
+
+from .pubsub import Subscription
 
 logger = logging.getLogger("SRTYOLOUnified.SSE")
 
+CORS_HEADERS = (
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: GET, OPTIONS\r\n"
+    b"Access-Control-Allow-Headers: Content-Type, Last-Event-ID\r\n"
+)
+KEEPALIVE_INTERVAL = 15.0
+# Client reconnect delay advertised in the stream (ms)
+RETRY_MS = 2000
+_MAX_HEADER_LINES = 100
+
+
 class SSEBroadcaster:
-    def __init__(self):
-        self._subscribers = []  # list[queue.Queue]
+    """
+    Publish pre-serialized events to SSE subscribers.
+
+    ``publish`` is safe to call from any thread. The subscriber set is
+    copy-on-write: it is replaced, never mutated, so delivery iterates a
+    snapshot without holding a lock.
+    """
+
+    def __init__(self, replay_size: int = 256, max_pending: int = 32):
+        self.max_pending = max_pending
+        self._subscribers: frozenset = frozenset()
         self._lock = threading.Lock()
+        self._replay: deque = deque(maxlen=replay_size)  # (event_id, payload)
+        self._next_id = 1
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
 
-    def subscribe(self):
-        import queue
-        q = queue.Queue(maxsize=1000)
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        """Register a subscriber (event loop thread)."""
+        sub = Subscription(self.max_pending, coalesce=True)
+        with self._lock:
+            self._subscribers = self._subscribers | {sub}
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
         with self._lock:
-            self._subscribers.append(q)
-        return q
+            self._subscribers = self._subscribers - {sub}
+        sub.close()
 
-    def unsubscribe(self, q):
+    def replay_since(self, last_event_id: int) -> List[Tuple[int, bytes]]:
+        """Events newer than ``last_event_id`` that are still in the replay ring."""
         with self._lock:
-            if q in self._subscribers:
-                self._subscribers.remove(q)
+            return [(eid, payload) for eid, payload in self._replay if eid > last_event_id]
 
-    def publish(self, data: str):
-        dead = []
+    def publish(self, data):
+        """Publish one event; ``data`` is a single-line ``str`` or already-encoded bytes."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         with self._lock:
-            for q in list(self._subscribers):
-                try:
-                    q.put_nowait(data)
-                except Exception:
-                    dead.append(q)
-            for q in dead:
-                if q in self._subscribers:
-                    self._subscribers.remove(q)
+            event_id = self._next_id
+            self._next_id += 1
+            payload = b"id: %d\ndata: %s\n\n" % (event_id, data)
+            self._replay.append((event_id, payload))
+        self.published += 1
+        loop = self._loop
+        if self._subscribers and loop is not None and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(self._deliver, (event_id, payload))
+            except RuntimeError:
+                pass  # Loop closed while shutting down
+
+    def _deliver(self, event: Tuple[int, bytes]):
+        for sub in self._subscribers:
+            sub.push(event)
+
+    def _close_all(self):
+        for sub in self._subscribers:
+            self.unsubscribe(sub)
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    headers = {}
+    for _ in range(_MAX_HEADER_LINES):
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    parts = request_line.split()
+    method, target = (parts[0], parts[1]) if len(parts) >= 2 else ('', '')
+    return method.upper(), target, headers
+
+
+def _parse_last_event_id(headers: dict, target: str) -> int:
+    # EventSource sends the header on reconnect; ?lastEventId= lets a fresh page resume too
+    value = headers.get('last-event-id')
+    if value is None and '?' in target:
+        for param in target.split('?', 1)[1].split('&'):
+            key, _, v = param.partition('=')
+            if key == 'lastEventId':
+                value = v
+    try:
+        return int(value) if value else 0
+    except ValueError:
+        return 0
 
 
 def start_sse_server(port: int, broadcaster: SSEBroadcaster, stop_event: threading.Event):
-    class Handler(BaseHTTPRequestHandler):
-        def log_message(self, fmt, *args):
-            logger.debug("SSE: " + fmt % args)
-        
-        def do_OPTIONS(self):
-            self.send_response(200)
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-
-        def do_GET(self):
-            if self.path != '/events':
-                self.send_response(404)
-                self.end_headers()
+    clients = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        clients.add(task)
+        sub = None
+        try:
+            method, target, headers = await asyncio.wait_for(_read_request(reader), 10.0)
+            if method == 'OPTIONS':
+                writer.write(b"HTTP/1.1 200 OK\r\n" + CORS_HEADERS + b"Content-Length: 0\r\n\r\n")
+                await writer.drain()
                 return
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/event-stream')
-            self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'keep-alive')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-
-            q = broadcaster.subscribe()
-            try:
-                self.wfile.write(b":\n\n")
-                self.wfile.flush()
-                while not stop_event.is_set():
-                    try:
-                        data = q.get(timeout=0.5)
-                    except Exception:
+            if method != 'GET' or target.split('?', 1)[0] != '/events':
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\n"
+                         b"Connection: keep-alive\r\n" + CORS_HEADERS + b"\r\n")
+            writer.write(f"retry: {RETRY_MS}\n:\n\n".encode('ascii'))
+
+            # Subscribe before reading the ring so nothing published in between is lost;
+            # events seen in both are skipped by id
+            sub = broadcaster.subscribe()
+            last_sent = _parse_last_event_id(headers, target)
+            if last_sent:
+                for event_id, payload in broadcaster.replay_since(last_sent):
+                    writer.write(payload)
+                    last_sent = event_id
+            await writer.drain()
+
+            while not stop_event.is_set():
+                event = await sub.get(timeout=KEEPALIVE_INTERVAL)
+                if event is None:
+                    if sub.closed:
+                        break
+                    writer.write(b": keepalive\n\n")
+                else:
+                    event_id, payload = event
+                    if event_id <= last_sent:
                         continue
-                    payload = f"data: {data}\n\n".encode('utf-8')
-                    self.wfile.write(payload)
-                    self.wfile.flush()
-            except Exception:
-                pass
-            finally:
-                broadcaster.unsubscribe(q)
+                    writer.write(payload)
+                    last_sent = event_id
+                await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.debug(f"SSE client error: {e}")
+        finally:
+            if sub is not None:
+                broadcaster.unsubscribe(sub)
+                if sub.dropped:
+                    logger.debug(f"SSE client skipped {sub.dropped} events while behind")
+            writer.close()
+            clients.discard(task)
 
-    server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    holder = {}
 
-    def serve():
-        logger.info(f"SSE server listening on :{port} at /events")
+    async def watch_stop():
         while not stop_event.is_set():
-            server.handle_request()
+            await asyncio.sleep(0.5)
+        broadcaster._close_all()
+
+    async def main():
+        server = await asyncio.start_server(handle, '0.0.0.0', port, backlog=1024)
+        holder['server'] = server
+        broadcaster._loop = loop
+        started.set()
+        logger.info(f"SSE server listening on :{port} at /events")
+        async with server:
+            await watch_stop()
+            # Subscriptions are closed; let handlers finish, cancel clients still sending a request
+            if clients:
+                _, pending = await asyncio.wait(set(clients), timeout=2.0)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(main())
+        except Exception as e:
+            logger.error(f"SSE server error: {e}")
+        finally:
+            broadcaster._loop = None
+            started.set()
+            loop.close()
 
     t = threading.Thread(target=serve, name="sse-server", daemon=True)
     t.start()
-    return server
+    started.wait(timeout=5.0)
+    return holder.get('server')
@@ -1,380 +1,337 @@
-import socket
 import ssl
 import threading
-import queue
 import time
 import uuid
 import logging
+import itertools
+from collections import OrderedDict
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from .tak_transport import TAKTransport, SessionReuseContext
+from .udp import parse_target
 from datetime import datetime, timezone
 
 logger = logging.getLogger("SRTYOLOUnified.TAK")
 
+# CoT event as a precompiled byte template (filled with bytes %-formatting, no XML building per message)
+_COT_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<event version="2.0" uid="%s" type="%s" time="%s" start="%s" stale="%s" how="m-g">\n'
+    '<point lat="%.6f" lon="%.6f" hae="%.1f" ce="10.0" le="10.0"/>\n'
+    '<detail>\n'
+    '<contact callsign="%s" endpoint="*:-1:stcp"/>\n'
+    '<uid Droid="%s"/>\n'
+    '<__group name="Yellow" role="Team Member"/>\n'
+    '<status battery="100"/>\n'
+    '<takv device="YOLO Detection" platform="Python Pipeline" os="Linux" version="1.0"/>\n'
+    '<track speed="0.0" course="%.1f"/>\n'
+    '<remarks>%s | Distance: %.0fm | Camera: Az=%.1f° El=%.1f° | Conf=%.1f%%</remarks>\n'
+    '<precisionlocation altsrc="DTED0" geopointsrc="Photogrammetry"/>\n'
+    '</detail>\n'
+    '</event>\n'
+).encode('utf-8')
+
+_COT_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def cot_times(now, stale_seconds):
+    """(time, stale) attribute values for every message of a batch sent at ``now``."""
+    return (datetime.fromtimestamp(now, timezone.utc).strftime(_COT_TIME_FORMAT).encode('ascii'),
+            datetime.fromtimestamp(now + stale_seconds, timezone.utc).strftime(_COT_TIME_FORMAT).encode('ascii'))
+
+
+@lru_cache(maxsize=1024)
+def _class_fields(class_name):
+    """Escaped class name and CoT type, computed once per class."""
+    hostile_classes = ['weapon', 'gun', 'threat']
+    class_lower = class_name.lower()
+    cot_type = b"a-h-G-U-C" if any(h in class_lower for h in hostile_classes) else b"a-n-G-U-C"
+    return escape(class_name, {'"': '&quot;'}).encode('utf-8'), cot_type
+
+
 class TAKCoTSender:
     """
-    TAK Server Cursor on Target (CoT) message sender with async queue.
-    Uses background thread to send messages without blocking main pipeline.
+    TAK Server Cursor on Target (CoT) message sender.
+    
+    A timer thread turns the per-track state table into CoT messages and hands
+    them to a TAKTransport (asyncio, one link per server) without blocking the
+    main pipeline. ``servers`` (``host[:port]`` strings or tuples) fans out to
+    several TAK servers; by default only ``host:port``.
     """
     
     def __init__(self, host='localhost', port=8089, cert_file='certs/user1.pem', 
                  key_file='certs/user1.key', cert_password='atakatak', 
-                 enabled=False, stale_time_seconds=600):
+                 enabled=False, stale_time_seconds=600, servers=None, queue_size=1000):
         self.host = host
         self.port = port
+        self.servers = ([parse_target(s, port) if isinstance(s, str) else tuple(s) for s in servers]
+                        if servers else [(host, port)])
         self.cert_file = cert_file
         self.key_file = key_file
         self.cert_password = cert_password
         self.enabled = enabled
         self.stale_time_seconds = stale_time_seconds
         self.ssl_context = None
-        self.connection = None
-        self.ssl_socket = None
-        self.connected = False
-        self.lock = threading.Lock()
-        
-        # Async queue for non-blocking sends
-        self.message_queue = queue.Queue(maxsize=1000)
-        self.sender_thread = None
+        self.queue_size = queue_size  # Per-server backlog bound
+        self.transport = None
         self.batch_timer_thread = None
         self.stop_event = threading.Event()
-        self.messages_sent = 0
-        self.messages_dropped = 0
-        self.ready = False  # Flag to indicate TAK is connected and ready
         
-        # Rate limiting: Track last send time per track_id
-        self.last_send_time = {}  # {track_id: timestamp}
+        # Per-track latest state: {uid: {'detection', 'frame_num', 'updated', 'last_sent', 'priority'}}
+        # updated in place every frame, ordered by last update (oldest first) for eviction
+        self.tracks = OrderedDict()
+        self.tracks_lock = threading.Lock()
         self.update_interval = 3.0  # Send updates every 3 seconds per track
-        self.rate_limit_lock = threading.Lock()
+        self.tick_seconds = 0.5  # How often the timer looks for due tracks
+        self.max_tracks = 2000  # Bound on the state table (least recently updated evicted)
+        self.track_timeout = 60.0  # Forget tracks not seen for this long
+        self.tracks_evicted = 0
         
-        # Aggregation settings
-        self.max_detections_per_batch = 5  # Maximum detections to send per batch
-        self.batch_window_seconds = 5.0  # Time window for batching detections (send every 5 seconds)
-        self.pending_detections = []  # Queue for pending detections
-        self.last_batch_send_time = 0  # Last time we sent a batch
-        self.batch_lock = threading.Lock()
+        # Untracked uids: random per sender so a restart never reuses another run's markers,
+        # then a slot per class (table) or a counter (one-off messages; no uuid4 per message)
+        self._session = uuid.uuid4().hex[:8].encode('ascii')
+        self._untracked_ids = itertools.count()
         
         if self.enabled:
             self._setup_ssl_context()
-            self._start_sender_thread()
-            self._start_batch_timer_thread()
+            if self.enabled:  # Certificates loaded
+                self.transport = TAKTransport(self.servers, self._make_ssl_context, queue_size=queue_size)
+                logger.info(f"✅ TAK transport started: {', '.join(f'{h}:{p}' for h, p in self.servers)}")
+                self._start_batch_timer_thread()
+    
+    @property
+    def ready(self):
+        """True while at least one TAK server is connected."""
+        return self.transport is not None and self.transport.connected
+    
+    @property
+    def messages_sent(self):
+        return sum(link.messages_sent for link in self.transport.links) if self.transport else 0
+    
+    @property
+    def messages_dropped(self):
+        return sum(link.messages_dropped for link in self.transport.links) if self.transport else 0
+    
+    def _make_ssl_context(self):
+        """New client SSL context with the certificates loaded (one per server, for TLS session reuse)."""
+        context = SessionReuseContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        try:
+            context.load_cert_chain(certfile=self.cert_file, keyfile=self.key_file, password=self.cert_password)
+        except Exception:
+            # Try without password
+            context.load_cert_chain(certfile=self.cert_file, keyfile=self.key_file)
+        return context
     
     def _setup_ssl_context(self):
         """Setup SSL context with certificates."""
         try:
-            self.ssl_context = ssl.create_default_context()
-            self.ssl_context.check_hostname = False
-            self.ssl_context.verify_mode = ssl.CERT_NONE
-            
-            # Try to load certificates
-            try:
-                self.ssl_context.load_cert_chain(
-                    certfile=self.cert_file,
-                    keyfile=self.key_file,
-                    password=self.cert_password
-                )
-                logger.info(f"✅ TAK certificates loaded: {self.cert_file}")
-            except Exception as cert_error:
-                logger.warning(f"⚠️ TAK certificate loading failed: {cert_error}")
-                try:
-                    # Try without password
-                    self.ssl_context.load_cert_chain(
-                        certfile=self.cert_file,
-                        keyfile=self.key_file
-                    )
-                    logger.info(f"✅ TAK certificates loaded (no password): {self.cert_file}")
-                except Exception as e:
-                    logger.error(f"❌ Failed to load TAK certificates: {e}")
-                    self.enabled = False
+            self.ssl_context = self._make_ssl_context()
+            logger.info(f"✅ TAK certificates loaded: {self.cert_file}")
         except Exception as e:
-            logger.error(f"❌ Failed to setup SSL context: {e}")
+            logger.error(f"❌ Failed to load TAK certificates: {e}")
             self.enabled = False
     
-    def connect(self):
-        """Establish connection to TAK server."""
-        if not self.enabled:
-            return False
-        
-        with self.lock:
-            try:
-                if self.connected:
-                    return True
-                
-                logger.info(f"🔌 Connecting to TAK server: {self.host}:{self.port}")
-                self.connection = socket.create_connection((self.host, self.port), timeout=15)
-                self.ssl_socket = self.ssl_context.wrap_socket(
-                    self.connection, 
-                    server_hostname=self.host
-                )
-                self.connected = True
-                logger.info(f"✅ TAK server connected: {self.host}:{self.port}")
-                return True
-            except Exception as e:
-                logger.error(f"❌ TAK connection failed: {e}")
-                self.connected = False
-                return False
-    
-    def _start_sender_thread(self):
-        """Start background thread for sending TAK messages."""
-        self.sender_thread = threading.Thread(target=self._sender_worker, daemon=True)
-        self.sender_thread.start()
-        logger.info("✅ TAK sender thread started")
-    
     def _start_batch_timer_thread(self):
         """Start background thread for periodic batch sending."""
         self.batch_timer_thread = threading.Thread(target=self._batch_timer_worker, daemon=True)
         self.batch_timer_thread.start()
         logger.info("✅ TAK batch timer thread started")
     
-    def _sender_worker(self):
-        """Background worker thread that processes the message queue."""
-        # Wait for initial connection before marking as ready
-        if not self.connect():
-            logger.error("❌ TAK initial connection failed, sender thread will retry")
-        else:
-            self.ready = True  # Mark as ready once connected
-        
-        while not self.stop_event.is_set():
-            try:
-                # Wait for message with timeout to allow checking stop_event
-                try:
-                    message = self.message_queue.get(timeout=1.0)
-                except queue.Empty:
-                    continue
-                
-                # Ensure connected
-                if not self.connected:
-                    if not self.connect():
-                        self.messages_dropped += 1
-                        continue
-                    else:
-                        self.ready = True  # Mark as ready after reconnection
-                
-                # Send message
-                try:
-                    with self.lock:
-                        self.ssl_socket.send(message.encode('utf-8'))
-                        self.messages_sent += 1
-                except Exception as send_error:
-                    logger.warning(f"⚠️ TAK send failed: {send_error}")
-                    self.connected = False
-                    self.ready = False  # Mark as not ready when connection fails
-                    self.messages_dropped += 1
-                    
-            except Exception as e:
-                logger.error(f"Error in TAK sender thread: {e}")
-                time.sleep(1)  # Avoid tight loop on errors
-    
     def _batch_timer_worker(self):
-        """Background worker thread that sends batches every 5 seconds."""
+        """Background worker thread that emits the latest state of every due track."""
         while not self.stop_event.is_set():
             try:
-                # Wait for 5 seconds
-                if self.stop_event.wait(self.batch_window_seconds):
+                if self.stop_event.wait(self.tick_seconds):
                     break  # Stop event was set
-                
-                # Check if we have pending detections and it's time to send
-                with self.batch_lock:
-                    current_time = time.time()
-                    time_since_last = current_time - self.last_batch_send_time
-                    
-                    if (len(self.pending_detections) > 0 and 
-                        time_since_last >= self.batch_window_seconds):
-                        
-                        total_pending = len(self.pending_detections)
-                        
-                        # Select up to max_detections_per_batch detections (drop excess)
-                        detections_to_send = self.pending_detections[:self.max_detections_per_batch]
-                        
-                        # Remove sent detections from pending queue
-                        self.pending_detections = self.pending_detections[self.max_detections_per_batch:]
-                        
-                        # Update last batch send time
-                        self.last_batch_send_time = current_time
-                        
-                        # Send the batch
-                        if detections_to_send:
-                            self._send_detection_batch(detections_to_send)
-                            
+                if self.ready:
+                    self._send_due_tracks(time.time())
             except Exception as e:
                 logger.error(f"Error in TAK batch timer thread: {e}")
                 time.sleep(1)  # Avoid tight loop on errors
     
     def disconnect(self):
-        """Close connection to TAK server and stop sender thread."""
-        # Send any remaining pending detections before disconnecting
-        with self.batch_lock:
-            if self.pending_detections:
-                logger.info(f"📡 Sending {len(self.pending_detections)} remaining detections before disconnect")
-                self._send_detection_batch(self.pending_detections)
-                self.pending_detections = []
+        """Flush changed tracks, stop the timer and close the TAK connections."""
+        # Send the latest state of tracks that changed since their last update
+        if self.ready:
+            self._send_due_tracks(time.time(), flush=True)
         
         self.stop_event.set()
-        if self.sender_thread and self.sender_thread.is_alive():
-            self.sender_thread.join(timeout=2.0)
         if self.batch_timer_thread and self.batch_timer_thread.is_alive():
             self.batch_timer_thread.join(timeout=2.0)
         
-        with self.lock:
-            try:
-                if self.ssl_socket:
-                    self.ssl_socket.close()
-                if self.connection:
-                    self.connection.close()
-                self.connected = False
-                logger.info(f"🔌 TAK server disconnected (sent: {self.messages_sent}, dropped: {self.messages_dropped})")
-            except Exception as e:
-                logger.debug(f"Error disconnecting from TAK: {e}")
+        if self.transport:
+            self.transport.close(timeout=2.0)
+            for server in self.transport.stats():
+                logger.info(f"🔌 TAK server {server['server']} disconnected (sent: {server['messages_sent']}, "
+                            f"dropped: {server['messages_dropped']}, backlog: {server['backlog']}, "
+                            f"latency: {server['latency_ms']}ms avg / {server['max_latency_ms']}ms max)")
+        logger.info(f"TAK tracks evicted: {self.tracks_evicted}")
     
-    def build_cot_message(self, detection, frame_num=0):
+    def build_cot_message(self, detection, frame_num=0, uid=None, times=None):
         """
-        Build CoT XML message from detection data.
+        Build CoT XML message (bytes) from detection data.
+        
+        ``times`` is the (time, stale) pair from ``cot_times``, shared by a batch.
         """
         try:
-            # Extract required data
-            class_name = detection.get('class_name', 'Unknown')
             geo_coords = detection.get('geo_coordinates')
-            track_id = detection.get('track_id')
-            
             if not geo_coords:
                 return None
             
             latitude = geo_coords.get('latitude')
             longitude = geo_coords.get('longitude')
-            
             if latitude is None or longitude is None:
                 return None
             
-            # Generate UID for this detection
-            if track_id is not None:
-                uid = f"YOLO-{class_name}-{track_id}"
-            else:
-                uid = f"YOLO-{class_name}-{frame_num}-{str(uuid.uuid4())[:8]}"
+            class_name, cot_type = _class_fields(detection.get('class_name', 'Unknown'))
+            track_id = detection.get('track_id')
+            confidence = detection.get('confidence', 0.0) * 100
             
-            # Build callsign
-            confidence = detection.get('confidence', 0.0)
             if track_id is not None:
-                callsign = f"{class_name}_ID{track_id}_{confidence:.0%}"
+                track = str(track_id).encode('ascii')
+                if uid is None:
+                    uid = b"YOLO-%s-%s" % (class_name, track)
+                callsign = b"%s_ID%s_%.0f%%" % (class_name, track, confidence)
+                remarks = b"Tracked: %s (ID:%s)" % (class_name, track)
             else:
-                callsign = f"{class_name}_{confidence:.0%}"
-            
-            # Time information
-            now = datetime.now(timezone.utc)
-            time_str = now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            stale_time = datetime.fromtimestamp(
-                now.timestamp() + self.stale_time_seconds, 
-                timezone.utc
-            ).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                if uid is None:
+                    uid = b"YOLO-%s-untracked-%s-m%d" % (class_name, self._session, next(self._untracked_ids))
+                callsign = b"%s_%.0f%%" % (class_name, confidence)
+                remarks = b"Detected: %s" % class_name
+            if isinstance(uid, str):
+                uid = escape(uid, {'"': '&quot;'}).encode('utf-8')
             
-            # Altitude (default to ground level if not available)
-            altitude = geo_coords.get('altitude', 0.0)
-            
-            # Distance and camera info for remarks
-            distance = geo_coords.get('estimated_ground_distance_m', 0)
+            if times is None:
+                times = cot_times(time.time(), self.stale_time_seconds)
+            time_str, stale_time = times
             camera_az = geo_coords.get('camera_azimuth_deg', 0)
-            camera_el = geo_coords.get('camera_elevation_deg', 0)
-            
-            # CoT type: a-f-G = friendly ground (can customize based on class_name)
-            cot_type = self._get_cot_type(class_name)
             
-            # Build CoT XML
-            cot_xml = f'''<?xml version="1.0" encoding="UTF-8"?>
-<event version="2.0" uid="{uid}" type="{cot_type}" time="{time_str}" start="{time_str}" stale="{stale_time}" how="m-g">
-<point lat="{latitude:.6f}" lon="{longitude:.6f}" hae="{altitude:.1f}" ce="10.0" le="10.0"/>
-<detail>
-<contact callsign="{callsign}" endpoint="*:-1:stcp"/>
-<uid Droid="{callsign}"/>
-<__group name="Yellow" role="Team Member"/>
-<status battery="100"/>
-<takv device="YOLO Detection" platform="Python Pipeline" os="Linux" version="1.0"/>
-<track speed="0.0" course="{camera_az:.1f}"/>
-<remarks>{"Tracked" if track_id else "Detected"}: {class_name}{f" (ID:{track_id})" if track_id else ""} | Distance: {distance:.0f}m | Camera: Az={camera_az:.1f}° El={camera_el:.1f}° | Conf={confidence:.1%}</remarks>
-<precisionlocation altsrc="DTED0" geopointsrc="Photogrammetry"/>
-</detail>
-</event>
-'''
-            return cot_xml
+            return _COT_TEMPLATE % (
+                uid, cot_type, time_str, time_str, stale_time,
+                latitude, longitude, geo_coords.get('altitude', 0.0),
+                callsign, callsign, camera_az,
+                remarks, geo_coords.get('estimated_ground_distance_m', 0), camera_az,
+                geo_coords.get('camera_elevation_deg', 0), confidence,
+            )
             
         except Exception as e:
             logger.debug(f"Error building CoT message: {e}")
             return None
     
     def _get_cot_type(self, class_name):
-        """Map detection class to CoT type."""
-        hostile_classes = ['weapon', 'gun', 'threat']
-        class_lower = class_name.lower()
-        if any(h in class_lower for h in hostile_classes):
-            return "a-h-G-U-C"  # hostile
-        else:
-            return "a-n-G-U-C"  # neutral (default for detections)
+        """Map detection class to CoT type: a-h hostile, a-n neutral (default for detections)."""
+        return _class_fields(class_name)[1].decode('ascii')
+    
+    def _priority(self, detection):
+        """Hostile before neutral, tracked before one-off detections."""
+        hostile = self._get_cot_type(detection.get('class_name', 'Unknown')).startswith('a-h')
+        return (2 if hostile else 0) + (1 if detection.get('track_id') is not None else 0)
+    
+    def _track_uid(self, detection, slot):
+        class_name = detection.get('class_name', 'Unknown')
+        track_id = detection.get('track_id')
+        if track_id is not None:
+            return f"YOLO-{class_name}-{track_id}"
+        # Untracked objects have no identity across frames: the n-th one of a class in
+        # each frame reuses the same marker, so TAK sees a few moving markers, not a new one per frame
+        return f"YOLO-{class_name}-untracked-{self._session.decode('ascii')}-{slot}"
     
     def send_detection(self, detection, frame_num=0):
         """Queue a detection for TAK server sending."""
-        if not self.enabled:
-            return False
+        return self.send_detections([detection], frame_num) > 0
+    
+    def send_detections(self, detections, frame_num=0):
+        """
+        Record the latest state of every geolocated detection of a frame.
         
-        # Don't queue messages until TAK is connected and ready
-        if not self.ready:
-            return False
-
-        current_time = time.time()
+        Takes the table lock once per frame; the batch timer sends the freshest
+        state of each track when it is due. Returns the number of detections
+        recorded.
+        """
+        if not self.enabled:
+            return 0
         
-        # Add detection to pending queue with timestamp
-        with self.batch_lock:
-            self.pending_detections.append({
-                'detection': detection,
-                'frame_num': frame_num,
-                'timestamp': current_time
-            })
+        now = time.time()
+        tracks = self.tracks
+        count = 0
+        untracked = {}  # class -> slots used in this frame
+        with self.tracks_lock:
+            for detection in detections:
+                if not detection.get('geo_coordinates'):
+                    continue
+                slot = 0
+                if detection.get('track_id') is None:
+                    class_name = detection.get('class_name', 'Unknown')
+                    slot = untracked.get(class_name, 0)
+                    untracked[class_name] = slot + 1
+                uid = self._track_uid(detection, slot)
+                entry = tracks.get(uid)
+                if entry is None:
+                    entry = tracks[uid] = {'last_sent': 0.0, 'priority': self._priority(detection)}
+                else:
+                    tracks.move_to_end(uid)
+                entry['detection'] = detection
+                entry['frame_num'] = frame_num
+                entry['updated'] = now
+                count += 1
             
-            # Limit queue size to prevent memory issues - keep only recent detections
-            if len(self.pending_detections) > 20:
-                self.pending_detections = self.pending_detections[-20:]
+            # Bounded memory: drop the least recently updated tracks
+            while len(tracks) > self.max_tracks:
+                tracks.popitem(last=False)
+                self.tracks_evicted += 1
+        return count
+    
+    def _send_due_tracks(self, now, flush=False):
+        """Queue CoT updates for tracks due at ``now``: hostile first, then longest without an update."""
+        cutoff = now - self.track_timeout
+        due = []
+        with self.tracks_lock:
+            tracks = self.tracks
+            # Oldest updates first: expire until the first live track
+            while tracks:
+                uid, entry = next(iter(tracks.items()))
+                if entry['updated'] >= cutoff:
+                    break
+                del tracks[uid]
+                self.tracks_evicted += 1
+            for uid, entry in tracks.items():
+                if entry['updated'] <= entry['last_sent']:
+                    continue  # Nothing new since the last update
+                if not flush and now - entry['last_sent'] < self.update_interval:
+                    continue
+                due.append((uid, entry))
             
-            return True
+            due.sort(key=lambda item: (-item[1]['priority'], item[1]['last_sent']))
+            # Only as many as the connected servers' backlogs still hold, so no queued
+            # update is dropped; the rest stay due for the next tick
+            due = due[:self.transport.free_space() if self.transport else self.queue_size]
+            batch = []
+            for uid, entry in due:
+                entry['last_sent'] = now
+                batch.append((uid, entry['detection'], entry['frame_num']))
+        
+        return self._send_detection_batch(batch)
     
     def _send_detection_batch(self, detection_batch):
-        """Send a batch of detections to TAK server."""
-        try:
-            success_count = 0
-            
-            for item in detection_batch:
-                detection = item['detection']
-                frame_num = item['frame_num']
-                
-                # Rate limiting: Check if we should send this track_id
-                track_id = detection.get('track_id')
-                if track_id is not None:
-                    with self.rate_limit_lock:
-                        last_time = self.last_send_time.get(track_id, 0)
-                        time_since_last = time.time() - last_time
-                        
-                        # Skip if we sent this track_id too recently
-                        if time_since_last < self.update_interval:
-                            continue  # Skip this detection
-                        
-                        # Update last send time
-                        self.last_send_time[track_id] = time.time()
-                        
-                        # Clean up old track_ids (older than 60 seconds)
-                        if len(self.last_send_time) > 1000:
-                            cutoff_time = time.time() - 60.0
-                            self.last_send_time = {
-                                tid: t for tid, t in self.last_send_time.items() 
-                                if t > cutoff_time
-                            }
-                
-                # Build and queue CoT message
-                cot_message = self.build_cot_message(detection, frame_num)
-                if cot_message:
-                    try:
-                        self.message_queue.put_nowait(cot_message)
-                        success_count += 1
-                    except queue.Full:
-                        self.messages_dropped += 1
-                        if self.messages_dropped % 100 == 1:
-                            logger.warning(f"⚠️ TAK queue full, {self.messages_dropped} messages dropped so far")
-            
-            return success_count > 0
-                    
-        except Exception as e:
-            logger.debug(f"Error sending TAK batch: {e}")
-            return False
+        """Build and publish CoT messages for a batch of (uid, detection, frame_num)."""
+        times = cot_times(time.time(), self.stale_time_seconds)
+        messages = []
+        for uid, detection, frame_num in detection_batch:
+            cot_message = self.build_cot_message(detection, frame_num, uid=uid, times=times)
+            if cot_message:
+                messages.append(cot_message)
+        if messages and self.transport:
+            self.transport.publish(messages)
+        return len(messages)
+    
+    def stats(self):
+        with self.tracks_lock:
+            tracks = len(self.tracks)
+        return {
+            'tracks': tracks,
+            'tracks_evicted': self.tracks_evicted,
+            'servers': self.transport.stats() if self.transport else [],
+        }
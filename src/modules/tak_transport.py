@@ -0,0 +1,324 @@
+"""
+Asyncio TLS transport for CoT: fan-out to several TAK servers.
+
+Each server gets its own ``TAKServerLink``: a bounded backlog of encoded CoT
+messages and a task on one asyncio loop (daemon thread "tak-transport") that
+connects, writes and reconnects on its own. ``publish`` only appends to the
+backlogs and wakes the loop, so the caller never blocks, and a server that is
+down or slow only fills (and then trims) its own backlog while the healthy
+ones keep receiving.
+
+- Reconnects use exponential backoff with jitter, so a fleet of senders does
+  not hammer a recovering server in lockstep.
+- The TLS session of the last connection is offered again on reconnect
+  (``SessionReuseContext``), so the server can resume it with an abbreviated
+  handshake.
+- Everything queued for a server goes out as one write per wakeup (up to
+  MAX_WRITE_BYTES).
+- ``stats()`` reports per-server backlog, write latency (enqueue until the
+  bytes are accepted by the socket), handshake time and counters.
+"""
+
+import asyncio
+import logging
+import random
+import ssl
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("SRTYOLOUnified.TAK")
+
+# Upper bound on the bytes coalesced into one TLS write
+MAX_WRITE_BYTES = 256 * 1024
+
+
+class SessionReuseContext(ssl.SSLContext):
+    """
+    Client SSLContext that resumes ``tls_session`` on the next handshake.
+
+    asyncio has no ``session=`` argument; it calls ``wrap_bio`` for every
+    connection, so the session is injected there.
+    """
+
+    tls_session = None
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        session = session or self.tls_session
+        try:
+            return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                    server_hostname=server_hostname, session=session)
+        except ValueError:
+            # Session not resumable with this context: full handshake
+            self.tls_session = None
+            return super().wrap_bio(incoming, outgoing, server_side=server_side, server_hostname=server_hostname)
+
+
+class TAKServerLink:
+    """Connection, backlog and metrics for one TAK server."""
+
+    def __init__(self, host: str, port: int, context: ssl.SSLContext, queue_size: int = 1000,
+                 connect_timeout: float = 10.0, backoff_min: float = 0.5, backoff_max: float = 30.0):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.context = context
+        self.queue_size = queue_size
+        self.connect_timeout = connect_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.flush_timeout = 2.0  # Set by TAKTransport.close; read when the stop arrives
+
+        # (enqueued monotonic time, message); shared with the publishing thread
+        self._backlog: deque = deque()
+        self._backlog_bytes = 0
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.connected = False
+        self.connects = 0
+        self.sessions_reused = 0
+        self.failures = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.bytes_sent = 0
+        self.writes = 0
+        self.handshake_ms = None
+        self.latency_ms = None  # EWMA of enqueue -> written
+        self.max_latency_ms = 0.0
+        self.last_error = None
+
+    def enqueue(self, messages: List[bytes], now: float):
+        """Called from any thread; drops the oldest messages beyond ``queue_size``."""
+        with self._lock:
+            backlog = self._backlog
+            for message in messages:
+                backlog.append((now, message))
+                self._backlog_bytes += len(message)
+            while len(backlog) > self.queue_size:
+                self._backlog_bytes -= len(backlog.popleft()[1])
+                self.messages_dropped += 1
+
+    def free_space(self) -> int:
+        """Messages the backlog takes before it starts dropping the oldest."""
+        return max(0, self.queue_size - len(self._backlog))
+
+    def _take(self) -> Tuple[float, List[bytes]]:
+        """Oldest enqueue time and the messages for one write."""
+        messages = []
+        size = 0
+        with self._lock:
+            backlog = self._backlog
+            oldest = backlog[0][0] if backlog else 0.0
+            while backlog and size < MAX_WRITE_BYTES:
+                message = backlog.popleft()[1]
+                messages.append(message)
+                size += len(message)
+            self._backlog_bytes -= size
+        return oldest, messages
+
+    async def run(self, stop: asyncio.Event):
+        failures = 0
+        while not stop.is_set():
+            connection = await self._connect()
+            if connection is None:
+                failures += 1
+                # Exponential backoff with equal jitter
+                delay = min(self.backoff_max, self.backoff_min * 2 ** min(failures - 1, 16))
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            failures = 0
+            reader, writer = connection
+            try:
+                await self._pump(reader, writer, stop)
+                if stop.is_set():
+                    await asyncio.wait_for(self._flush(writer), timeout=self.flush_timeout)
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                logger.warning(f"⚠️ TAK {self.name} connection lost: {self.last_error}")
+            finally:
+                await self._close(writer)
+
+    async def _connect(self):
+        t0 = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.context, server_hostname=self.host),
+                timeout=self.connect_timeout)
+        except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            error = str(e) or type(e).__name__
+            if error != self.last_error:
+                logger.warning(f"⚠️ TAK {self.name} connection failed: {error} (retrying with backoff)")
+            self.last_error = error
+            return None
+
+        self.handshake_ms = (time.perf_counter() - t0) * 1000
+        ssl_object = writer.get_extra_info('ssl_object')
+        reused = bool(ssl_object and ssl_object.session_reused)
+        self.sessions_reused += reused
+        self.connects += 1
+        self.connected = True
+        self.last_error = None
+        logger.info(f"✅ TAK server connected: {self.name} ({self.handshake_ms:.0f}ms"
+                    f"{', TLS session resumed' if reused else ''})")
+        return reader, writer
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, stop: asyncio.Event):
+        # TAK servers send pings and may close the stream: read and discard so
+        # closure is noticed and TLS 1.3 session tickets are processed
+        incoming = asyncio.ensure_future(self._discard(reader))
+        stopping = asyncio.ensure_future(stop.wait())
+        try:
+            while not incoming.done() and not stop.is_set():
+                self._wakeup.clear()
+                if not self._backlog:
+                    wakeup = asyncio.ensure_future(self._wakeup.wait())
+                    await asyncio.wait((wakeup, incoming, stopping), return_when=asyncio.FIRST_COMPLETED)
+                    wakeup.cancel()
+                    continue
+                await self._write(writer)
+            if incoming.done() and not stop.is_set():
+                error = None if incoming.cancelled() else incoming.exception()
+                raise error or ConnectionResetError("closed by server")
+        finally:
+            incoming.cancel()
+            stopping.cancel()
+
+    async def _write(self, writer: asyncio.StreamWriter):
+        oldest, messages = self._take()
+        if not messages:
+            return
+        data = b''.join(messages)
+        try:
+            writer.write(data)
+            await writer.drain()
+        except Exception:
+            self.messages_dropped += len(messages)
+            raise
+        latency = (time.monotonic() - oldest) * 1000
+        self.latency_ms = latency if self.latency_ms is None else 0.9 * self.latency_ms + 0.1 * latency
+        self.max_latency_ms = max(self.max_latency_ms, latency)
+        self.messages_sent += len(messages)
+        self.bytes_sent += len(data)
+        self.writes += 1
+
+    async def _flush(self, writer: asyncio.StreamWriter):
+        while self._backlog:
+            await self._write(writer)
+
+    @staticmethod
+    async def _discard(reader: asyncio.StreamReader):
+        while await reader.read(65536):
+            pass
+
+    async def _close(self, writer: asyncio.StreamWriter):
+        self.connected = False
+        ssl_object = writer.get_extra_info('ssl_object')
+        if ssl_object is not None and isinstance(self.context, SessionReuseContext):
+            try:
+                self.context.tls_session = ssl_object.session
+            except (ValueError, ssl.SSLError):
+                pass
+        writer.close()
+        try:
+            await asyncio.wait_for(writer.wait_closed(), timeout=1.0)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'server': self.name,
+            'connected': self.connected,
+            'connects': self.connects,
+            'sessions_reused': self.sessions_reused,
+            'failures': self.failures,
+            'backlog': len(self._backlog),
+            'backlog_bytes': self._backlog_bytes,
+            'messages_sent': self.messages_sent,
+            'messages_dropped': self.messages_dropped,
+            'bytes_sent': self.bytes_sent,
+            'writes': self.writes,
+            'handshake_ms': round(self.handshake_ms, 1) if self.handshake_ms is not None else None,
+            'latency_ms': round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            'max_latency_ms': round(self.max_latency_ms, 2),
+            'last_error': self.last_error,
+        }
+
+
+class TAKTransport:
+    """One asyncio loop thread driving a ``TAKServerLink`` per server."""
+
+    def __init__(self, servers: Iterable[Tuple[str, int]], context_factory: Callable[[], ssl.SSLContext],
+                 queue_size: int = 1000, **link_options):
+        self.links = [TAKServerLink(host, port, context_factory(), queue_size, **link_options)
+                      for host, port in servers]
+        self._loop = asyncio.new_event_loop()
+        self._stop: Optional[asyncio.Event] = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tak-transport", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._stop = asyncio.Event()
+        for link in self.links:
+            link._wakeup = asyncio.Event()
+        self._started.set()
+        try:
+            self._loop.run_until_complete(
+                asyncio.gather(*(link.run(self._stop) for link in self.links)))
+        except Exception as e:
+            logger.error(f"TAK transport stopped: {e}")
+        finally:
+            self._loop.close()
+
+    def publish(self, messages: List[bytes]):
+        """Queue encoded CoT messages for every server (never blocks)."""
+        if not messages:
+            return
+        now = time.monotonic()
+        for link in self.links:
+            link.enqueue(messages, now)
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    def _wake(self):
+        for link in self.links:
+            link._wakeup.set()
+
+    @property
+    def connected(self) -> bool:
+        return any(link.connected for link in self.links)
+
+    def free_space(self) -> int:
+        """
+        Messages every connected server's backlog still takes (all servers when none is connected).
+
+        A server that is down only trims its own backlog, so it does not hold
+        back the healthy ones.
+        """
+        links = [link for link in self.links if link.connected] or self.links
+        return min((link.free_space() for link in links), default=0)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [link.stats() for link in self.links]
+
+    def close(self, timeout: float = 2.0):
+        """Flush what connected servers can take within ``timeout`` and stop the loop."""
+        for link in self.links:
+            link.flush_timeout = timeout
+        try:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        except RuntimeError:
+            return
+        self._thread.join(timeout=timeout + 1.0)
@@ -0,0 +1,244 @@
+"""
+UDP metadata publisher: unicast and multicast targets, sequence numbers, MTU chunking.
+
+One ``publish`` serves every consumer: targets can be any mix of unicast hosts
+and multicast groups (a multicast group reaches any number of listeners on the
+LAN with a single datagram). Each message gets a sequence number and a send
+timestamp, and payloads larger than the MTU are split into chunks that
+``UDPMetadataReassembler`` puts back together on the receiving side.
+
+Datagram layout (little-endian, 24-byte header, then payload bytes):
+
+    offset  size  field
+    0       2     magic        "SY"
+    2       1     version      (1)
+    3       1     format       (0 = JSON, 1 = binmeta)
+    4       4     seq          (uint32 message sequence number)
+    8       2     chunk        (index of this chunk)
+    10      2     chunks       (number of chunks in the message)
+    12      8     sent_at      (float64 epoch seconds)
+    20      4     length       (uint32 total payload length)
+
+Python has no ``sendmmsg``; the closest batched path is used instead: every
+datagram of a message is prepared before the send loop, and each is sent with
+a single ``sendmsg`` of [header, payload slice] so chunk payloads are never
+copied. The socket is non-blocking and a datagram the kernel cannot take is
+dropped and counted rather than stalling the pipeline.
+
+``raw_targets`` (or ``raw=True`` for every target) get the bare payload with
+no header or chunking, the historical format, for consumers that predate the
+framing (``json.loads(datagram)``).
+"""
+
+import ipaddress
+import logging
+import socket
+import struct
+import time
+from collections import OrderedDict, namedtuple
+from typing import List, Tuple, Optional, Dict, Any, Iterable
+
+logger = logging.getLogger("SRTYOLOUnified.UDP")
+
+MAGIC = b'SY'
+VERSION = 1
+FORMAT_JSON = 0
+FORMAT_BINARY = 1
+HEADER = struct.Struct('<2sBBIHHdI')
+
+# Ethernet MTU minus IPv4 and UDP headers
+DEFAULT_MTU = 1472
+MAX_CHUNKS = 0xFFFF
+
+UDPMessage = namedtuple('UDPMessage', ['seq', 'sent_at', 'format', 'payload'])
+
+
+def parse_target(spec: str, default_port: int = 5555) -> Tuple[str, int]:
+    """``host``, ``host:port`` or ``[ipv6]:port`` → (host, port)."""
+    if spec.startswith('['):
+        host, _, rest = spec[1:].partition(']')
+        return host, int(rest.lstrip(':') or default_port)
+    if spec.count(':') == 1:
+        host, port = spec.split(':')
+        return host, int(port)
+    return spec, default_port
+
+
+def _is_multicast(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_multicast
+    except ValueError:
+        return False
+
+
+class UDPMetadataPublisher:
+    """Send each metadata message to every unicast/multicast target."""
+
+    def __init__(self, targets: Iterable[Tuple[str, int]], mtu: int = DEFAULT_MTU, ttl: int = 1,
+                 interface: Optional[str] = None, loopback: bool = True, raw: bool = False,
+                 raw_targets: Iterable[Tuple[str, int]] = ()):
+        self.targets: List[Tuple[str, int]] = []
+        self.raw_targets: List[Tuple[str, int]] = []
+        self.mtu = mtu
+        self.raw = raw
+        self._chunk_size = mtu - HEADER.size
+        self._seq = 0
+
+        self.messages_sent = 0
+        self.datagrams_sent = 0
+        self.bytes_sent = 0
+        self.datagrams_dropped = 0
+        self.oversize_dropped = 0
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        multicast = False
+        for host, port, bare in [(h, p, raw) for h, p in targets] + [(h, p, True) for h, p in raw_targets]:
+            if _is_multicast(host):
+                multicast = True
+            else:
+                # Resolve once instead of on every sendto
+                host = socket.gethostbyname(host)
+            (self.raw_targets if bare else self.targets).append((host, port))
+        if multicast:
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1 if loopback else 0)
+            if interface:
+                self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+        if self.targets:
+            logger.info(f"UDP metadata → {', '.join(f'{h}:{p}' for h, p in self.targets)} (mtu {mtu})")
+        if self.raw_targets:
+            logger.info(f"UDP metadata → {', '.join(f'{h}:{p}' for h, p in self.raw_targets)} (raw)")
+
+    def _datagrams(self, payload: bytes, fmt: int) -> List[List[bytes]]:
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        chunks = max(1, -(-len(payload) // self._chunk_size))
+        if chunks > MAX_CHUNKS:
+            return []
+        sent_at = time.time()
+        view = memoryview(payload)
+        return [[HEADER.pack(MAGIC, VERSION, fmt, self._seq, i, chunks, sent_at, len(payload)),
+                 view[i * self._chunk_size:(i + 1) * self._chunk_size]]
+                for i in range(chunks)]
+
+    def _send(self, datagrams: List[List[bytes]], targets: List[Tuple[str, int]]):
+        sendmsg = self._sock.sendmsg
+        for address in targets:
+            for buffers in datagrams:
+                try:
+                    self.bytes_sent += sendmsg(buffers, (), 0, address)
+                    self.datagrams_sent += 1
+                except (BlockingIOError, OSError):
+                    # Socket buffer full or payload over the path MTU in raw mode
+                    self.datagrams_dropped += 1
+
+    def publish(self, payload: bytes, fmt: int = FORMAT_JSON):
+        """Send one message (any size) to every target."""
+        if self.raw_targets:
+            self._send([[payload]], self.raw_targets)
+        if self.targets:
+            datagrams = self._datagrams(payload, fmt)
+            if not datagrams:
+                self.oversize_dropped += 1
+                return
+            self._send(datagrams, self.targets)
+        self.messages_sent += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'targets': len(self.targets) + len(self.raw_targets),
+            'messages_sent': self.messages_sent,
+            'datagrams_sent': self.datagrams_sent,
+            'bytes_sent': self.bytes_sent,
+            'datagrams_dropped': self.datagrams_dropped,
+            'oversize_dropped': self.oversize_dropped,
+        }
+
+    def close(self):
+        self._sock.close()
+
+
+class UDPMetadataReassembler:
+    """
+    Receive-side helper: feed datagrams, get complete messages back.
+
+    Incomplete messages are evicted after ``timeout`` seconds or when more than
+    ``max_pending`` are in flight; ``lost`` counts messages that never
+    completed or never arrived (gaps in ``seq``). Datagrams without a valid
+    header (a raw target, e.g. ``--metadata-host``) are returned as-is with
+    ``seq`` None; a bare binmeta payload starts with "SYMB", so the magic alone
+    does not identify a header.
+    """
+
+    def __init__(self, max_pending: int = 32, timeout: float = 2.0):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._last_seq: Optional[int] = None
+        self.completed = 0
+        self.lost = 0
+
+    def _track_seq(self, seq: int):
+        if self._last_seq is None:
+            self._last_seq = seq
+            return
+        ahead = (seq - self._last_seq) & 0xFFFFFFFF
+        if 0 < ahead < 0x80000000:  # Newer message (with uint32 wrap-around)
+            self.lost += ahead - 1
+            self._last_seq = seq
+
+    def feed(self, datagram: bytes, now: Optional[float] = None) -> Optional[UDPMessage]:
+        if len(datagram) < HEADER.size or datagram[:2] != MAGIC:
+            return UDPMessage(None, None, None, datagram)
+        magic, version, fmt, seq, chunk, chunks, sent_at, length = HEADER.unpack_from(datagram)
+        body = datagram[HEADER.size:]
+        if (version != VERSION or fmt not in (FORMAT_JSON, FORMAT_BINARY) or chunk >= chunks
+                or len(body) > length or (chunks == 1 and len(body) != length)):
+            return UDPMessage(None, None, None, datagram)
+        if chunks == 1:
+            self._track_seq(seq)
+            self.completed += 1
+            return UDPMessage(seq, sent_at, fmt, body)
+
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        entry = self._pending.get(seq)
+        if entry is None:
+            self._track_seq(seq)
+            entry = self._pending[seq] = {'parts': [None] * chunks, 'received': 0, 'started': now}
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                self.lost += 1
+        parts = entry['parts']
+        if chunks != len(parts) or parts[chunk] is not None:
+            return None
+        parts[chunk] = body
+        entry['received'] += 1
+        if entry['received'] < len(parts):
+            return None
+        del self._pending[seq]
+        payload = b''.join(parts)
+        if len(payload) != length:
+            self.lost += 1
+            return None
+        self.completed += 1
+        return UDPMessage(seq, sent_at, fmt, payload)
+
+    def _expire(self, now: float):
+        while self._pending:
+            seq, entry = next(iter(self._pending.items()))
+            if now - entry['started'] < self.timeout:
+                break
+            del self._pending[seq]
+            self.lost += 1
+
+
+def open_receiver(port: int, group: Optional[str] = None, interface: str = '0.0.0.0') -> socket.socket:
+    """UDP socket bound to ``port`` (joined to multicast ``group`` when given) for consumers."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    if group:
+        membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton(interface))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    return sock
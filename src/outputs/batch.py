@@ -3,13 +3,17 @@ Batch video processing output - saves annotated video + JSON metadata.
 """
 
 import cv2
-import json
 import logging
 import os
+import queue
 import subprocess
+import threading
 from typing import Dict, Any, Optional
 import numpy as np
 
+from .metadata_stream import StreamingMetadataWriter, metadata_filename
+from .columnar import ColumnarDetectionWriter
+
 logger = logging.getLogger("SRTYOLOUnified.Batch")
 
 
@@ -19,10 +23,19 @@ class BatchVideoWriter:
     """
     Batch processing writer that saves:
     - Annotated video file (MP4) - named after input file
-    - Complete JSON metadata for all frames - named after input file
+    - Complete JSON metadata for all frames - named after input file,
+      streamed to disk as frames arrive (json array or jsonl, optionally compressed)
+    - Optional columnar detection/telemetry tables (Parquet or .npy) for analytics
+
+    Frames are handed to a dedicated encoder thread through a bounded queue, so a
+    slow libx264 only stalls the pipeline once that queue is full. The encoder is
+    either an ffmpeg subprocess fed through its stdin pipe, or in-process PyAV.
+    With ``video=False`` (analytics-only runs) no video is encoded at all.
     """
 
-    def __init__(self, output_dir: str, width: int, height: int, fps: float, input_filename: Optional[str] = None):
+    def __init__(self, output_dir: str, width: int, height: int, fps: float, input_filename: Optional[str] = None,
+                 encoder_profile=None, metadata_format: str = 'json', metadata_compression: str = 'none',
+                 columnar: bool = False, encoder: str = 'ffmpeg', queue_depth: int = 32, video: bool = True):
         self.start_time = time.time()
         self.output_dir = output_dir
         self.width = width
@@ -38,29 +51,56 @@ class BatchVideoWriter:
         else:
             base_name = "output"
         
-        self.video_filename = f"{base_name}.mp4"
-        self.json_filename = f"{base_name}.json"
-        
-        video_path = os.path.join(output_dir, self.video_filename)
+        self.video = video
+        self.video_filename = f"{base_name}.mp4" if video else None
+        self.json_filename = metadata_filename(base_name, metadata_format, metadata_compression)
         
-        # Metadata storage
-        self.metadata = {
-            "video_info": {
+        # Metadata is serialized on a background thread as frames arrive
+        self.metadata_writer = StreamingMetadataWriter(
+            os.path.join(output_dir, self.json_filename),
+            video_info={
                 "width": width,
                 "height": height,
                 "fps": fps,
                 "output_file": self.video_filename,
                 "input_file": input_filename or "unknown"
             },
-            "frames": []
-        }
+            fmt=metadata_format,
+            compression=metadata_compression
+        )
+        
+        self.columnar = ColumnarDetectionWriter(output_dir, base_name) if columnar else None
         
         logger.info(f"Batch writer initialized:")
-        logger.info(f"  Video: {video_path} ({width}x{height} @ {fps} fps)")
+        self.encoder = encoder if video else None
+        self.process = None
+        self._av_container = None
+        if video:
+            video_path = os.path.join(output_dir, self.video_filename)
+            logger.info(f"  Video: {video_path} ({width}x{height} @ {fps} fps)")
+            if encoder == 'pyav':
+                self._open_pyav(video_path, encoder_profile)
+            else:
+                self._open_ffmpeg(video_path, encoder_profile)
         logger.info(f"  JSON:  {os.path.join(output_dir, self.json_filename)}")
         
+        # Encoder feed: frame references only, the encoder thread does the copy into the pipe
+        self._feed_queue = queue.Queue(maxsize=queue_depth)
+        self.frames_encoded = 0
+        self.encode_blocked_s = 0.0   # Time the encoder thread spent blocked writing to ffmpeg / encoding
+        self.feed_blocked_s = 0.0     # Time the pipeline spent waiting for space in the feed queue
+        self.max_backlog = 0
+        # First encoder failure; the video is incomplete and later frames are not encoded
+        self.error: Optional[str] = None
+        self._encoder_thread = None
+        if video:
+            self._encoder_thread = threading.Thread(target=self._encoder_worker, name="batch-encoder", daemon=True)
+            self._encoder_thread.start()
+
+    def _open_ffmpeg(self, video_path, encoder_profile):
         # Initialize FFmpeg process for on-the-fly compression
         # This replaces cv2.VideoWriter which produces large files
+        width, height, fps = self.width, self.height, self.fps
         self.ffmpeg_cmd = [
             'ffmpeg', '-y',
             '-f', 'rawvideo',
@@ -69,9 +109,16 @@ class BatchVideoWriter:
             '-pix_fmt', 'bgr24',
             '-r', str(fps),
             '-i', '-',
-            '-c:v', 'libx264',
-            '-crf', '28',        # High compression
-            '-preset', 'fast',
+        ]
+        if encoder_profile:
+            self.ffmpeg_cmd += encoder_profile.ffmpeg_args(default_crf=28, fps=fps)
+        else:
+            self.ffmpeg_cmd += [
+                '-c:v', 'libx264',
+                '-crf', '28',        # High compression
+                '-preset', 'fast',
+            ]
+        self.ffmpeg_cmd += [
             '-movflags', '+faststart',
             video_path
         ]
@@ -82,39 +129,137 @@ class BatchVideoWriter:
                 self.ffmpeg_cmd, 
                 stdin=subprocess.PIPE, 
                 stdout=subprocess.DEVNULL, 
-                stderr=subprocess.DEVNULL
+                stderr=subprocess.DEVNULL,
+                bufsize=0  # Unbuffered: write() hands the frame memory straight to the pipe
             )
         except Exception as e:
             logger.error(f"Failed to start FFmpeg: {e}")
             raise RuntimeError(f"FFmpeg start failed: {e}")
 
-    def write_frame(self, frame: np.ndarray):
-        """Write annotated frame to video file via FFmpeg pipe."""
-        if frame.shape[0] != self.height or frame.shape[1] != self.width:
-            frame = cv2.resize(frame, (self.width, self.height))
+    def _open_pyav(self, video_path, encoder_profile):
+        """In-process libx264 encoder (yuv420p); avoids the raw BGR pipe entirely."""
+        import av
         
-        try:
-            self.process.stdin.write(frame.tobytes())
-        except Exception as e:
-            logger.error(f"Error writing frame to FFmpeg: {e}")
+        logger.info("Starting in-process PyAV encoder...")
+        self._av_container = av.open(video_path, mode='w', options={'movflags': '+faststart'})
+        self._av_stream = self._av_container.add_stream('libx264', rate=int(round(self.fps)))
+        self._av_stream.width = self.width
+        self._av_stream.height = self.height
+        self._av_stream.pix_fmt = 'yuv420p'
+        options = {
+            'preset': encoder_profile.preset if encoder_profile else 'fast',
+            'crf': str(encoder_profile.crf if encoder_profile and encoder_profile.crf is not None else 28),
+        }
+        if encoder_profile:
+            options['threads'] = str(encoder_profile.threads)
+            options['g'] = str(encoder_profile.key_int_max(self.fps))
+            if encoder_profile.bitrate_kbps:
+                options['b'] = f"{encoder_profile.bitrate_kbps}k"
+                del options['crf']
+        self._av_stream.codec_context.options = options
+        self._av_pts = 0
+
+    def _encode(self, frame: np.ndarray):
+        if self._av_container is not None:
+            import av
+            vframe = av.VideoFrame.from_ndarray(frame, format='bgr24')
+            vframe.pts = self._av_pts
+            self._av_pts += 1
+            for packet in self._av_stream.encode(vframe):
+                self._av_container.mux(packet)
+        else:
+            # memoryview over the array: no tobytes() copy before the pipe write
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+
+    def _encoder_worker(self):
+        while True:
+            frame = self._feed_queue.get()
+            if frame is None:
+                break
+            if frame.shape[0] != self.height or frame.shape[1] != self.width:
+                frame = cv2.resize(frame, (self.width, self.height))
+            if self.error:
+                continue  # Keep draining so the pipeline never blocks on a dead encoder
+            t0 = time.perf_counter()
+            try:
+                self._encode(frame)
+                self.frames_encoded += 1
+            except Exception as e:
+                logger.error(f"Error writing frame to encoder: {e} (video output stopped)")
+                self.error = f"encoder: {e}"
+            self.encode_blocked_s += time.perf_counter() - t0
+
+    def write_frame(self, frame: np.ndarray):
+        """Hand the annotated frame to the encoder thread (blocks only when the feed queue is full)."""
+        if self._encoder_thread is None:
+            return
+        backlog = self._feed_queue.qsize()
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+        t0 = time.perf_counter()
+        self._feed_queue.put(frame)
+        self.feed_blocked_s += time.perf_counter() - t0
+
+    def stats(self) -> Dict[str, Any]:
+        """Encoder backlog and blocking times; feed_blocked_s > 0 means encoding is the bottleneck."""
+        return {
+            'encoder': self.encoder,
+            'frames_encoded': self.frames_encoded,
+            'backlog': self._feed_queue.qsize(),
+            'max_backlog': self.max_backlog,
+            'encode_blocked_s': round(self.encode_blocked_s, 3),
+            'feed_blocked_s': round(self.feed_blocked_s, 3),
+        }
 
     def inject_metadata(self, metadata: Dict[str, Any]):
-        """Store metadata for this frame."""
-        self.metadata["frames"].append(metadata)
+        """Queue metadata for this frame for streaming serialization."""
+        self.metadata_writer.write_frame(metadata)
+        if self.columnar:
+            self.columnar.add_frame(metadata)
 
-    def close(self):
-        """Finalize video and write JSON metadata."""
-        # Close ffmpeg stdin to signal EOF and wait for process to finish
-        if self.process:
-            self.process.stdin.close()
-            self.process.wait()
-            logger.info(f"Video saved: {self.output_dir}/{self.video_filename} ({len(self.metadata['frames'])} frames)")
+    def close(self, summary: Optional[Dict[str, Any]] = None):
+        """Finalize video and write JSON metadata (``summary`` is added to its footer)."""
+        stats = None
+        if self._encoder_thread is not None:
+            self._close_video()
+            stats = self.stats()
+            logger.info(f"Video saved: {self.output_dir}/{self.video_filename} "
+                        f"(encoder={stats['encoder']}, max backlog={stats['max_backlog']}, "
+                        f"encode={stats['encode_blocked_s']:.1f}s, pipeline blocked on encoder={stats['feed_blocked_s']:.1f}s)")
         
-        # Write JSON metadata
+        # Drain the metadata stream and write its footer
         json_path = os.path.join(self.output_dir, self.json_filename)
-        with open(json_path, 'w') as f:
-            json.dump(self.metadata, f, indent=2, default=str)
+        footer = dict(summary or {})
+        if stats:
+            footer['encoder'] = stats
+        frames = self.metadata_writer.close(footer)
+        if self.columnar:
+            self.columnar.close()
         
         elapsed = time.time() - self.start_time
-        logger.info(f"Metadata saved: {json_path}")
-        logger.info(f"Batch processing complete! Total time: {elapsed:.2f}s ({len(self.metadata['frames']) / elapsed:.1f} fps)")
+        logger.info(f"Metadata saved: {json_path} ({frames} frames, {self.metadata_writer.bytes_written / 1e6:.1f} MB)")
+        logger.info(f"Batch processing complete! Total time: {elapsed:.2f}s ({frames / elapsed:.1f} fps)")
+
+    def _close_video(self):
+        # Drain the encoder feed, then close the encoder
+        self._feed_queue.put(None)
+        self._encoder_thread.join()
+        if self._av_container is not None:
+            try:
+                if not self.error:
+                    for packet in self._av_stream.encode(None):
+                        self._av_container.mux(packet)
+                self._av_container.close()
+            except Exception as e:
+                self.error = self.error or f"encoder: {e}"
+        if self.process:
+            # Close ffmpeg stdin to signal EOF and wait for process to finish
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass  # ffmpeg already gone: reported through its exit status
+            returncode = self.process.wait()
+            if returncode != 0:
+                self.error = self.error or f"ffmpeg exited with status {returncode}"
+        if self.error:
+            logger.error(f"Video {self.video_filename} is incomplete: {self.error}")
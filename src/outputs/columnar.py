@@ -0,0 +1,157 @@
+"""
+Columnar detection export for analytics.
+
+Writes two tables alongside the batch video:
+
+- detections: frame, pts, class_id, conf, track_id, x1, y1, x2, y2, lat, lon
+- telemetry:  frame, pts and one float64 column per KLV field
+
+Rows are buffered and flushed as row groups while the run progresses. Parquet
+is used when pyarrow is installed; otherwise each table becomes a directory of
+memory-mappable ``.npy`` column files (``np.load(path, mmap_mode='r')``).
+"""
+
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Any, List
+
+import numpy as np
+
+from ..modules.klv import TELEMETRY_FIELDS
+
+logger = logging.getLogger("SRTYOLOUnified.Columnar")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+DETECTION_SCHEMA = [
+    ('frame', np.int64),
+    ('pts', np.float64),
+    ('class_id', np.int32),
+    ('conf', np.float32),
+    ('track_id', np.int64),   # -1 when untracked
+    ('x1', np.float32),
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+    ('lat', np.float64),      # NaN without geolocation
+    ('lon', np.float64),
+]
+
+TELEMETRY_SCHEMA = [('frame', np.int64), ('pts', np.float64)] + [(f, np.float64) for f in TELEMETRY_FIELDS]
+
+
+class _ColumnBuffer:
+    """Row buffer for one table, flushed as a row group to Parquet or appended to raw column files."""
+
+    def __init__(self, path: str, schema: List[tuple], use_parquet: bool):
+        self.path = path
+        self.schema = schema
+        self.use_parquet = use_parquet
+        self.columns: Dict[str, list] = {name: [] for name, _ in schema}
+        self.rows = 0
+        self.pending = 0
+        self._parquet_writer = None
+        self._raw_files = None
+
+        if use_parquet:
+            arrow_schema = pa.schema([(name, pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in schema])
+            self._parquet_writer = pq.ParquetWriter(path, arrow_schema, compression='zstd')
+        else:
+            os.makedirs(path, exist_ok=True)
+            # Raw little-endian column data; converted to .npy (header + data) on close
+            self._raw_files = {name: open(os.path.join(path, f"{name}.raw"), 'wb') for name, _ in schema}
+
+    def append(self, row: tuple):
+        for (name, _), value in zip(self.schema, row):
+            self.columns[name].append(value)
+        self.pending += 1
+
+    def flush(self):
+        if not self.pending:
+            return
+        arrays = {name: np.asarray(self.columns[name], dtype=dtype) for name, dtype in self.schema}
+        if self._parquet_writer is not None:
+            table = pa.table({name: arrays[name] for name, _ in self.schema})
+            self._parquet_writer.write_table(table)
+        else:
+            for name, _ in self.schema:
+                arrays[name].tofile(self._raw_files[name])
+        self.rows += self.pending
+        self.pending = 0
+        for values in self.columns.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            return
+        for name, dtype in self.schema:
+            raw_file = self._raw_files[name]
+            raw_file.close()
+            raw_path = raw_file.name
+            npy_path = os.path.join(self.path, f"{name}.npy")
+            with open(npy_path, 'wb') as out, open(raw_path, 'rb') as src:
+                header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                          'fortran_order': False, 'shape': (self.rows,)}
+                np.lib.format.write_array_header_1_0(out, header)
+                shutil.copyfileobj(src, out, length=1 << 20)
+            os.remove(raw_path)
+
+
+class ColumnarDetectionWriter:
+    """Accumulates per-frame metadata into detection/telemetry tables written in row groups."""
+
+    def __init__(self, output_dir: str, base_name: str, row_group_size: int = 65536, force_npy: bool = False):
+        self.use_parquet = PARQUET_AVAILABLE and not force_npy
+        self.row_group_size = row_group_size
+        suffix = '.parquet' if self.use_parquet else ''
+        self.detections_path = os.path.join(output_dir, f"{base_name}_detections{suffix}")
+        self.telemetry_path = os.path.join(output_dir, f"{base_name}_telemetry{suffix}")
+        self._detections = _ColumnBuffer(self.detections_path, DETECTION_SCHEMA, self.use_parquet)
+        self._telemetry = _ColumnBuffer(self.telemetry_path, TELEMETRY_SCHEMA, self.use_parquet)
+        self._class_names: Dict[int, str] = {}
+        logger.info(f"Columnar export ({'parquet' if self.use_parquet else 'npy'}): "
+                    f"{self.detections_path}, {self.telemetry_path}")
+
+    def add_frame(self, metadata: Dict[str, Any]):
+        frame = int(metadata.get('frame', 0))
+        pts = float(metadata.get('pts', np.nan))
+
+        for det in metadata.get('detections', []):
+            x1, y1, x2, y2 = det['bbox']
+            geo = det.get('geo_coordinates') or {}
+            class_id = int(det.get('class_id', -1))
+            self._class_names.setdefault(class_id, det.get('class_name', str(class_id)))
+            track_id = det.get('track_id')
+            self._detections.append((
+                frame, pts, class_id, det.get('confidence', 0.0),
+                track_id if track_id is not None else -1,
+                x1, y1, x2, y2,
+                geo.get('latitude', np.nan), geo.get('longitude', np.nan),
+            ))
+
+        telemetry = metadata.get('telemetry') or {}
+        self._telemetry.append((frame, pts) + tuple(
+            telemetry.get(f, np.nan) if telemetry.get(f) is not None else np.nan for f in TELEMETRY_FIELDS))
+
+        if self._detections.pending >= self.row_group_size:
+            self._detections.flush()
+        if self._telemetry.pending >= self.row_group_size:
+            self._telemetry.flush()
+
+    def close(self):
+        self._detections.close()
+        self._telemetry.close()
+        # class_id → class_name lookup so the tables stay purely numeric
+        classes_path = (self.detections_path[:-len('.parquet')] if self.use_parquet else self.detections_path) + "_classes.json"
+        with open(classes_path, 'w') as f:
+            json.dump({str(k): v for k, v in sorted(self._class_names.items())}, f, indent=2)
+        logger.info(f"Columnar export saved: {self._detections.rows} detections, {self._telemetry.rows} telemetry rows")
@@ -1,6 +1,7 @@
-import json
 import logging
 
+from ..modules.metabus import encode_json_text
+
 logger = logging.getLogger("SRTYOLOUnified.File")
 
 class FileLogger:
@@ -16,6 +17,6 @@ class FileLogger:
     def log(self, metadata):
         try:
             with open(self.filepath, 'a') as f:
-                f.write(json.dumps(metadata, default=str) + "\n")
+                f.write(encode_json_text(metadata) + "\n")
         except Exception as e:
             logger.error(f"Error logging to file: {e}")
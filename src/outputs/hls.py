@@ -1,10 +1,10 @@
 import sys
 import logging
 import time
-import json
 import os
 import struct
 from .rtsp import RTSPWriter, _try_import_gi
+from ..modules.metabus import encode_json
 
 logger = logging.getLogger("SRTYOLOUnified.HLS")
 
@@ -56,12 +56,13 @@ def create_id3v2_frame(json_data: str) -> bytes:
 
 
 class HLSWriter(RTSPWriter):
-    def __init__(self, output_dir, width, height, fps, id3_interval=30):
+    def __init__(self, output_dir, width, height, fps, id3_interval=30, encoder_profile=None):
         self.output_dir = output_dir
         self.width = width
         self.height = height
         self.fps = fps
         self.id3_interval = id3_interval
+        self.encoder_profile = encoder_profile
         self.frame_count = 0
         
         # Ensure output directory exists
@@ -105,10 +106,14 @@ class HLSWriter(RTSPWriter):
         encoder_queue.set_property("leaky", "downstream")
         
         x264enc = Gst.ElementFactory.make("x264enc", "encoder")
-        x264enc.set_property("speed-preset", "fast")
-        x264enc.set_property("bitrate", 4000) # Lower bitrate for HLS
-        x264enc.set_property("key-int-max", int(self.fps * 2)) # 2 second GOP for HLS
-        x264enc.set_property("threads", 4)
+        if self.encoder_profile:
+            # Profile GOP must stay aligned with the 2 second target duration
+            self.encoder_profile.apply_to_x264enc(x264enc, default_bitrate=4000, fps=self.fps)
+        else:
+            x264enc.set_property("speed-preset", "fast")
+            x264enc.set_property("bitrate", 4000) # Lower bitrate for HLS
+            x264enc.set_property("key-int-max", int(self.fps * 2)) # 2 second GOP for HLS
+            x264enc.set_property("threads", 4)
         x264enc.set_property("tune", 0x00000004)  # zerolatency
 
         h264parse = Gst.ElementFactory.make("h264parse", "parser")
@@ -208,8 +213,7 @@ class HLSWriter(RTSPWriter):
         
         try:
             # Create JSON payload - push raw JSON to KLV stream
-            json_str = json.dumps(metadata, separators=(',', ':'))
-            data = json_str.encode('utf-8')
+            data = encode_json(metadata)
             
             # Create buffer
             buf = self.Gst.Buffer.new_allocate(None, len(data), None)
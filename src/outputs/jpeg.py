@@ -0,0 +1,154 @@
+"""
+Demand-driven JPEG encoding shared by the browser writers (MJPEG, WebSocket).
+
+Frames are only encoded while at least one viewer is subscribed, and the
+encode runs on a small thread pool (cv2.imencode releases the GIL) instead of
+the pipeline's output thread. When every worker is busy the frame is dropped:
+viewers always want the newest frame, never a backlog.
+
+Quality adapts between ``min_quality`` and ``max_quality`` (default: the
+configured quality): it steps down when encoding exceeds the per-frame budget
+or viewers keep falling behind, and back up when there is headroom on both.
+Chroma subsampling follows quality (4:4:4 at the top, 4:2:0 otherwise).
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Dict, Any
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("SRTYOLOUnified.JPEG")
+
+# cv2.IMWRITE_JPEG_SAMPLING_FACTOR needs OpenCV >= 4.5.5; older builds keep libjpeg's default (4:2:0)
+_SAMPLING_PARAM = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR', None)
+_SAMPLING_444 = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_444', 0x111111)
+_SAMPLING_420 = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_420', 0x221111)
+
+# Quality at or above which chroma is kept at full resolution
+_FULL_CHROMA_QUALITY = 90
+_QUALITY_STEP = 5
+# Deliveries per adaptation window and the share of skipped frames that counts as congestion
+_DELIVERY_WINDOW = 60
+_CONGESTED_SKIP_RATIO = 0.3
+
+
+class JPEGEncoderPool:
+    """
+    Encode frames to JPEG on worker threads, only while someone is watching.
+
+    ``on_encoded(jpeg_bytes, frame_number, pts)`` is called on a worker thread; frames
+    may complete out of order when ``workers > 1``, so consumers should ignore
+    frame numbers older than the last one they published.
+    """
+
+    def __init__(self, width: int, height: int, fps: float, on_encoded: Callable[[bytes, int, Optional[float]], None],
+                 quality: int = 85, min_quality: int = 50, max_quality: Optional[int] = None, workers: int = 2):
+        self.width = width
+        self.height = height
+        self.on_encoded = on_encoded
+        self.min_quality = min_quality
+        self.max_quality = max(max_quality or quality, quality)
+        self.quality = quality
+        self.workers = workers
+        # Each worker may spend up to workers/fps seconds per frame and still keep up
+        self._budget_ms = 1000.0 * workers / max(fps, 1.0) * 0.8
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jpeg-encode")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._subscribers = 0
+        self._encode_ms = 0.0
+        self._delivered = 0
+        self._skipped = 0
+        self._dropped_at_adapt = 0
+        self._congested = False
+
+        self.frames_encoded = 0
+        self.frames_idle = 0      # Not encoded: nobody subscribed
+        self.frames_dropped = 0   # Not encoded: all workers busy
+
+    def set_subscribers(self, count: int):
+        """Number of viewers currently attached; encoding stops at zero."""
+        self._subscribers = count
+
+    @property
+    def active(self) -> bool:
+        return self._subscribers > 0
+
+    def submit(self, frame: np.ndarray, frame_number: int, pts: Optional[float] = None) -> bool:
+        """Queue ``frame`` for encoding. Returns False if it was skipped (no viewers or pool busy)."""
+        if not self.active:
+            self.frames_idle += 1
+            return False
+        with self._lock:
+            if self._in_flight >= self.workers:
+                self.frames_dropped += 1
+                return False
+            self._in_flight += 1
+        self._executor.submit(self._encode, frame, frame_number, pts)
+        return True
+
+    def _params(self, quality: int) -> list:
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        if _SAMPLING_PARAM is not None:
+            params += [int(_SAMPLING_PARAM), _SAMPLING_444 if quality >= _FULL_CHROMA_QUALITY else _SAMPLING_420]
+        return params
+
+    def _encode(self, frame: np.ndarray, frame_number: int, pts: Optional[float]):
+        try:
+            t0 = time.perf_counter()
+            if frame.shape[0] != self.height or frame.shape[1] != self.width:
+                frame = cv2.resize(frame, (self.width, self.height))
+            ok, buffer = cv2.imencode('.jpg', frame, self._params(self.quality))
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            if ok:
+                self.frames_encoded += 1
+                self._adapt(elapsed_ms)
+                self.on_encoded(buffer.tobytes(), frame_number, pts)
+        except Exception as e:
+            logger.error(f"Error encoding frame: {e}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def report_delivery(self, skipped: int = 0):
+        """Called by a writer per frame sent to a viewer, with how many newer frames it had to skip."""
+        with self._lock:
+            self._delivered += 1
+            self._skipped += skipped
+            if self._delivered < _DELIVERY_WINDOW:
+                return
+            congested = self._skipped / (self._delivered + self._skipped) > _CONGESTED_SKIP_RATIO
+            self._delivered = self._skipped = 0
+        self._congested = congested
+        if congested and self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - _QUALITY_STEP)
+            logger.info(f"Viewers falling behind, JPEG quality → {self.quality}")
+
+    def _adapt(self, elapsed_ms: float):
+        self._encode_ms = elapsed_ms if not self._encode_ms else 0.9 * self._encode_ms + 0.1 * elapsed_ms
+        if self.frames_encoded % 30:
+            return
+        if self._encode_ms > self._budget_ms and self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - _QUALITY_STEP)
+            logger.info(f"JPEG encode {self._encode_ms:.1f}ms over budget, quality → {self.quality}")
+        elif (self._encode_ms < 0.5 * self._budget_ms and self.frames_dropped == self._dropped_at_adapt
+              and not self._congested and self.quality < self.max_quality):
+            self.quality = min(self.max_quality, self.quality + _QUALITY_STEP)
+        self._dropped_at_adapt = self.frames_dropped
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'quality': self.quality,
+            'encode_ms': round(self._encode_ms, 2),
+            'frames_encoded': self.frames_encoded,
+            'frames_idle': self.frames_idle,
+            'frames_dropped': self.frames_dropped,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
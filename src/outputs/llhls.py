@@ -0,0 +1,438 @@
+"""
+In-process Low-Latency HLS output.
+
+Encodes with PyAV (libx264) and muxes MPEG-TS partial segments straight into
+memory. A rolling window of segments is served over aiohttp with LL-HLS
+blocking playlist reload, so players no longer poll files written by hlssink.
+Optionally persists complete segments and a standard playlist to disk, written
+atomically.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from ..modules.metabus import encode_json
+
+logger = logging.getLogger("SRTYOLOUnified.LLHLS")
+
+try:
+    import av
+    from aiohttp import web
+    LLHLS_AVAILABLE = True
+except ImportError:
+    LLHLS_AVAILABLE = False
+    logger.warning("PyAV/aiohttp not available - LL-HLS output disabled")
+
+
+class _PartSink:
+    """File-like object the MPEG-TS muxer writes into; collects bytes of the current part."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class _Part:
+    __slots__ = ("data", "duration", "independent")
+
+    def __init__(self, data: bytes, duration: float, independent: bool):
+        self.data = data
+        self.duration = duration
+        self.independent = independent
+
+
+class _Segment:
+    def __init__(self, msn: int):
+        self.msn = msn
+        self.parts: List[_Part] = []
+        self.complete = False
+        self._data = None
+
+    @property
+    def duration(self) -> float:
+        return sum(p.duration for p in self.parts)
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None or not self.complete:
+            self._data = b"".join(p.data for p in self.parts)
+        return self._data
+
+
+class LLHLSWriter:
+    """
+    LL-HLS writer serving playlists and (partial) segments from memory.
+
+    Routes: /index.m3u8 (supports _HLS_msn/_HLS_part blocking reload),
+    /seg{msn}.ts, /part{msn}.{idx}.ts, /metadata (latest frame metadata), /health.
+    """
+
+    def __init__(self, port: int, width: int, height: int, fps: float,
+                 output_dir: Optional[str] = None, segment_duration: float = 1.0,
+                 part_duration: float = 0.2, window_segments: int = 6,
+                 bitrate_kbps: int = 4000, encoder_profile=None):
+        if not LLHLS_AVAILABLE:
+            raise RuntimeError("PyAV/aiohttp not available - install with: pip install av aiohttp")
+
+        self.port = port
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.output_dir = output_dir
+        self.segment_duration = segment_duration
+        self.part_duration = part_duration
+        self.window_segments = window_segments
+        self.frame_count = 0
+
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        # Segment state is owned by the event loop thread; the encoder thread hands parts over
+        self._segments: List[_Segment] = []
+        self._latest_metadata: Optional[bytes] = None
+        self._changed = None
+        self._closed = False
+
+        self._open_encoder(bitrate_kbps, encoder_profile)
+
+        # Encoder-side bookkeeping (pipeline output thread only)
+        self._msn = 0
+        self._part_frames = 0
+        self._segment_frames = 0
+        self._part_independent = True
+        self._disk_segments: List[tuple] = []  # (msn, duration) for the on-disk playlist
+        self._disk_segment_data = bytearray()
+
+        self._loop = None
+        self._server_thread = None
+        self._runner = None
+        self._start_server()
+        logger.info(f"LL-HLS server started on port {port} "
+                    f"(segments {segment_duration}s, parts {part_duration}s, window {window_segments})")
+
+    # ------------------------------------------------------------------ encoder
+
+    def _open_encoder(self, bitrate_kbps, encoder_profile):
+        self._sink = _PartSink()
+        self._container = av.open(self._sink, mode='w', format='mpegts',
+                                  container_options={'flush_packets': '1'})
+        rate = int(round(self.fps))
+        gop = max(1, int(round(self.fps * self.segment_duration)))
+        self._stream = self._container.add_stream('libx264', rate=rate)
+        self._stream.width = self.width
+        self._stream.height = self.height
+        self._stream.pix_fmt = 'yuv420p'
+        preset = encoder_profile.preset if encoder_profile else 'veryfast'
+        threads = encoder_profile.threads if encoder_profile else 4
+        bitrate = (encoder_profile.bitrate_kbps if encoder_profile else None) or bitrate_kbps
+        # Fixed GOP = segment duration so every segment starts with an IDR frame
+        self._stream.codec_context.options = {
+            'preset': preset,
+            'tune': 'zerolatency',
+            'threads': str(threads),
+            'g': str(gop),
+            'keyint_min': str(gop),
+            'sc_threshold': '0',
+            'b': f'{bitrate}k',
+        }
+        self._frames_per_part = max(1, int(round(self.fps * self.part_duration)))
+        self._frames_per_segment = gop
+        self._frame_time = 1.0 / self.fps
+
+    def write_frame(self, frame: np.ndarray):
+        """Encode a BGR frame and cut parts/segments as their durations fill up."""
+        if self._closed:
+            return
+        if frame.shape[0] != self.height or frame.shape[1] != self.width:
+            import cv2
+            frame = cv2.resize(frame, (self.width, self.height))
+
+        vframe = av.VideoFrame.from_ndarray(frame, format='bgr24')
+        vframe.pts = self.frame_count
+        self.frame_count += 1
+        try:
+            for packet in self._stream.encode(vframe):
+                self._mux(packet)
+        except Exception as e:
+            logger.error(f"LL-HLS encode error: {e}")
+
+    def _mux(self, packet):
+        # Start a new segment on the IDR that follows a full segment
+        if packet.is_keyframe and self._segment_frames >= self._frames_per_segment:
+            self._cut_part(end_segment=True)
+        self._container.mux(packet)
+        self._part_frames += 1
+        self._segment_frames += 1
+        if self._part_frames >= self._frames_per_part:
+            self._cut_part(end_segment=False)
+
+    def _cut_part(self, end_segment: bool):
+        data = self._sink.take()
+        msn = self._msn
+        if data:
+            part = _Part(data, self._part_frames * self._frame_time, self._part_independent)
+            self._disk_segment_data += data
+            self._part_independent = False
+            self._loop.call_soon_threadsafe(self._add_part, msn, part)
+        self._part_frames = 0
+
+        if end_segment:
+            duration = self._segment_frames * self._frame_time
+            self._loop.call_soon_threadsafe(self._complete_segment, msn)
+            if self.output_dir:
+                self._persist_segment(msn, duration, bytes(self._disk_segment_data))
+            self._disk_segment_data.clear()
+            self._msn += 1
+            self._segment_frames = 0
+            self._part_independent = True
+
+    # ------------------------------------------------------------------ disk persistence
+
+    def _atomic_write(self, path: str, data: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _persist_segment(self, msn: int, duration: float, data: bytes):
+        try:
+            self._atomic_write(os.path.join(self.output_dir, f"seg{msn}.ts"), data)
+            self._disk_segments.append((msn, duration))
+            while len(self._disk_segments) > self.window_segments:
+                old_msn, _ = self._disk_segments.pop(0)
+                try:
+                    os.remove(os.path.join(self.output_dir, f"seg{old_msn}.ts"))
+                except OSError:
+                    pass
+            lines = [
+                "#EXTM3U",
+                "#EXT-X-VERSION:3",
+                f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_duration)}",
+                f"#EXT-X-MEDIA-SEQUENCE:{self._disk_segments[0][0]}",
+            ]
+            for seg_msn, seg_duration in self._disk_segments:
+                lines.append(f"#EXTINF:{seg_duration:.3f},")
+                lines.append(f"seg{seg_msn}.ts")
+            self._atomic_write(os.path.join(self.output_dir, "index.m3u8"), ("\n".join(lines) + "\n").encode('utf-8'))
+        except OSError as e:
+            logger.error(f"LL-HLS persistence error: {e}")
+
+    # ------------------------------------------------------------------ loop-side state
+
+    def _segment(self, msn: int) -> Optional[_Segment]:
+        if not self._segments:
+            return None
+        index = msn - self._segments[0].msn
+        if 0 <= index < len(self._segments):
+            return self._segments[index]
+        return None
+
+    def _add_part(self, msn: int, part: _Part):
+        segment = self._segment(msn)
+        if segment is None:
+            segment = _Segment(msn)
+            self._segments.append(segment)
+            # Keep the rolling window (plus the segment in progress)
+            while len(self._segments) > self.window_segments + 1:
+                self._segments.pop(0)
+        segment.parts.append(part)
+        self._notify()
+
+    def _complete_segment(self, msn: int):
+        segment = self._segment(msn)
+        if segment is not None:
+            segment.complete = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _has(self, msn: int, part: Optional[int]) -> bool:
+        """Whether the playlist already contains segment msn (and part index, if given)."""
+        segment = self._segment(msn)
+        if segment is None:
+            return bool(self._segments) and msn < self._segments[0].msn
+        if part is None:
+            return segment.complete
+        return part < len(segment.parts)
+
+    async def _wait_for(self, msn: int, part: Optional[int], timeout: float) -> bool:
+        deadline = self._loop.time() + timeout
+        while not self._has(msn, part):
+            remaining = deadline - self._loop.time()
+            if remaining <= 0 or self._closed:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def _render_playlist(self) -> str:
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:9",
+            f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_duration)}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={self.part_duration * 3:.3f}",
+            f"#EXT-X-PART-INF:PART-TARGET={self.part_duration:.3f}",
+            f"#EXT-X-MEDIA-SEQUENCE:{self._segments[0].msn}",
+        ]
+        # Parts are only advertised for the last couple of segments (spec: within 3 target durations)
+        parts_from = self._segments[-1].msn - 2
+        for segment in self._segments:
+            if segment.msn >= parts_from:
+                for idx, part in enumerate(segment.parts):
+                    attrs = f'DURATION={part.duration:.3f},URI="part{segment.msn}.{idx}.ts"'
+                    if part.independent:
+                        attrs += ",INDEPENDENT=YES"
+                    lines.append(f"#EXT-X-PART:{attrs}")
+            if segment.complete:
+                lines.append(f"#EXTINF:{segment.duration:.3f},")
+                lines.append(f"seg{segment.msn}.ts")
+        last = self._segments[-1]
+        if last.complete:
+            hint = f"part{last.msn + 1}.0.ts"
+        else:
+            hint = f"part{last.msn}.{len(last.parts)}.ts"
+        lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{hint}"')
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------------ HTTP server
+
+    def _start_server(self):
+        """Start the LL-HLS server in a background thread."""
+        self._ready = threading.Event()
+        self._server_thread = threading.Thread(target=self._run_server, daemon=True)
+        self._server_thread.start()
+        self._ready.wait(timeout=5)
+
+    def _run_server(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._changed = asyncio.Event()
+
+        app = web.Application()
+        app.router.add_get("/index.m3u8", self._handle_playlist)
+        app.router.add_get(r"/seg{msn:\d+}.ts", self._handle_segment)
+        app.router.add_get(r"/part{msn:\d+}.{idx:\d+}.ts", self._handle_part)
+        app.router.add_get("/metadata", self._handle_metadata)
+        app.router.add_get("/health", self._handle_health)
+
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "0.0.0.0", self.port)
+        self._loop.run_until_complete(site.start())
+        self._ready.set()
+
+        logger.info(f"LL-HLS server running on http://0.0.0.0:{self.port}/index.m3u8")
+        self._loop.run_forever()
+
+    def _headers(self, content_type: str, cache: str) -> Dict[str, str]:
+        return {
+            "Content-Type": content_type,
+            "Cache-Control": cache,
+            "Access-Control-Allow-Origin": "*",
+        }
+
+    async def _handle_playlist(self, request):
+        msn = request.query.get("_HLS_msn")
+        part = request.query.get("_HLS_part")
+        if msn is not None:
+            try:
+                msn = int(msn)
+                part = int(part) if part is not None else None
+            except ValueError:
+                return web.Response(status=400, text="invalid _HLS_msn/_HLS_part")
+            # Requests too far ahead of the live edge are rejected (spec: more than 2 segments)
+            if self._segments and msn > self._segments[-1].msn + 2:
+                return web.Response(status=400, text="_HLS_msn too far in the future")
+            if not await self._wait_for(msn, part, timeout=self.segment_duration * 3):
+                return web.Response(status=503, text="playlist update timed out")
+        elif not self._segments:
+            await self._wait_for(0, 0, timeout=self.segment_duration * 3)
+
+        if not self._segments:
+            return web.Response(status=503, text="no segments yet")
+        return web.Response(text=self._render_playlist(),
+                            headers=self._headers("application/vnd.apple.mpegurl", "no-cache"))
+
+    async def _handle_segment(self, request):
+        msn = int(request.match_info["msn"])
+        segment = self._segment(msn)
+        if segment is not None and not segment.complete:
+            await self._wait_for(msn, None, timeout=self.segment_duration * 3)
+            segment = self._segment(msn)
+        if segment is None or not segment.complete:
+            return web.Response(status=404)
+        return web.Response(body=segment.data, headers=self._headers("video/mp2t", "max-age=60"))
+
+    async def _handle_part(self, request):
+        msn = int(request.match_info["msn"])
+        idx = int(request.match_info["idx"])
+        # Preload hints point at the next part: hold the request until it exists
+        if not self._has(msn, idx):
+            await self._wait_for(msn, idx, timeout=self.part_duration * 10)
+        segment = self._segment(msn)
+        if segment is None or idx >= len(segment.parts):
+            return web.Response(status=404)
+        return web.Response(body=segment.parts[idx].data, headers=self._headers("video/mp2t", "max-age=60"))
+
+    async def _handle_metadata(self, request):
+        return web.Response(body=self._latest_metadata or b"{}",
+                            headers=self._headers("application/json", "no-cache"))
+
+    async def _handle_health(self, request):
+        return web.json_response({
+            "status": "ok",
+            "protocol": "ll-hls",
+            "segments": len(self._segments),
+            "latest_msn": self._segments[-1].msn if self._segments else None,
+        })
+
+    # ------------------------------------------------------------------ writer interface
+
+    def inject_metadata(self, metadata: Dict[str, Any]):
+        """Keep the latest metadata for /metadata (polled alongside the playlist)."""
+        try:
+            self._latest_metadata = encode_json(metadata)
+        except Exception as e:
+            logger.error(f"Error serializing LL-HLS metadata: {e}")
+
+    def close(self):
+        """Flush the encoder, finish the last segment and stop the server."""
+        logger.info("Closing LL-HLS writer...")
+        if not self._closed:
+            try:
+                for packet in self._stream.encode(None):
+                    self._mux(packet)
+                self._container.close()
+                if self._part_frames or self._segment_frames:
+                    self._cut_part(end_segment=True)
+            except Exception as e:
+                logger.debug(f"Error flushing LL-HLS encoder: {e}")
+            self._closed = True
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._notify)
+            time.sleep(0.1)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._server_thread:
+            self._server_thread.join(timeout=2)
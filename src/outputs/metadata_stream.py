@@ -0,0 +1,254 @@
+"""
+Streaming per-frame metadata writer for batch mode.
+
+Frames are serialized as they arrive on a background thread, so memory stays
+constant regardless of video length and there is no multi-minute dump at the
+end. Three layouts are supported:
+
+- ``json``:  the historical ``{"video_info": ..., "frames": [...]}`` document,
+             written incrementally (plus a trailing ``"summary"``)
+- ``jsonl``: one record per line; a ``{"video_info": ...}`` header, one line per
+             frame and a ``{"summary": ...}`` footer
+- ``binary``: ``.binmeta`` file: "SYMS" + u32 length + video_info JSON, then per
+              frame a u32 length + binmeta message (src/modules/binmeta.py),
+              then u32 0xFFFFFFFF + u32 length + summary JSON
+
+Any of them can be gzip or zstd compressed (zstd needs the ``zstandard`` package).
+"""
+
+import gzip
+import io
+import json
+import logging
+import queue
+import struct
+import threading
+import time
+from typing import Dict, Any, Optional, Iterator
+
+from ..modules.metabus import encode_json_text
+from ..modules.binmeta import encode_binary, decode as decode_binary
+
+logger = logging.getLogger("SRTYOLOUnified.MetadataStream")
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+METADATA_FORMATS = ('json', 'jsonl', 'binary')
+METADATA_COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+_COMPRESSION_SUFFIX = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+_FORMAT_EXTENSION = {'binary': 'binmeta'}
+
+_BINARY_FILE_MAGIC = b'SYMS'
+_LENGTH = struct.Struct('<I')
+_BINARY_FOOTER_MARK = 0xFFFFFFFF
+
+_STOP = object()
+
+
+def metadata_filename(base_name: str, fmt: str = 'json', compression: str = 'none') -> str:
+    """Output filename for a metadata stream, e.g. ``video.jsonl.zst``."""
+    return f"{base_name}.{_FORMAT_EXTENSION.get(fmt, fmt)}{_COMPRESSION_SUFFIX[compression]}"
+
+
+def _open_binary(path: str, mode: str, compression: str):
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstd compression requested but zstandard is not installed: pip install zstandard")
+        raw = open(path, mode)
+        if 'w' in mode:
+            return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return open(path, mode, buffering=1 << 20)
+
+
+def _compression_for(path: str) -> str:
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+
+class StreamingMetadataWriter:
+    """
+    Background-thread metadata serializer with a bounded hand-off queue.
+
+    ``write_frame`` never serializes on the caller's thread; it blocks only if the
+    writer thread is more than ``max_pending`` frames behind (batch mode never drops).
+    """
+
+    def __init__(self, path: str, video_info: Dict[str, Any], fmt: str = 'json',
+                 compression: str = 'none', max_pending: int = 256):
+        if fmt not in METADATA_FORMATS:
+            raise ValueError(f"Unknown metadata format: {fmt}")
+        if compression not in METADATA_COMPRESSIONS:
+            raise ValueError(f"Unknown metadata compression: {compression}")
+
+        self.path = path
+        self.fmt = fmt
+        self.compression = compression
+        self.frames_written = 0
+        self.bytes_written = 0
+        self._start_time = time.time()
+
+        self._out = _open_binary(path, 'wb', compression)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[Exception] = None
+
+        self._write_header(video_info)
+        self._thread = threading.Thread(target=self._writer_thread, name="metadata-writer", daemon=True)
+        self._thread.start()
+
+    def _emit(self, text: str):
+        self._emit_bytes(text.encode('utf-8'))
+
+    def _emit_bytes(self, data: bytes):
+        self._out.write(data)
+        self.bytes_written += len(data)
+
+    def _write_header(self, video_info: Dict[str, Any]):
+        header = json.dumps(video_info, default=str)
+        if self.fmt == 'binary':
+            data = header.encode('utf-8')
+            self._emit_bytes(_BINARY_FILE_MAGIC + _LENGTH.pack(len(data)) + data)
+        elif self.fmt == 'jsonl':
+            self._emit('{"video_info":' + header + '}\n')
+        else:
+            self._emit('{\n  "video_info": ' + header + ',\n  "frames": [')
+
+    def _write_record(self, metadata: Dict[str, Any]):
+        if self.fmt == 'binary':
+            record = encode_binary(metadata)
+            self._emit_bytes(_LENGTH.pack(len(record)) + record)
+            self.frames_written += 1
+            return
+        record = encode_json_text(metadata)
+        if self.fmt == 'jsonl':
+            self._emit(record + '\n')
+        else:
+            self._emit((',\n    ' if self.frames_written else '\n    ') + record)
+        self.frames_written += 1
+
+    def _write_footer(self, summary: Dict[str, Any]):
+        footer = json.dumps(summary, default=str)
+        if self.fmt == 'binary':
+            data = footer.encode('utf-8')
+            self._emit_bytes(_LENGTH.pack(_BINARY_FOOTER_MARK) + _LENGTH.pack(len(data)) + data)
+        elif self.fmt == 'jsonl':
+            self._emit('{"summary":' + footer + '}\n')
+        else:
+            self._emit('\n  ],\n  "summary": ' + footer + '\n}\n')
+
+    def _writer_thread(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            try:
+                self._write_record(item)
+            except Exception as e:
+                # Keep draining so producers never block on a dead writer
+                if self._error is None:
+                    logger.error(f"Metadata stream write error: {e}")
+                self._error = e
+
+    def write_frame(self, metadata: Dict[str, Any]):
+        """Queue one frame's metadata for serialization."""
+        self._queue.put(metadata)
+
+    def close(self, summary: Optional[Dict[str, Any]] = None) -> int:
+        """Drain pending frames, write the footer and close the file. Returns frames written."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        elapsed = time.time() - self._start_time
+        footer = {'frames': self.frames_written, 'elapsed_s': round(elapsed, 3)}
+        if summary:
+            footer.update(summary)
+        try:
+            self._write_footer(footer)
+            self._out.close()
+        except Exception as e:
+            logger.error(f"Error closing metadata stream: {e}")
+        return self.frames_written
+
+
+def _read_exact(raw, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = raw.read(size - len(data))
+        if not chunk:
+            raise EOFError(f"Truncated binary metadata stream ({len(data)}/{size} bytes)")
+        data += chunk
+    return data
+
+
+def _read_binary_header(raw) -> Dict[str, Any]:
+    if _read_exact(raw, len(_BINARY_FILE_MAGIC)) != _BINARY_FILE_MAGIC:
+        raise ValueError("Not a binary metadata stream")
+    size, = _LENGTH.unpack(_read_exact(raw, _LENGTH.size))
+    return json.loads(_read_exact(raw, size))
+
+
+def read_video_info(path: str) -> Dict[str, Any]:
+    """Read only the video_info header of a metadata file written by StreamingMetadataWriter."""
+    compression = _compression_for(path)
+    with _open_binary(path, 'rb', compression) as raw:
+        if '.binmeta' in path:
+            return _read_binary_header(raw)
+        text = io.TextIOWrapper(raw, encoding='utf-8')
+        if '.jsonl' in path:
+            return json.loads(text.readline()).get('video_info', {})
+        return json.load(text).get('video_info', {})
+
+
+def iter_metadata_frames(path: str, summary: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate frame records of any supported layout/compression.
+
+    JSONL and binary are streamed record by record; the JSON array layout is
+    loaded whole. Binary records are decoded back to the JSON dict layout.
+    When ``summary`` is given it is updated with the footer once the
+    iteration reaches it.
+    """
+    compression = _compression_for(path)
+    with _open_binary(path, 'rb', compression) as raw:
+        if '.binmeta' in path:
+            _read_binary_header(raw)
+            while True:
+                prefix = raw.read(_LENGTH.size)
+                if not prefix:
+                    return  # Stream ended without a footer (interrupted run)
+                if len(prefix) < _LENGTH.size:
+                    prefix += _read_exact(raw, _LENGTH.size - len(prefix))
+                size, = _LENGTH.unpack(prefix)
+                if size == _BINARY_FOOTER_MARK:
+                    if summary is not None:
+                        size, = _LENGTH.unpack(_read_exact(raw, _LENGTH.size))
+                        summary.update(json.loads(_read_exact(raw, size)))
+                    return
+                yield decode_binary(_read_exact(raw, size))
+        text = io.TextIOWrapper(raw, encoding='utf-8')
+        if '.jsonl' in path:
+            for line in text:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'video_info' in record:
+                    continue
+                if 'summary' in record:
+                    if summary is not None:
+                        summary.update(record['summary'])
+                    continue
+                yield record
+        else:
+            document = json.load(text)
+            yield from document.get('frames', [])
+            if summary is not None:
+                summary.update(document.get('summary', {}))
@@ -4,15 +4,17 @@ Uses proven technologies that work over any network.
 """
 
 import asyncio
-import json
 import logging
 import threading
 import time
-import queue
 from typing import Optional, Dict, Any
-import cv2
 import numpy as np
 
+from .jpeg import JPEGEncoderPool
+from ..modules.pubsub import AsyncBroadcaster
+from ..modules.delta import DeltaEncoder
+from ..modules.metabus import dumps_json, encode_json, with_fields
+
 logger = logging.getLogger("SRTYOLOUnified.MJPEG")
 
 try:
@@ -27,9 +29,16 @@ except ImportError:
 class MJPEGWriter:
     """
     MJPEG stream + SSE metadata writer for frame-perfect synchronization.
+
+    Frames are broadcast, not queued: the newest JPEG sits in a single slot with
+    a sequence number, and every /stream client waits for a newer sequence than
+    the one it last sent. Slow clients skip ahead to the latest frame instead of
+    taking frames from other clients; ``/stream?fps=N`` caps a client's rate.
+    JPEG encoding happens on a JPEGEncoderPool and only while /stream has viewers.
     """
 
-    def __init__(self, port: int, width: int, height: int, fps: float, quality: int = 85):
+    def __init__(self, port: int, width: int, height: int, fps: float, quality: int = 85,
+                 metadata_delta: bool = False):
         if not MJPEG_AVAILABLE:
             raise RuntimeError("aiohttp not available - install with: pip install aiohttp")
 
@@ -39,8 +48,15 @@ class MJPEGWriter:
         self.fps = fps
         self.quality = quality
 
-        self.frame_queue = queue.Queue(maxsize=2)  # Latest frame
-        self.metadata_queue = queue.Queue(maxsize=100)  # Metadata buffer
+        # Latest-frame slot; only touched on the event loop thread
+        self._latest_frame: Optional[bytes] = None
+        self._frame_seq = 0
+        self._frame_event: Optional[asyncio.Event] = None
+        self._stream_clients = 0
+        self._published_frame_number = -1
+        self._encoder = JPEGEncoderPool(width, height, fps, self._on_encoded, quality=quality)
+        self._metadata_bus: Optional[AsyncBroadcaster] = None  # SSE fan-out, created on the loop
+        self._delta = DeltaEncoder() if metadata_delta else None
         self.current_frame_number = 0
         
         self._loop = None
@@ -61,11 +77,14 @@ class MJPEGWriter:
         """Run the asyncio event loop for the MJPEG server."""
         self._loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._loop)
+        self._frame_event = asyncio.Event()
+        self._metadata_bus = AsyncBroadcaster(self._loop, max_pending=100)
         
         self._app = web.Application()
         self._app.router.add_get("/stream", self._handle_mjpeg)
         self._app.router.add_get("/metadata", self._handle_sse)
         self._app.router.add_get("/", self._handle_index)
+        self._app.router.add_get("/metadata_delta.js", self._handle_delta_js)
         self._app.router.add_get("/health", self._handle_health)
         
         self._runner = web.AppRunner(self._app)
@@ -81,7 +100,10 @@ class MJPEGWriter:
         return web.json_response({
             "status": "ok",
             "protocol": "mjpeg+sse",
-            "frame_queue_size": self.frame_queue.qsize()
+            "frame_seq": self._frame_seq,
+            "stream_clients": self._stream_clients,
+            "metadata_clients": self._metadata_bus.subscriber_count if self._metadata_bus else 0,
+            "jpeg": self._encoder.stats()
         })
 
     async def _handle_index(self, request):
@@ -103,24 +125,64 @@ class MJPEGWriter:
             logger.error(f"Error serving index: {e}")
             return web.Response(text=str(e), status=500)
 
+    def _on_encoded(self, frame_data: bytes, frame_number: int, pts: Optional[float]):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._publish_frame, frame_data, frame_number)
+
+    def _publish_frame(self, frame_data: bytes, frame_number: int):
+        """Replace the latest-frame slot and wake every waiting client (event loop thread)."""
+        if frame_number <= self._published_frame_number:
+            return  # An older frame finished encoding after a newer one
+        self._published_frame_number = frame_number
+        self._latest_frame = frame_data
+        self._frame_seq += 1
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    async def _handle_delta_js(self, request):
+        """Serve the delta metadata decoder used by the player."""
+        import os
+        for path in ["tests/metadata_delta.js", "/home/ubuntu/drones/detector/tests/metadata_delta.js"]:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    return web.Response(text=f.read(), content_type="application/javascript")
+        return web.Response(text="decoder file not found", status=404)
+
     async def _handle_mjpeg(self, request):
         """Stream MJPEG video."""
+        try:
+            max_fps = float(request.query.get('fps', 0))
+        except ValueError:
+            max_fps = 0
+        min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        
         response = web.StreamResponse()
         response.content_type = 'multipart/x-mixed-replace; boundary=frame'
         await response.prepare(request)
         
-        logger.info("MJPEG client connected")
+        self._stream_clients += 1
+        self._encoder.set_subscribers(self._stream_clients)
+        logger.info(f"MJPEG client connected ({self._stream_clients} viewers, fps cap: {max_fps or 'none'})")
         
+        sent_seq = 0
+        next_due = 0.0
         try:
             while True:
-                # Get latest frame (non-blocking)
-                try:
-                    frame_data = self.frame_queue.get_nowait()
-                except queue.Empty:
-                    await asyncio.sleep(1/self.fps)
+                if self._frame_seq == sent_seq:
+                    await self._frame_event.wait()
                     continue
                 
-                # Send frame
+                if min_interval:
+                    delay = next_due - self._loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_due = max(next_due, self._loop.time()) + min_interval
+                
+                # Always the newest frame: a client that fell behind skips ahead
+                if sent_seq and not min_interval:
+                    self._encoder.report_delivery(skipped=self._frame_seq - sent_seq - 1)
+                sent_seq = self._frame_seq
+                frame_data = self._latest_frame
                 await response.write(
                     b'--frame\r\n'
                     b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n'
@@ -128,6 +190,9 @@ class MJPEGWriter:
                 
         except Exception as e:
             logger.info(f"MJPEG client disconnected: {e}")
+        finally:
+            self._stream_clients -= 1
+            self._encoder.set_subscribers(self._stream_clients)
         
         return response
 
@@ -139,67 +204,52 @@ class MJPEGWriter:
         response.headers['Connection'] = 'keep-alive'
         await response.prepare(request)
         
-        logger.info("SSE client connected")
+        sub = self._metadata_bus.subscribe()
+        if self._delta:
+            # The new client needs full state before any delta
+            self._delta.force_keyframe()
+        logger.info(f"SSE client connected ({self._metadata_bus.subscriber_count} subscribers)")
         
         try:
             while True:
-                # Get metadata (blocking with timeout)
-                try:
-                    metadata = self.metadata_queue.get(timeout=1)
-                    
-                    # Send as SSE
-                    data = json.dumps(metadata, default=str)
-                    await response.write(f"data: {data}\n\n".encode('utf-8'))
-                    
-                except queue.Empty:
+                # Wait on this client's own buffer; never blocks the event loop
+                payload = await sub.get(timeout=15)
+                if payload is None:
+                    if sub.closed:
+                        break
                     # Send keepalive
                     await response.write(b": keepalive\n\n")
+                    continue
+                await response.write(payload)
                     
         except Exception as e:
             logger.info(f"SSE client disconnected: {e}")
+        finally:
+            self._metadata_bus.unsubscribe(sub)
+            if sub.dropped:
+                logger.info(f"SSE client fell behind: {sub.dropped}/{sub.received} messages dropped")
         
         return response
 
     def write_frame(self, frame: np.ndarray):
-        """Encode and queue frame for MJPEG stream."""
-        try:
-            # Resize if needed
-            if frame.shape[0] != self.height or frame.shape[1] != self.width:
-                frame = cv2.resize(frame, (self.width, self.height))
-            
-            # Encode as JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
-            _, buffer = cv2.imencode('.jpg', frame, encode_param)
-            frame_data = buffer.tobytes()
-            
-            # Update queue (drop old frames if full)
-            if self.frame_queue.full():
-                try:
-                    self.frame_queue.get_nowait()
-                except queue.Empty:
-                    pass
-            
-            self.frame_queue.put(frame_data)
-            self.current_frame_number += 1
-            
-        except Exception as e:
-            logger.error(f"Error encoding frame: {e}")
+        """Hand the frame to the JPEG encoder pool (skipped while nobody is watching)."""
+        self.current_frame_number += 1
+        self._encoder.submit(frame, self.current_frame_number)
 
     def send_metadata(self, metadata: Dict[str, Any]):
         """Queue metadata for SSE stream."""
+        if self._metadata_bus is None or not self._metadata_bus.subscriber_count:
+            return
         try:
             # Add frame number for synchronization
-            metadata['frame_number'] = self.current_frame_number
-            metadata['timestamp_ms'] = int(time.time() * 1000)
-            
-            # Queue metadata
-            if self.metadata_queue.full():
-                try:
-                    self.metadata_queue.get_nowait()
-                except queue.Empty:
-                    pass
+            fields = {'frame_number': self.current_frame_number, 'timestamp_ms': int(time.time() * 1000)}
             
-            self.metadata_queue.put(metadata)
+            # Serialized once, shared by every SSE subscriber
+            if self._delta:
+                data = dumps_json(self._delta.encode(dict(metadata, **fields)))
+            else:
+                data = with_fields(encode_json(metadata), fields)
+            self._metadata_bus.publish(b"data: " + data + b"\n\n")
             
         except Exception as e:
             logger.error(f"Error queuing metadata: {e}")
@@ -211,6 +261,9 @@ class MJPEGWriter:
     def close(self):
         """Close the server."""
         logger.info("Closing MJPEG writer...")
+        self._encoder.close()
+        if self._metadata_bus:
+            self._metadata_bus.close()
         if self._loop:
             self._loop.call_soon_threadsafe(self._loop.stop)
         if self._server_thread:
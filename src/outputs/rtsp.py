@@ -2,9 +2,10 @@ import sys
 import logging
 import subprocess
 import time
-import json
 import os
 
+from ..modules.metabus import encode_json_text
+
 # Add system GStreamer plugins to plugin path for rtspclientsink
 system_gst_plugins = '/usr/lib/x86_64-linux-gnu/gstreamer-1.0'
 current_path = os.environ.get('GST_PLUGIN_PATH', '')
@@ -37,11 +38,12 @@ class RTSPWriter:
         raise NotImplementedError
 
 class BasicRTSPWriter(RTSPWriter):
-    def __init__(self, output_rtsp, width, height, fps):
+    def __init__(self, output_rtsp, width, height, fps, encoder_profile=None):
         self.output_rtsp = output_rtsp
         self.width = width
         self.height = height
         self.fps = fps
+        self.encoder_profile = encoder_profile
         
         available, gi, Gst, GstApp = _try_import_gi()
         if not available:
@@ -75,11 +77,14 @@ class BasicRTSPWriter(RTSPWriter):
         
         # x264enc with zero latency tuning
         x264enc = Gst.ElementFactory.make("x264enc", "encoder")
-        x264enc.set_property("speed-preset", 1)  # "fast"
         x264enc.set_property("tune", 0x00000004)  # zerolatency
-        x264enc.set_property("bitrate", 6000)
-        x264enc.set_property("key-int-max", 60)
-        x264enc.set_property("threads", 4)
+        if self.encoder_profile:
+            self.encoder_profile.apply_to_x264enc(x264enc, default_bitrate=6000, fps=self.fps)
+        else:
+            x264enc.set_property("speed-preset", 1)  # "fast"
+            x264enc.set_property("bitrate", 6000)
+            x264enc.set_property("key-int-max", 60)
+            x264enc.set_property("threads", 4)
 
         # h264parse
         h264parse = Gst.ElementFactory.make("h264parse", "parser")
@@ -146,12 +151,13 @@ class BasicRTSPWriter(RTSPWriter):
                 pass
 
 class ID3RTSPWriter(RTSPWriter):
-    def __init__(self, output_rtsp, width, height, fps, id3_interval=30):
+    def __init__(self, output_rtsp, width, height, fps, id3_interval=30, encoder_profile=None):
         self.output_rtsp = output_rtsp
         self.width = width
         self.height = height
         self.fps = fps
         self.id3_interval = id3_interval
+        self.encoder_profile = encoder_profile
         self.frame_count = 0
         
         available, gi, Gst, GstApp = _try_import_gi()
@@ -191,10 +197,13 @@ class ID3RTSPWriter(RTSPWriter):
         encoder_queue.set_property("leaky", "downstream")
         
         x264enc = Gst.ElementFactory.make("x264enc", "encoder")
-        x264enc.set_property("speed-preset", "fast")
-        x264enc.set_property("bitrate", 6000)
-        x264enc.set_property("key-int-max", 60)
-        x264enc.set_property("threads", 4)
+        if self.encoder_profile:
+            self.encoder_profile.apply_to_x264enc(x264enc, default_bitrate=6000, fps=self.fps)
+        else:
+            x264enc.set_property("speed-preset", "fast")
+            x264enc.set_property("bitrate", 6000)
+            x264enc.set_property("key-int-max", 60)
+            x264enc.set_property("threads", 4)
         # Tune for low latency but ensure compatibility with mpegtsmux
         x264enc.set_property("tune", 0x00000004)  # zerolatency
 
@@ -284,7 +293,7 @@ class ID3RTSPWriter(RTSPWriter):
                 taglist.add_value(self.Gst.TagMergeMode.APPEND, 'geo-location-elevation', telemetry['altitude'])
             if 'detection_count' in metadata:
                 taglist.add_value(self.Gst.TagMergeMode.APPEND, 'comment', f"Detections: {metadata['detection_count']}")
-            taglist.add_value(self.Gst.TagMergeMode.APPEND, 'extended-comment', json.dumps(metadata, separators=(',', ':')))
+            taglist.add_value(self.Gst.TagMergeMode.APPEND, 'extended-comment', encode_json_text(metadata))
             event = self.Gst.Event.new_tag(taglist)
             # Send tag event to mpegtsmux sink pad (where video comes in)
             # This ensures tags are associated with the stream
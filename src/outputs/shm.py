@@ -0,0 +1,301 @@
+"""
+Shared-memory output for consumers on the same host (``--output-shm NAME``).
+
+Frames and their metadata are published into a ring of slots in a POSIX
+shared-memory segment (``/dev/shm/NAME``). Readers map the segment and get the
+latest frame as a NumPy view: no decode, no copy, no network stack.
+
+Segment layout (little-endian):
+
+    0     global header   magic "SYMF", version (u16), metadata format (u16: 0 JSON, 1 binmeta),
+                          slots, width, height, channels (0 = metadata only), slot size,
+                          metadata capacity (u32), fps (f64)
+    64    write count     u64, number of slots published so far (latest slot = (count - 1) % slots)
+    72    closed          u32, set when the writer shuts down
+    128   slot[i]         header (64 B): seq (u64), frame_number (u64), pts (f64, NaN if unknown),
+                          published_ns (u64, time.time_ns), metadata length (u32), flags (u32)
+                          then height*width*channels frame bytes (BGR), then metadata bytes
+
+Each slot is guarded by a seqlock: the writer makes ``seq`` odd, fills the
+slot, then makes it even again. A reader that sees an odd ``seq``, or a
+different ``seq`` after reading, retries; ``SharedMemoryReader.is_current``
+does the same check for zero-copy views, which stay valid until the writer
+wraps around the ring (``slots - 1`` frames later).
+"""
+
+import json
+import logging
+import math
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Any, Optional, NamedTuple
+
+import numpy as np
+
+from ..modules.binmeta import encode_binary, decode as decode_binary
+from ..modules.metabus import encode_json
+
+logger = logging.getLogger("SRTYOLOUnified.SHM")
+
+MAGIC = b'SYMF'
+VERSION = 1
+METADATA_JSON = 0
+METADATA_BINARY = 1
+_METADATA_FORMATS = {'json': METADATA_JSON, 'binary': METADATA_BINARY}
+
+GLOBAL_HEADER = struct.Struct('<4sHHIIIIIId')
+WRITE_COUNT = struct.Struct('<Q')
+CLOSED = struct.Struct('<I')
+SLOT_HEADER = struct.Struct('<QQdQII')
+SEQ = struct.Struct('<Q')
+
+_WRITE_COUNT_OFFSET = 64
+_CLOSED_OFFSET = 72
+_SLOTS_OFFSET = 128
+_SLOT_HEADER_SIZE = 64
+_ALIGN = 64
+
+SLOT_HAS_FRAME = 0x01
+
+
+def _align(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class SharedMemoryWriter:
+    """
+    Writer interface (write_frame / inject_metadata / close) over a shared-memory ring.
+
+    ``inject_metadata`` is called before ``write_frame`` for the same frame, so
+    the metadata is kept and published together with the frame. With
+    ``frames=False`` (analytics-only) every metadata call publishes a slot.
+    """
+
+    def __init__(self, name: str, width: int, height: int, fps: float, slots: int = 4,
+                 metadata_format: str = 'binary', metadata_capacity: int = 256 * 1024, frames: bool = True):
+        if metadata_format not in _METADATA_FORMATS:
+            raise ValueError(f"Unknown shm metadata format: {metadata_format}")
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.slots = max(2, slots)
+        self.frames = frames
+        self.metadata_format = metadata_format
+        self.metadata_capacity = metadata_capacity
+        self.channels = 3
+        self.frame_bytes = width * height * self.channels if frames else 0
+        self.slot_size = _align(_SLOT_HEADER_SIZE + self.frame_bytes + metadata_capacity)
+        size = _SLOTS_OFFSET + self.slots * self.slot_size
+
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a previous run that did not shut down cleanly
+            logger.warning(f"Replacing existing shared memory segment {name}")
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._buf = self._shm.buf
+
+        GLOBAL_HEADER.pack_into(self._buf, 0, MAGIC, VERSION, _METADATA_FORMATS[metadata_format], self.slots,
+                                width, height, self.channels if frames else 0, self.slot_size, metadata_capacity, float(fps))
+        WRITE_COUNT.pack_into(self._buf, _WRITE_COUNT_OFFSET, 0)
+        CLOSED.pack_into(self._buf, _CLOSED_OFFSET, 0)
+        self._frame_views = [
+            np.ndarray((height, width, self.channels), dtype=np.uint8, buffer=self._buf,
+                       offset=self._slot_offset(i) + _SLOT_HEADER_SIZE)
+            for i in range(self.slots)
+        ] if frames else []
+
+        self._write_count = 0
+        self._pending_metadata = b''
+        self._pending_frame_number = 0
+        self._pending_pts: Optional[float] = None
+        self.frames_written = 0
+        self.frames_skipped = 0
+        self.metadata_truncated = 0
+        logger.info(f"Shared memory output: /dev/shm/{name} ({self.slots} slots x {self.slot_size / 1e6:.1f} MB, "
+                    f"{metadata_format} metadata)")
+
+    def _slot_offset(self, index: int) -> int:
+        return _SLOTS_OFFSET + index * self.slot_size
+
+    def _encode(self, metadata: Dict[str, Any]) -> bytes:
+        if self.metadata_format == 'binary':
+            return encode_binary(metadata)
+        return encode_json(metadata)
+
+    def inject_metadata(self, metadata: Dict[str, Any]):
+        data = self._encode(metadata)
+        if len(data) > self.metadata_capacity:
+            self.metadata_truncated += 1
+            data = b''
+        self._pending_metadata = data
+        self._pending_frame_number = int(metadata.get('frame') or 0)
+        self._pending_pts = metadata.get('pts')
+        if not self.frames:
+            self._publish(None)
+
+    def write_frame(self, frame: np.ndarray):
+        if frame.shape != (self.height, self.width, self.channels):
+            self.frames_skipped += 1
+            if self.frames_skipped == 1:
+                logger.warning(f"Shared memory output expects {self.width}x{self.height} BGR frames, "
+                               f"got shape {frame.shape}; skipping")
+            return
+        self._publish(frame)
+
+    def _publish(self, frame: Optional[np.ndarray]):
+        index = self._write_count % self.slots
+        offset = self._slot_offset(index)
+        buf = self._buf
+        seq = SEQ.unpack_from(buf, offset)[0]
+
+        SEQ.pack_into(buf, offset, seq + 1)  # odd: slot being written
+        if frame is not None:
+            np.copyto(self._frame_views[index], frame)
+        metadata = self._pending_metadata
+        meta_offset = offset + _SLOT_HEADER_SIZE + self.frame_bytes
+        buf[meta_offset:meta_offset + len(metadata)] = metadata
+        pts = self._pending_pts
+        SLOT_HEADER.pack_into(buf, offset, seq + 1, self._pending_frame_number & 0xFFFFFFFFFFFFFFFF,
+                              float(pts) if pts is not None else math.nan, time.time_ns(), len(metadata),
+                              SLOT_HAS_FRAME if frame is not None else 0)
+        SEQ.pack_into(buf, offset, seq + 2)  # even: slot complete
+
+        self._write_count += 1
+        WRITE_COUNT.pack_into(buf, _WRITE_COUNT_OFFSET, self._write_count)
+        self._pending_metadata = b''
+        self.frames_written += 1
+
+    def close(self):
+        logger.info(f"Closing shared memory output ({self.frames_written} slots published, "
+                    f"{self.frames_skipped} frames skipped, {self.metadata_truncated} oversize metadata)")
+        try:
+            CLOSED.pack_into(self._buf, _CLOSED_OFFSET, 1)
+            self._frame_views = []
+            self._buf = None
+            self._shm.close()
+            self._shm.unlink()
+        except (FileNotFoundError, BufferError) as e:
+            logger.warning(f"Error releasing shared memory {self.name}: {e}")
+
+
+class ShmFrame(NamedTuple):
+    slot: int
+    seq: int
+    frame_number: int
+    pts: Optional[float]
+    published_ns: int
+    frame: Optional[np.ndarray]
+    metadata: bytes
+
+
+class SharedMemoryReader:
+    """
+    Consumer side of SharedMemoryWriter.
+
+        reader = SharedMemoryReader("srt-yolo")
+        while True:
+            item = reader.wait_next(timeout=1.0)
+            if item is None:
+                continue
+            detections = reader.decode_metadata(item)['detections']
+            boxes_on(item.frame)              # zero-copy view into the ring
+            if not reader.is_current(item):   # writer lapped us while we worked
+                ...
+
+    ``copy=True`` returns a private copy of the frame instead of a view.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name=name)
+        _untrack(self._shm)
+        self._buf = self._shm.buf
+        (magic, version, metadata_format, self.slots, self.width, self.height, self.channels,
+         self.slot_size, self.metadata_capacity, self.fps) = GLOBAL_HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"/dev/shm/{name} is not a frame ring")
+        if version != VERSION:
+            raise ValueError(f"Unsupported shared memory layout version {version}")
+        self.metadata_format = 'binary' if metadata_format == METADATA_BINARY else 'json'
+        self.frame_bytes = self.width * self.height * self.channels
+        self._frame_views = [
+            np.ndarray((self.height, self.width, self.channels), dtype=np.uint8, buffer=self._buf,
+                       offset=_SLOTS_OFFSET + i * self.slot_size + _SLOT_HEADER_SIZE)
+            for i in range(self.slots)
+        ] if self.frame_bytes else []
+        self._last_count = 0
+
+    @property
+    def write_count(self) -> int:
+        return WRITE_COUNT.unpack_from(self._buf, _WRITE_COUNT_OFFSET)[0]
+
+    @property
+    def closed(self) -> bool:
+        return bool(CLOSED.unpack_from(self._buf, _CLOSED_OFFSET)[0])
+
+    def _read_slot(self, index: int, copy: bool, retries: int = 100) -> Optional[ShmFrame]:
+        offset = _SLOTS_OFFSET + index * self.slot_size
+        for _ in range(retries):
+            seq, frame_number, pts, published_ns, meta_len, flags = SLOT_HEADER.unpack_from(self._buf, offset)
+            if seq & 1:
+                continue  # Writer is in this slot
+            meta_offset = offset + _SLOT_HEADER_SIZE + self.frame_bytes
+            metadata = bytes(self._buf[meta_offset:meta_offset + meta_len])
+            frame = None
+            if flags & SLOT_HAS_FRAME and self._frame_views:
+                frame = self._frame_views[index].copy() if copy else self._frame_views[index]
+            if SEQ.unpack_from(self._buf, offset)[0] != seq:
+                continue  # Overwritten while reading
+            return ShmFrame(index, seq, frame_number, None if math.isnan(pts) else pts, published_ns, frame, metadata)
+        return None
+
+    def read_latest(self, copy: bool = False) -> Optional[ShmFrame]:
+        """Most recently published slot, or None before the first frame."""
+        count = self.write_count
+        if not count:
+            return None
+        self._last_count = count
+        return self._read_slot((count - 1) % self.slots, copy)
+
+    def wait_next(self, timeout: Optional[float] = None, copy: bool = False,
+                  poll_interval: float = 0.0005) -> Optional[ShmFrame]:
+        """Block until a slot newer than the last one returned is published (polling)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.write_count == self._last_count:
+            if self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(poll_interval)
+        return self.read_latest(copy)
+
+    def is_current(self, item: ShmFrame) -> bool:
+        """True while the slot behind a zero-copy ``item`` has not been overwritten."""
+        offset = _SLOTS_OFFSET + item.slot * self.slot_size
+        return SEQ.unpack_from(self._buf, offset)[0] == item.seq
+
+    def decode_metadata(self, item: ShmFrame) -> Optional[Dict[str, Any]]:
+        if not item.metadata:
+            return None
+        if self.metadata_format == 'binary':
+            return decode_binary(item.metadata)
+        return json.loads(item.metadata)
+
+    def close(self):
+        self._frame_views = []
+        self._buf = None
+        self._shm.close()
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    # Readers must not unlink the writer's segment when they exit (Python < 3.13
+    # registers every attached segment with the resource tracker)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
@@ -5,85 +5,306 @@ Uses aiortc for WebRTC and aiohttp for signaling server.
 """
 
 import asyncio
-import json
 import logging
 import threading
 import time
+from fractions import Fraction
 from typing import Optional, Dict, Any
-import cv2
 import numpy as np
 
+from ..modules.metabus import encode_json_text
+
 logger = logging.getLogger("SRTYOLOUnified.WebRTC")
 
 try:
     from aiohttp import web
-    from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack, RTCConfiguration, RTCIceServer
+    from aiortc import (RTCPeerConnection, RTCSessionDescription, VideoStreamTrack, RTCConfiguration, RTCIceServer,
+                        RTCRtpSender, MediaStreamTrack)
     from aiortc.contrib.media import MediaRelay
-    from av import VideoFrame
+    from aiortc.mediastreams import MediaStreamError, VIDEO_CLOCK_RATE, VIDEO_PTIME, VIDEO_TIME_BASE
+    from av import VideoFrame, Packet
+    from av.video.frame import PictureType
     WEBRTC_AVAILABLE = True
 except ImportError:
     WEBRTC_AVAILABLE = False
     logger.warning("aiortc/aiohttp not available - WebRTC output disabled")
 
+# Rendition ladder: full, 1/2 and 1/4 resolution
+RENDITION_SCALES = (1, 2, 4)
+# Adaptation levels from best to worst: (rendition index, keep every Nth frame)
+ADAPTATION_LEVELS = [(0, 1), (1, 1), (1, 2), (2, 2), (2, 3)]
+ADAPTATION_INTERVAL_S = 2.0
+# Step down above this loss or when RTT grows well past the peer's best RTT (queueing
+# on the path shows up as RTT growth); step up after UPGRADE_CHECKS clean checks
+LOSS_DOWNGRADE = 0.05
+LOSS_UPGRADE = 0.01
+RTT_GROWTH_S = 0.15
+UPGRADE_CHECKS = 3
+
 
 class FrameVideoTrack(VideoStreamTrack):
     """
     A video track that serves frames pushed from the detector pipeline.
-    Properly encodes frames for browser consumption.
+
+    Timestamps come from a wall clock shared by all renditions (``clock_start``),
+    so a peer switching to a rendition that started later keeps monotonic RTP
+    timestamps. ``recv`` idles while no peer is attached, so a rendition nobody
+    watches costs nothing even though the relay keeps its reader task.
+
+    Each new frame is converted straight to yuv420p (scale + colour conversion in
+    one swscale pass) at most once, however many peers consume it: peers receive
+    the track through a MediaRelay, so ``recv`` runs once per tick in total.
+    Every tick wraps the cached planes in a new VideoFrame (one copy): encoders
+    set pts and the picture type on the frame they get from executor threads,
+    so a frame handed out earlier must never be modified.
     """
     kind = "video"
 
-    def __init__(self, width=640, height=480, fps=30):
+    def __init__(self, width=640, height=480, fps=30, clock_start: Optional[float] = None):
         super().__init__()
         self._frame = None
+        self._frame_seq = 0
         self._frame_time = 0
         self._lock = threading.Lock()
-        self._start_time = time.time()
+        self._start_time = clock_start if clock_start is not None else time.time()
+        self._tick: Optional[int] = None
+        self._subscribers = 0
+        self._attached: Optional[asyncio.Event] = None
         self.width = width
         self.height = height
         self.fps = fps
+        self._converted = None
+        self._converted_seq = -1
 
     def push_frame(self, frame: np.ndarray, timestamp: float):
-        """Push a new frame from the detector pipeline."""
+        """Push a new frame from the detector pipeline (kept by reference, converted on demand)."""
         with self._lock:
-            self._frame = frame.copy()
+            self._frame = frame
+            self._frame_seq += 1
             self._frame_time = timestamp
 
+    def attach(self):
+        """A peer started consuming this track (called on the event loop)."""
+        self._subscribers += 1
+        self._attached_event().set()
+
+    def detach(self):
+        self._subscribers = max(0, self._subscribers - 1)
+        if not self._subscribers:
+            self._attached_event().clear()
+
+    def _attached_event(self) -> "asyncio.Event":
+        if self._attached is None:
+            self._attached = asyncio.Event()
+        return self._attached
+
+    async def next_timestamp(self):
+        """Next tick of the shared clock (ticks missed while idle are skipped, not caught up)."""
+        if self.readyState != "live":
+            raise MediaStreamError
+        await self._attached_event().wait()
+        now = time.time()
+        tick = int((now - self._start_time) / VIDEO_PTIME)
+        if self._tick is not None and tick <= self._tick:
+            tick = self._tick + 1
+            await asyncio.sleep(self._start_time + tick * VIDEO_PTIME - now)
+        self._tick = tick
+        return tick * int(VIDEO_PTIME * VIDEO_CLOCK_RATE), VIDEO_TIME_BASE
+
+    def _latest_yuv(self) -> "VideoFrame":
+        with self._lock:
+            frame, seq = self._frame, self._frame_seq
+        if seq != self._converted_seq or self._converted is None:
+            if frame is None:
+                # Black frame until the pipeline delivers the first one
+                frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+            video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
+            # Planes only (I420 layout); the VideoFrame itself is never shared between ticks
+            self._converted = video_frame.reformat(width=self.width, height=self.height,
+                                                   format="yuv420p").to_ndarray()
+            self._converted_seq = seq
+        return VideoFrame.from_ndarray(self._converted, format="yuv420p")
+
     async def recv(self):
         """Receive the next frame for WebRTC transmission."""
         # Calculate PTS based on elapsed time and FPS
         pts, time_base = await self.next_timestamp()
 
-        # Get current frame
-        with self._lock:
-            if self._frame is None:
-                # Return black frame if no frame available yet
-                frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-            else:
-                frame = self._frame.copy()
-
-        # Ensure frame is correct size
-        if frame.shape[0] != self.height or frame.shape[1] != self.width:
-            frame = cv2.resize(frame, (self.width, self.height))
-
-        # Convert BGR to RGB for WebRTC
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Create VideoFrame with proper format
-        video_frame = VideoFrame.from_ndarray(frame_rgb, format="rgb24")
+        video_frame = self._latest_yuv()
         video_frame.pts = pts
         video_frame.time_base = time_base
 
         return video_frame
 
 
+class EncodedVideoTrack(FrameVideoTrack):
+    """
+    Encode-once variant: frames are H.264 encoded a single time and the
+    resulting packets are shared by every peer; aiortc only packetizes them.
+
+    Peers cannot request their own keyframes, so the GOP is kept at one second
+    and a keyframe is forced whenever a peer joins.
+    """
+
+    def __init__(self, width=640, height=480, fps=30, bitrate_kbps: int = 2500):
+        super().__init__(width, height, fps)
+        import av
+        self._codec = av.CodecContext.create("libx264", "w")
+        self._codec.width = width
+        self._codec.height = height
+        self._codec.pix_fmt = "yuv420p"
+        self._codec.time_base = Fraction(1, VIDEO_CLOCK_RATE)
+        self._codec.bit_rate = bitrate_kbps * 1000
+        self._codec.options = {
+            "preset": "veryfast",
+            "tune": "zerolatency",
+            "profile": "baseline",
+            "g": str(max(1, int(round(fps)))),
+            "bf": "0",
+        }
+        self._force_keyframe = False
+
+    def request_keyframe(self):
+        self._force_keyframe = True
+
+    def _encode(self, video_frame) -> Optional["Packet"]:
+        if self._force_keyframe:
+            video_frame.pict_type = PictureType.I
+            self._force_keyframe = False
+        else:
+            video_frame.pict_type = PictureType.NONE
+        data = b"".join(bytes(p) for p in self._codec.encode(video_frame))
+        return Packet(data) if data else None
+
+    async def recv(self):
+        """Receive the next encoded H.264 packet for all peers."""
+        while True:
+            pts, time_base = await self.next_timestamp()
+            video_frame = self._latest_yuv()
+            video_frame.pts = pts
+            video_frame.time_base = time_base
+            packet = await asyncio.get_event_loop().run_in_executor(None, self._encode, video_frame)
+            if packet is not None:
+                packet.pts = pts
+                packet.time_base = time_base
+                return packet
+
+
+class PeerVideoTrack(MediaStreamTrack):
+    """
+    One peer's view of the rendition ladder: a relay proxy of the rendition for
+    its current level, passing on every Nth frame. Level changes requested by the
+    adaptation loop are applied between frames inside ``recv``, so a pending
+    ``recv`` is never left waiting on a proxy that was just stopped. Frames are
+    shared with the other peers of a rendition and never modified here; the
+    renditions' shared clock keeps pts monotonic across switches.
+    """
+    kind = "video"
+
+    def __init__(self, relay, renditions):
+        super().__init__()
+        self._relay = relay
+        self._renditions = renditions
+        self._source = None
+        self._rendition = None
+        self._decimation = 1
+        self._counter = 0
+        self._last_pts: Optional[int] = None
+        self.level = 0
+        self.requested_level = 0
+        self._apply_level()
+
+    def _apply_level(self):
+        rendition, decimation = ADAPTATION_LEVELS[self.requested_level]
+        if rendition != self._rendition:
+            old, self._source = self._source, self._relay.subscribe(self._renditions[rendition], buffered=False)
+            self._renditions[rendition].attach()
+            if old is not None:
+                old.stop()
+                self._renditions[self._rendition].detach()
+            self._rendition = rendition
+        self._decimation = decimation
+        self.level = self.requested_level
+
+    async def recv(self):
+        while True:
+            if self.requested_level != self.level:
+                self._apply_level()
+            frame = await self._source.recv()
+            if self._last_pts is not None and frame.pts <= self._last_pts:
+                continue  # Same tick again right after a rendition switch
+            self._counter += 1
+            if self._counter % self._decimation == 0:
+                self._last_pts = frame.pts
+                return frame
+
+    def stop(self):
+        super().stop()
+        if self._source is not None:
+            self._source.stop()
+            self._renditions[self._rendition].detach()
+            self._source = None
+
+
+class _PeerAdaptation:
+    """Chooses a peer's adaptation level from its RTCP receiver reports."""
+
+    def __init__(self, track: PeerVideoTrack):
+        self.track = track
+        self.best_rtt: Optional[float] = None
+        self.clean_checks = 0
+        self.fraction_lost = 0.0
+        self.rtt: Optional[float] = None
+
+    def update(self, fraction_lost: float, rtt: Optional[float]) -> bool:
+        """Feed one receiver report; returns True if the level changed."""
+        self.fraction_lost, self.rtt = fraction_lost, rtt
+        if rtt is not None:
+            self.best_rtt = rtt if self.best_rtt is None else min(self.best_rtt, rtt)
+        rtt_grew = rtt is not None and rtt > self.best_rtt + RTT_GROWTH_S
+
+        level = self.track.requested_level
+        if fraction_lost > LOSS_DOWNGRADE or rtt_grew:
+            self.clean_checks = 0
+            level = min(level + 1, len(ADAPTATION_LEVELS) - 1)
+        elif fraction_lost < LOSS_UPGRADE:
+            self.clean_checks += 1
+            if self.clean_checks >= UPGRADE_CHECKS:
+                self.clean_checks = 0
+                level = max(level - 1, 0)
+        else:
+            self.clean_checks = 0
+
+        if level == self.track.requested_level:
+            return False
+        self.track.requested_level = level
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        rendition, decimation = ADAPTATION_LEVELS[self.track.level]
+        return {
+            'level': self.track.level,
+            'scale': f"1/{RENDITION_SCALES[rendition]}",
+            'frame_decimation': decimation,
+            'fraction_lost': round(self.fraction_lost, 3),
+            'rtt_ms': round(self.rtt * 1000, 1) if self.rtt is not None else None,
+        }
+
 
 class WebRTCWriter:
     """
     WebRTC output writer with signaling server and data channel for metadata.
+
+    All peers share source tracks through a MediaRelay. By default there is a
+    ladder of renditions (full, 1/2, 1/4 resolution) on one shared clock, each
+    converted once per frame and only while some peer is attached; every peer is moved along
+    ADAPTATION_LEVELS (rendition + frame decimation) from its RTCP receiver
+    reports. With ``encode_once`` the single source track yields H.264 packets,
+    so the encoder runs once per frame instead of once per peer (peers are
+    restricted to H.264 and there is no per-peer adaptation).
     """
 
-    def __init__(self, port: int, width: int, height: int, fps: float):
+    def __init__(self, port: int, width: int, height: int, fps: float, encode_once: bool = False):
         if not WEBRTC_AVAILABLE:
             raise RuntimeError("aiortc/aiohttp not available - install with: pip install aiortc aiohttp")
 
@@ -92,7 +313,20 @@ class WebRTCWriter:
         self.height = height
         self.fps = fps
 
-        self.video_track = FrameVideoTrack(width, height, fps)
+        self.encode_once = encode_once
+        clock_start = time.time()  # One timestamp clock for every rendition
+        if encode_once:
+            self.video_track = EncodedVideoTrack(width, height, fps)
+        else:
+            self.video_track = FrameVideoTrack(width, height, fps, clock_start=clock_start)
+        self.renditions = [self.video_track]
+        if not encode_once:
+            for scale in RENDITION_SCALES[1:]:
+                self.renditions.append(FrameVideoTrack(max(2, width // scale // 2 * 2),
+                                                       max(2, height // scale // 2 * 2), fps,
+                                                       clock_start=clock_start))
+        self._adaptations: Dict[Any, _PeerAdaptation] = {}
+        self._relay = MediaRelay()
         self.pcs: set = set()  # Active peer connections
         self.data_channels: list = []  # Active data channels
         
@@ -160,6 +394,8 @@ class WebRTCWriter:
         return web.json_response({
             "status": "ok",
             "connections": len(self.pcs),
+            "encode_once": self.encode_once,
+            "peers": [a.stats() for a in self._adaptations.values()],
             "data_channels": len(self.data_channels)
         })
 
@@ -212,7 +448,12 @@ class WebRTCWriter:
                 logger.info(f"Connection state: {pc.connectionState}")
                 if pc.connectionState == "failed" or pc.connectionState == "closed":
                     await pc.close()
+                    if pc in self.pcs and self.encode_once:
+                        self.video_track.detach()
                     self.pcs.discard(pc)
+                    adaptation = self._adaptations.pop(pc, None)
+                    if adaptation:
+                        adaptation.track.stop()  # Detaches its rendition
 
             @pc.on("datachannel")
             async def on_datachannel(channel):
@@ -226,8 +467,23 @@ class WebRTCWriter:
                         if channel in self.data_channels:
                             self.data_channels.remove(channel)
 
-            # Add video track
-            pc.addTrack(self.video_track)
+            if self.encode_once:
+                # Every peer gets a relay proxy of the one source track (recv/convert/encode once)
+                sender = pc.addTrack(self._relay.subscribe(self.video_track, buffered=False))
+                self.video_track.attach()
+            else:
+                peer_track = PeerVideoTrack(self._relay, self.renditions)
+                self._adaptations[pc] = _PeerAdaptation(peer_track)
+                sender = pc.addTrack(peer_track)
+                asyncio.ensure_future(self._adapt_peer(pc))
+            if self.encode_once:
+                # Pre-encoded packets can only be sent as H.264
+                capabilities = RTCRtpSender.getCapabilities("video")
+                h264 = [c for c in capabilities.codecs if c.mimeType == "video/H264"]
+                for transceiver in pc.getTransceivers():
+                    if transceiver.sender is sender:
+                        transceiver.setCodecPreferences(h264)
+                self.video_track.request_keyframe()
 
             # Create data channel for metadata (server-initiated)
             data_channel = pc.createDataChannel("metadata", ordered=True)
@@ -262,9 +518,32 @@ class WebRTCWriter:
             logger.error(f"Error handling offer: {e}")
             return web.json_response({"error": str(e)}, status=500)
 
+    async def _adapt_peer(self, pc):
+        """Periodically move a peer along the ladder from its RTCP receiver reports."""
+        while pc in self.pcs and pc in self._adaptations:
+            await asyncio.sleep(ADAPTATION_INTERVAL_S)
+            if pc.connectionState != "connected":
+                continue
+            try:
+                stats = await pc.getStats()
+            except Exception as e:
+                logger.debug(f"getStats failed: {e}")
+                continue
+            for report in stats.values():
+                if getattr(report, "type", None) == "remote-inbound-rtp" and getattr(report, "kind", None) == "video":
+                    adaptation = self._adaptations.get(pc)
+                    # aiortc reports the raw RTCP fraction lost (0-255), not a ratio
+                    fraction_lost = (report.fractionLost or 0) / 256
+                    if adaptation and adaptation.update(fraction_lost, report.roundTripTime):
+                        logger.info(f"WebRTC peer adapted: {adaptation.stats()}")
+                    break
+
     def write_frame(self, frame: np.ndarray):
         """Push a video frame to all connected clients."""
-        self.video_track.push_frame(frame, time.time())
+        now = time.time()
+        # By reference only; a rendition converts it when one of its peers asks for a frame
+        for track in self.renditions:
+            track.push_frame(frame, now)
 
     def send_metadata(self, metadata: Dict[str, Any]):
         """Send metadata to all connected clients via data channel."""
@@ -272,7 +551,7 @@ class WebRTCWriter:
             return
 
         try:
-            json_str = json.dumps(metadata, default=str, separators=(',', ':'))
+            json_str = encode_json_text(metadata)
             
             with self._lock:
                 channels_to_remove = []
@@ -1,18 +1,40 @@
 """
 WebSocket output writer for frame-perfect video + detection synchronization.
 Works over port forwarding and remote connections (unlike WebRTC).
+
+Wire protocol (version 1):
+
+- binary message: 16-byte little-endian header followed by the raw JPEG
+
+      offset  size  field
+      0       1     type         (1 = JPEG frame)
+      1       1     version      (1)
+      2       2     flags        (reserved, 0)
+      4       4     frame_number (uint32, matches metadata "frame_number")
+      8       8     pts          (float64 seconds, NaN when unknown)
+
+- text message: compact JSON ``{"type": "metadata", "data": {...}}``; with
+  ``metadata_delta`` the data is a keyframe/delta message (src/modules/delta.py)
+
+- with ``metadata_format='binary'``, metadata is a binary message instead: the
+  same header with type 2, followed by a binmeta message (src/modules/binmeta.py)
 """
 
 import asyncio
-import json
 import logging
+import math
+import struct
 import threading
 import time
-import base64
+from collections import deque
 from typing import Optional, Dict, Any
-import cv2
 import numpy as np
 
+from .jpeg import JPEGEncoderPool
+from ..modules.delta import DeltaEncoder
+from ..modules.metabus import dumps_json, encode_json, with_fields
+from ..modules.binmeta import encode_binary
+
 logger = logging.getLogger("SRTYOLOUnified.WebSocket")
 
 try:
@@ -23,13 +45,86 @@ except ImportError:
     WEBSOCKET_AVAILABLE = False
     logger.warning("aiohttp not available - WebSocket output disabled")
 
+FRAME_HEADER = struct.Struct('<BBHId')
+MSG_TYPE_FRAME = 1
+MSG_TYPE_METADATA = 2
+PROTOCOL_VERSION = 1
+
+
+class _ClientSender:
+    """
+    Per-client bounded send queues drained by the client's own sender task.
+
+    Frames and metadata are queued separately so a burst of frames never evicts
+    metadata. When a queue is full the oldest entry is dropped and counted.
+    Only touched on the event loop thread.
+    """
+
+    def __init__(self, ws, max_frames: int = 2, max_messages: int = 64):
+        self.ws = ws
+        self.frames: deque = deque(maxlen=max_frames)
+        self.messages: deque = deque(maxlen=max_messages)
+        self.ready = asyncio.Event()
+        self.sent_frames = 0
+        self.sent_messages = 0
+        self.dropped_frames = 0
+        self.dropped_messages = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def push_frame(self, payload: bytes):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped_frames += 1
+        self.frames.append(payload)
+        self.ready.set()
+
+    def push_message(self, payload):
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped_messages += 1
+        self.messages.append(payload)
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while not self.ws.closed:
+                if not self.frames and not self.messages:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                # Metadata first: it is small and belongs to the frame queued after it
+                while self.messages:
+                    message = self.messages.popleft()
+                    if isinstance(message, bytes):
+                        await self.ws.send_bytes(message)
+                    else:
+                        await self.ws.send_str(message)
+                    self.sent_messages += 1
+                if self.frames:
+                    await self.ws.send_bytes(self.frames.popleft())
+                    self.sent_frames += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Error sending to client: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'sent_frames': self.sent_frames,
+            'sent_messages': self.sent_messages,
+            'dropped_frames': self.dropped_frames,
+            'dropped_messages': self.dropped_messages,
+        }
+
 
 class WebSocketWriter:
     """
     WebSocket output writer that sends JPEG frames + metadata for canvas rendering.
+
+    Every client has its own sender task and bounded queues, so a slow viewer
+    only drops its own oldest frames and never delays the others.
     """
 
-    def __init__(self, port: int, width: int, height: int, fps: float, quality: int = 85):
+    def __init__(self, port: int, width: int, height: int, fps: float, quality: int = 85,
+                 metadata_delta: bool = False, metadata_format: str = 'json'):
         if not WEBSOCKET_AVAILABLE:
             raise RuntimeError("aiohttp not available - install with: pip install aiohttp")
 
@@ -39,8 +134,12 @@ class WebSocketWriter:
         self.fps = fps
         self.quality = quality  # JPEG quality (0-100)
 
-        self.clients: set = set()  # Active WebSocket connections
-        self._lock = threading.Lock()
+        self.clients: Dict[Any, _ClientSender] = {}  # Active connections (event loop thread only)
+        self.current_frame_number = 0
+        self._last_pts: Optional[float] = None
+        self.metadata_format = metadata_format
+        self._delta = DeltaEncoder() if metadata_delta and metadata_format == 'json' else None
+        self._encoder = JPEGEncoderPool(width, height, fps, self._on_encoded, quality=quality)
         
         self._loop = None
         self._server_thread = None
@@ -64,6 +163,8 @@ class WebSocketWriter:
         self._app = web.Application()
         self._app.router.add_get("/ws", self._handle_websocket)
         self._app.router.add_get("/", self._handle_index)
+        self._app.router.add_get("/metadata_delta.js", self._handle_decoder_js)
+        self._app.router.add_get("/metadata_binary.js", self._handle_decoder_js)
         self._app.router.add_get("/health", self._handle_health)
         
         # Add CORS middleware
@@ -96,7 +197,10 @@ class WebSocketWriter:
         return web.json_response({
             "status": "ok",
             "clients": len(self.clients),
-            "protocol": "websocket"
+            "protocol": "websocket",
+            "protocol_version": PROTOCOL_VERSION,
+            "per_client": [c.stats() for c in self.clients.values()],
+            "jpeg": self._encoder.stats()
         })
 
     async def _handle_index(self, request):
@@ -124,13 +228,28 @@ class WebSocketWriter:
             logger.error(f"Error serving index: {e}")
             return web.Response(text=str(e), status=500)
 
+    async def _handle_decoder_js(self, request):
+        """Serve the delta/binary metadata decoders used by the player."""
+        import os
+        name = request.path.lstrip('/')
+        for path in [f"tests/{name}", f"../tests/{name}", f"/home/ubuntu/drones/detector/tests/{name}"]:
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    return web.Response(text=f.read(), content_type="application/javascript")
+        return web.Response(text="decoder file not found", status=404)
+
     async def _handle_websocket(self, request):
         """Handle WebSocket connections."""
         ws = web.WebSocketResponse()
         await ws.prepare(request)
         
-        with self._lock:
-            self.clients.add(ws)
+        client = _ClientSender(ws)
+        client.task = asyncio.ensure_future(client.run())
+        self.clients[ws] = client
+        if self._delta:
+            # The new client needs full state before any delta
+            self._delta.force_keyframe()
+        self._encoder.set_subscribers(len(self.clients))
         
         logger.info(f"Client connected. Total clients: {len(self.clients)}")
         
@@ -142,47 +261,55 @@ class WebSocketWriter:
                 elif msg.type == aiohttp.WSMsgType.ERROR:
                     logger.error(f"WebSocket error: {ws.exception()}")
         finally:
-            with self._lock:
-                self.clients.discard(ws)
-            logger.info(f"Client disconnected. Total clients: {len(self.clients)}")
+            self.clients.pop(ws, None)
+            client.task.cancel()
+            self._encoder.set_subscribers(len(self.clients))
+            logger.info(f"Client disconnected ({client.stats()}). Total clients: {len(self.clients)}")
         
         return ws
 
     def write_frame(self, frame: np.ndarray):
-        """Encode and send frame to all connected clients."""
-        if not self.clients:
-            return
-        
-        try:
-            # Resize if needed
-            if frame.shape[0] != self.height or frame.shape[1] != self.width:
-                frame = cv2.resize(frame, (self.width, self.height))
-            
-            # Encode as JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
-            _, buffer = cv2.imencode('.jpg', frame, encode_param)
-            
-            # Convert to base64
-            frame_b64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Send to all clients
-            asyncio.run_coroutine_threadsafe(
-                self._broadcast({"type": "frame", "data": frame_b64}),
-                self._loop
-            )
-        except Exception as e:
-            logger.error(f"Error encoding frame: {e}")
+        """Hand the frame to the JPEG encoder pool (skipped while no client is connected)."""
+        self.current_frame_number += 1
+        self._encoder.submit(frame, self.current_frame_number, self._last_pts)
+
+    def _on_encoded(self, buffer: bytes, frame_number: int, pts: Optional[float]):
+        """Frame the JPEG once and queue it for every client (encoder worker thread)."""
+        header = FRAME_HEADER.pack(MSG_TYPE_FRAME, PROTOCOL_VERSION, 0, frame_number & 0xFFFFFFFF,
+                                   pts if pts is not None else math.nan)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._enqueue_frame, header + buffer)
+
+    def _enqueue_frame(self, payload: bytes):
+        for client in self.clients.values():
+            client.push_frame(payload)
+
+    def _enqueue_message(self, payload):
+        for client in self.clients.values():
+            client.push_message(payload)
 
     def send_metadata(self, metadata: Dict[str, Any]):
         """Send metadata to all connected clients."""
-        if not self.clients:
+        self._last_pts = metadata.get('pts')
+        if not self.clients or self._loop is None:
             return
         
         try:
-            asyncio.run_coroutine_threadsafe(
-                self._broadcast({"type": "metadata", "data": metadata}),
-                self._loop
-            )
+            # Numbered like the frame written right after it, so clients can pair them
+            frame_number = self.current_frame_number + 1
+            if self.metadata_format == 'binary':
+                pts = metadata.get('pts')
+                header = FRAME_HEADER.pack(MSG_TYPE_METADATA, PROTOCOL_VERSION, 0, frame_number & 0xFFFFFFFF,
+                                           pts if pts is not None else math.nan)
+                self._loop.call_soon_threadsafe(self._enqueue_message, header + encode_binary(metadata))
+                return
+            if self._delta:
+                data = dumps_json(self._delta.encode(dict(metadata, frame_number=frame_number)))
+            else:
+                # Reuse the frame's shared encoding, only the frame number is added
+                data = with_fields(encode_json(metadata), {'frame_number': frame_number})
+            payload = (b'{"type":"metadata","data":' + data + b'}').decode('utf-8')
+            self._loop.call_soon_threadsafe(self._enqueue_message, payload)
         except Exception as e:
             logger.error(f"Error sending metadata: {e}")
 
@@ -190,35 +317,14 @@ class WebSocketWriter:
         """Alias for send_metadata to match HLS/WebRTC writer interface."""
         self.send_metadata(metadata)
 
-    async def _broadcast(self, message: dict):
-        """Broadcast message to all connected clients."""
-        if not self.clients:
-            return
-        
-        json_str = json.dumps(message, default=str)
-        
-        with self._lock:
-            dead_clients = set()
-            for ws in self.clients:
-                try:
-                    if not ws.closed:
-                        await ws.send_str(json_str)
-                    else:
-                        dead_clients.add(ws)
-                except Exception as e:
-                    logger.warning(f"Error broadcasting to client: {e}")
-                    dead_clients.add(ws)
-            
-            # Remove dead clients
-            self.clients -= dead_clients
-
     def close(self):
         """Close all connections and stop the server."""
         logger.info("Closing WebSocket writer...")
+        self._encoder.close()
         
         # Close all client connections
         if self._loop and self.clients:
-            for ws in list(self.clients):
+            for ws in list(self.clients.keys()):
                 asyncio.run_coroutine_threadsafe(ws.close(), self._loop)
         
         # Stop the event loop
@@ -0,0 +1,95 @@
+// Reference decoder for the binary metadata schema (src/modules/binmeta.py).
+// decodeBinaryMetadata(buffer, offset) returns the same dict layout as the JSON
+// metadata ({frame, pts, telemetry, detections, detection_count}).
+(function (global) {
+    const MAGIC = 'SYMB';
+    const VERSION = 1;
+    const HEADER_SIZE = 28;
+    const FLAG_TELEMETRY = 0x01;
+    const FLAG_GEO = 0x02;
+    const FLAG_OVERLAP = 0x04;
+    const DET_TRACKED = 0x01;
+    const DET_GEO = 0x02;
+    const RECORD_SIZE = 28;
+    const GEO_RECORD_SIZE = 48;
+    // Same order as TELEMETRY_FIELDS in src/modules/klv.py
+    const TELEMETRY_FIELDS = [
+        'timestamp_us', 'latitude', 'longitude', 'altitude', 'heading', 'pitch', 'roll',
+        'sensor_h_fov', 'sensor_v_fov', 'gimbal_yaw_rel', 'gimbal_pitch_rel', 'gimbal_roll_rel',
+        'gimbal_yaw_abs', 'gimbal_pitch_abs', 'gimbal_roll_abs',
+        'sensor_width_mm', 'sensor_height_mm', 'focal_length_mm',
+    ];
+    const utf8 = new TextDecoder('utf-8');
+
+    function decodeBinaryMetadata(buffer, offset = 0) {
+        const view = new DataView(buffer, offset);
+        const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+        if (magic !== MAGIC) throw new Error('Not a binary metadata message');
+        const version = view.getUint8(4);
+        if (version !== VERSION) throw new Error(`Unsupported binary metadata version ${version}`);
+        const flags = view.getUint8(5);
+        const count = view.getUint16(6, true);
+        const frame = view.getUint32(8, true);
+        const pts = view.getFloat64(12, true);
+        const mask = view.getUint32(20, true);
+        const classTableSize = view.getUint16(24, true);
+
+        let pos = HEADER_SIZE;
+        let telemetry = null;
+        if (flags & FLAG_TELEMETRY) {
+            telemetry = {};
+            TELEMETRY_FIELDS.forEach((name, i) => {
+                if (mask & (1 << i)) telemetry[name] = view.getFloat64(pos + i * 8, true);
+            });
+            pos += TELEMETRY_FIELDS.length * 8;
+        }
+
+        const geo = (flags & FLAG_GEO) !== 0;
+        const recordSize = geo ? GEO_RECORD_SIZE : RECORD_SIZE;
+        const classNames = new Map();
+        let tablePos = pos + count * recordSize;
+        const tableEnd = tablePos + classTableSize;
+        while (tablePos < tableEnd) {
+            const classId = view.getUint16(tablePos, true);
+            const length = view.getUint8(tablePos + 2);
+            const start = offset + tablePos + 3;
+            classNames.set(classId, utf8.decode(new Uint8Array(buffer, start, length)));
+            tablePos += 3 + length;
+        }
+
+        const detections = [];
+        for (let i = 0; i < count; i++, pos += recordSize) {
+            const classId = view.getUint16(pos, true);
+            const detFlags = view.getUint8(pos + 2);
+            const det = {
+                bbox: [view.getFloat32(pos + 12, true), view.getFloat32(pos + 16, true),
+                       view.getFloat32(pos + 20, true), view.getFloat32(pos + 24, true)],
+                class_name: classNames.has(classId) ? classNames.get(classId) : `class_${classId}`,
+                confidence: view.getFloat32(pos + 4, true),
+                class_id: classId,
+            };
+            if (detFlags & DET_TRACKED) det.track_id = view.getInt32(pos + 8, true);
+            if (detFlags & DET_GEO) {
+                det.geo_coordinates = {
+                    latitude: view.getFloat64(pos + 28, true),
+                    longitude: view.getFloat64(pos + 36, true),
+                    estimated_ground_distance_m: view.getFloat32(pos + 44, true),
+                };
+            }
+            detections.push(det);
+        }
+
+        const metadata = {
+            frame: frame,
+            pts: Number.isNaN(pts) ? null : pts,
+            timestamp: Number.isNaN(pts) ? null : new Date(pts * 1000).toISOString(),
+            telemetry: telemetry,
+            detections: detections,
+            detection_count: count,
+        };
+        if (flags & FLAG_OVERLAP) metadata.overlap = true;
+        return metadata;
+    }
+
+    global.decodeBinaryMetadata = decodeBinaryMetadata;
+})(typeof window !== 'undefined' ? window : globalThis);
@@ -0,0 +1,47 @@
+// Reference decoder for the delta-encoded metadata stream (--metadata-delta).
+// Mirrors DeltaDecoder in src/modules/delta.py: keyframes carry the full state,
+// deltas only changed telemetry fields and per-track upserts/removals.
+// Messages that are not delta encoded are passed through unchanged.
+(function (global) {
+    const PROTOCOL_FIELDS = ['type', 'seq', 'tracks', 'untracked', 'upsert', 'removed', 'telemetry_removed', 'telemetry'];
+
+    class MetadataDeltaDecoder {
+        constructor() {
+            this.seq = null;
+            this.telemetry = {};
+            this.tracks = new Map();
+        }
+
+        // Returns full metadata ({frame, telemetry, detections, ...}) or null while waiting for a keyframe
+        apply(msg) {
+            if (msg.type === 'key') {
+                this.telemetry = Object.assign({}, msg.telemetry || {});
+                this.tracks = new Map(Object.entries(msg.tracks || {}));
+            } else if (msg.type === 'delta') {
+                if (this.seq === null || msg.seq !== this.seq + 1) {
+                    this.seq = null;  // Lost messages: resynchronize on the next keyframe
+                    return null;
+                }
+                Object.assign(this.telemetry, msg.telemetry || {});
+                (msg.telemetry_removed || []).forEach(key => delete this.telemetry[key]);
+                Object.entries(msg.upsert || {}).forEach(([tid, det]) => this.tracks.set(tid, det));
+                (msg.removed || []).forEach(tid => this.tracks.delete(String(tid)));
+            } else {
+                return msg;
+            }
+            this.seq = msg.seq;
+
+            const metadata = {};
+            Object.keys(msg).forEach(key => {
+                if (!PROTOCOL_FIELDS.includes(key)) metadata[key] = msg[key];
+            });
+            const detections = Array.from(this.tracks.values()).concat(msg.untracked || []);
+            metadata.telemetry = Object.assign({}, this.telemetry);
+            metadata.detections = detections;
+            metadata.detection_count = detections.length;
+            return metadata;
+        }
+    }
+
+    global.MetadataDeltaDecoder = MetadataDeltaDecoder;
+})(typeof window !== 'undefined' ? window : globalThis);